@@ -0,0 +1,229 @@
+import os
+import re
+import json
+import time
+import heapq
+import random
+import datetime
+import threading
+from collections import Counter
+
+ANALYTICS_TABLE = "hackathon_data"
+ANALYTICS_PAGE_SIZE = int(os.getenv("ANALYTICS_PAGE_SIZE", "1000"))
+# New rows are pulled at most this often; a full rebuild picks up edits to old rows
+ANALYTICS_REFRESH_TTL = float(os.getenv("ANALYTICS_REFRESH_TTL", "30"))
+ANALYTICS_FULL_REBUILD_TTL = float(os.getenv("ANALYTICS_FULL_REBUILD_TTL", "900"))
+ANALYTICS_TOP_N = int(os.getenv("ANALYTICS_TOP_N", "10"))
+ANALYTICS_SAMPLE_SIZE = int(os.getenv("ANALYTICS_SAMPLE_SIZE", "20"))
+
+CREDIT_BUCKETS = ((0, "0"), (5, "1-5"), (20, "6-20"), (100, "21-100"), (500, "101-500"))
+CREDIT_LABELS = [label for _, label in CREDIT_BUCKETS] + ["500+"]
+SAMPLE_FIELDS = ("name", "status", "credits", "created_at")
+_EMAIL = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+
+
+def _credit_bucket(credits: int) -> str:
+    for upper, label in CREDIT_BUCKETS:
+        if credits <= upper:
+            return label
+    return "500+"
+
+
+def _signup_day(created_at) -> str:
+    if not created_at:
+        return "unknown"
+    return str(created_at)[:10]
+
+
+class UserAnalytics:
+    """
+    Incrementally maintained summary of the user table for /admin/analyze.
+
+    Rows are folded into counters as they arrive (by ascending id), so a
+    refresh only reads users created since the last one. Everything kept is
+    O(buckets + top-N + sample), independent of the number of users. The
+    periodic full rebuild runs on a background thread while requests keep
+    using the previous summary.
+    """
+
+    def __init__(self, top_n: int = ANALYTICS_TOP_N, sample_size: int = ANALYTICS_SAMPLE_SIZE):
+        self.top_n = top_n
+        self.sample_size = sample_size
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._rebuild_thread = None
+        self.reset()
+
+    def reset(self):
+        self.total = 0
+        self.last_id = 0
+        self.by_status = Counter()
+        self.credit_buckets = Counter()
+        self.credit_sum = 0
+        self.credit_min = None
+        self.credit_max = None
+        self.signups_by_day = Counter()
+        self._top_credits = []  # min-heap of (credits, id, row)
+        self._sample = []  # reservoir sample of rows
+        self.refreshed_at = 0.0
+        self.rebuilt_at = 0.0
+
+    def ingest(self, rows: list):
+        with self._lock:
+            for row in rows:
+                self._add(row)
+
+    def _add(self, row: dict):
+        self.total += 1
+        row_id = row.get("id") or 0
+        self.last_id = max(self.last_id, row_id)
+        self.by_status[row.get("status") or "unknown"] += 1
+
+        credits = row.get("credits") or 0
+        self.credit_buckets[_credit_bucket(credits)] += 1
+        self.credit_sum += credits
+        self.credit_min = credits if self.credit_min is None else min(self.credit_min, credits)
+        self.credit_max = credits if self.credit_max is None else max(self.credit_max, credits)
+        self.signups_by_day[_signup_day(row.get("created_at"))] += 1
+
+        compact = {k: row.get(k) for k in SAMPLE_FIELDS}
+        entry = (credits, row_id, compact)
+        if len(self._top_credits) < self.top_n:
+            heapq.heappush(self._top_credits, entry)
+        elif entry[:2] > self._top_credits[0][:2]:
+            heapq.heapreplace(self._top_credits, entry)
+
+        # Reservoir sampling keeps a uniform sample of every row seen so far
+        if len(self._sample) < self.sample_size:
+            self._sample.append(compact)
+        else:
+            slot = random.randrange(self.total)
+            if slot < self.sample_size:
+                self._sample[slot] = compact
+
+    # ---------- loading ----------
+
+    def _fetch_since(self, supabase, last_id: int):
+        while True:
+            response = (
+                supabase.table(ANALYTICS_TABLE)
+                .select("id, name, status, credits, created_at")
+                .gt("id", last_id)
+                .order("id")
+                .limit(ANALYTICS_PAGE_SIZE)
+                .execute()
+            )
+            rows = response.data or []
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1]["id"]
+            if len(rows) < ANALYTICS_PAGE_SIZE:
+                return
+
+    def start_rebuild(self, supabase) -> threading.Thread:
+        """Starts a full rebuild in the background, unless one is already running."""
+        with self._rebuild_lock:
+            if self._rebuild_thread is None:
+                self._rebuild_thread = threading.Thread(target=self._rebuild, args=(supabase,),
+                                                        name="analytics-rebuild", daemon=True)
+                self._rebuild_thread.start()
+            return self._rebuild_thread
+
+    def _rebuild(self, supabase):
+        try:
+            started = time.time()
+            # Build aside and swap in, so readers never see a half-built summary
+            fresh = UserAnalytics(self.top_n, self.sample_size)
+            for page in fresh._fetch_since(supabase, 0):
+                fresh.ingest(page)
+            # Not during an incremental refresh, which would then re-add rows fresh already has
+            with self._refresh_lock, self._lock:
+                self.__dict__.update({k: v for k, v in fresh.__dict__.items()
+                                      if not k.endswith("lock") and k != "_rebuild_thread"})
+                self.rebuilt_at = self.refreshed_at = started
+        except Exception as e:
+            print(f"[ANALYTICS] Full rebuild failed: {e}")
+        finally:
+            with self._rebuild_lock:
+                self._rebuild_thread = None
+
+    def refresh(self, supabase, force: bool = False):
+        """Pulls new rows if the cached summary is stale; rebuilds from scratch periodically, in the background."""
+        now = time.time()
+        if now - self.rebuilt_at > ANALYTICS_FULL_REBUILD_TTL:
+            rebuild = self.start_rebuild(supabase)
+            if not self.rebuilt_at:
+                # Nothing to serve yet
+                rebuild.join()
+                return
+        with self._refresh_lock:
+            if force or now - self.refreshed_at > ANALYTICS_REFRESH_TTL:
+                for page in self._fetch_since(supabase, self.last_id):
+                    self.ingest(page)
+                self.refreshed_at = now
+
+    # ---------- summarising ----------
+
+    def summary(self) -> dict:
+        with self._lock:
+            days = sorted(d for d in self.signups_by_day if d != "unknown")
+            weekly = Counter()
+            for day in days:
+                try:
+                    year, week, _ = datetime.date.fromisoformat(day).isocalendar()
+                    weekly[f"{year}-W{week:02d}"] += self.signups_by_day[day]
+                except ValueError:
+                    continue
+            return {
+                "total_users": self.total,
+                "users_by_status": dict(self.by_status.most_common()),
+                "credits": {
+                    "total": self.credit_sum,
+                    "mean": round(self.credit_sum / self.total, 2) if self.total else 0,
+                    "min": self.credit_min,
+                    "max": self.credit_max,
+                    "distribution": {label: self.credit_buckets.get(label, 0) for label in CREDIT_LABELS},
+                },
+                "signups_last_14_days": {d: self.signups_by_day[d] for d in days[-14:]},
+                "signups_by_week_last_12": dict(sorted(weekly.items())[-12:]),
+                "top_users_by_credits": [row for _, _, row in sorted(self._top_credits, reverse=True)],
+            }
+
+    def relevant_rows(self, query: str) -> list:
+        """Sampled rows, narrowed to statuses the question mentions."""
+        with self._lock:
+            sample = list(self._sample)
+            statuses = [s for s in self.by_status if s and s.lower() in query.lower()]
+        if statuses:
+            sample = [r for r in sample if r.get("status") in statuses] or sample
+        return sample
+
+    def build_prompt(self, query: str, matched_rows: list = None) -> str:
+        context = {"summary": self.summary(), "sample_rows": self.relevant_rows(query)}
+        if matched_rows:
+            context["rows_mentioned_in_question"] = matched_rows
+        context_str = json.dumps(context, separators=(",", ":"), default=str)
+        return (
+            "You are a Data Analyst AI. Here is a pre-aggregated summary of the user database "
+            f"(counts, distributions, top users and a random sample of rows):\n\n{context_str}\n\n"
+            f"Answer the CEO's question accurately based ONLY on this data: '{query}'"
+        )
+
+
+def lookup_mentioned_users(supabase, query: str) -> list:
+    """Exact rows for any email addresses the question names."""
+    emails = _EMAIL.findall(query)[:5]
+    if not emails:
+        return []
+    response = supabase.table(ANALYTICS_TABLE).select("name, email, status, credits, created_at").in_("email", emails).execute()
+    return response.data or []
+
+
+# Global analytics instance
+_analytics = UserAnalytics()
+
+
+def get_user_analytics() -> UserAnalytics:
+    return _analytics
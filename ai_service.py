@@ -1,29 +1,145 @@
-import requests
 import json
 
-OLLAMA_API_URL = "http://127.0.0.1:11434/api/chat"
+from ollama_client import OllamaError, OllamaTimeout, OllamaUnavailable
+from ollama_router import get_ollama_router
+from llm_cache import get_llm_cache, make_cache_key
+from llm_scheduler import get_scheduler, run_on_celery, LLMOverloaded, INTERACTIVE, BACKGROUND, LLM_SCHEDULER_MODE
+from singleflight import SingleFlight
 
-def generate_response(messages: list, model: str = "phi3") -> str:
+# Identical cacheable prompts in flight at the same time share one generation
+_inflight = SingleFlight()
+
+
+def _extract_content(data: dict) -> str:
+    # structure: {"message": {"role": "assistant", "content": "..."}}
+    return data.get("message", {}).get("content", "No response from AI.")
+
+
+def error_message(e: Exception) -> str:
+    if isinstance(e, LLMOverloaded):
+        return f"Error: AI service is busy, please retry in {e.retry_after}s."
+    if isinstance(e, OllamaUnavailable):
+        return "Error: Ollama is not running. Please run 'ollama serve'."
+    if isinstance(e, OllamaTimeout):
+        return "Error: AI generation timed out."
+    return f"Error: {str(e)}"
+
+
+def _call_ollama(messages, model, options, priority, format=None) -> str:
+    if priority == BACKGROUND and LLM_SCHEDULER_MODE == "celery":
+        return _extract_content(run_on_celery(messages, model, options, format=format))
+    with get_scheduler().slot(priority):
+        return _extract_content(get_ollama_router().chat(messages, model=model, options=options, format=format))
+
+
+async def _acall_ollama(messages, model, options, priority, format=None) -> str:
+    async with get_scheduler().aslot(priority):
+        return _extract_content(await get_ollama_router().achat(messages, model=model, options=options, format=format))
+
+
+def chat_completion(messages: list, model: str = "phi3", options: dict = None, use_cache: bool = True, priority: str = INTERACTIVE, format: str = None) -> str:
+    """
+    Sends a chat history to the least-loaded healthy Ollama backend.
+    Raises OllamaError on failure so callers can tell errors from content.
+    Cacheable calls are also coalesced with identical in-flight requests.
+    Pass use_cache=False for endpoints whose output should not repeat,
+    priority=BACKGROUND for work nobody is waiting on, and format="json"
+    to have Ollama constrain the output to valid JSON.
+    """
+    cache = get_llm_cache()
+    if not use_cache:
+        cache.record_bypass()
+        return _call_ollama(messages, model, options, priority, format)
+
+    key = make_cache_key(model, messages, options, format)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    return _inflight.do(key, _generate_and_cache, key, messages, model, options, priority, format)
+
+
+def _generate_and_cache(key, messages, model, options, priority, format=None):
+    content = _call_ollama(messages, model, options, priority, format)
+    get_llm_cache().set(key, content)
+    return content
+
+
+async def achat_completion(messages: list, model: str = "phi3", options: dict = None, use_cache: bool = True, priority: str = INTERACTIVE, format: str = None) -> str:
+    """Async variant of chat_completion that does not block the event loop."""
+    cache = get_llm_cache()
+    if not use_cache:
+        cache.record_bypass()
+        return await _acall_ollama(messages, model, options, priority, format)
+
+    key = make_cache_key(model, messages, options, format)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    return await _inflight.ado(key, _agenerate_and_cache, key, messages, model, options, priority, format)
+
+
+async def _agenerate_and_cache(key, messages, model, options, priority, format=None):
+    content = await _acall_ollama(messages, model, options, priority, format)
+    get_llm_cache().set(key, content)
+    return content
+
+
+def chat_json(messages: list, model: str = "phi3", options: dict = None, use_cache: bool = True, priority: str = INTERACTIVE) -> dict:
+    """
+    Structured-output call (Ollama `format: json`): returns the parsed object.
+    Raises OllamaError on transport failures and ValueError if the model
+    still produced something that is not a JSON object.
+    """
+    content = chat_completion(messages, model, options, use_cache=use_cache, priority=priority, format="json")
+    parsed = json.loads(content)
+    if not isinstance(parsed, dict):
+        raise ValueError(f"expected a JSON object, got {type(parsed).__name__}")
+    return parsed
+
+
+def generate_response(messages: list, model: str = "phi3", use_cache: bool = True, priority: str = INTERACTIVE) -> str:
     """
     Sends a chat history to the local Ollama instance and returns the response.
+    Errors come back as an "Error: ..." string and are never cached.
     """
     try:
-        payload = {
-            "model": model,
-            "messages": messages,
-            "stream": False
-        }
-        
-        response = requests.post(OLLAMA_API_URL, json=payload, timeout=60)
-        response.raise_for_status()
-        
-        data = response.json()
-        # structure: {"message": {"role": "assistant", "content": "..."}}
-        return data.get("message", {}).get("content", "No response from AI.")
-    
-    except requests.exceptions.ConnectionError:
-        return "Error: Ollama is not running. Please run 'ollama serve'."
-    except requests.exceptions.ReadTimeout:
-        return "Error: AI generation timed out."
+        return chat_completion(messages, model, use_cache=use_cache, priority=priority)
+    except OllamaError as e:
+        return error_message(e)
     except Exception as e:
         return f"Error: {str(e)}"
+
+
+async def agenerate_response(messages: list, model: str = "phi3", use_cache: bool = True, priority: str = INTERACTIVE) -> str:
+    """
+    Async version of generate_response for `async def` endpoints.
+    """
+    try:
+        return await achat_completion(messages, model, use_cache=use_cache, priority=priority)
+    except OllamaError as e:
+        return error_message(e)
+    except Exception as e:
+        return f"Error: {str(e)}"
+
+
+async def astream_response(messages: list, model: str = "phi3", options: dict = None, priority: str = INTERACTIVE):
+    """
+    Yields content tokens as Ollama generates them. Streams are never cached
+    and hold a scheduler slot until the stream ends.
+    Raises OllamaError on failure.
+    """
+    async with get_scheduler().aslot(priority):
+        async for chunk in get_ollama_router().astream_chat(messages, model=model, options=options):
+            token = chunk.get("message", {}).get("content", "")
+            if token:
+                yield token
+
+
+def get_metrics() -> dict:
+    """Per-backend latency / queue-time metrics plus cache, coalescing and scheduler counters."""
+    return {
+        "ollama": get_ollama_router().snapshot(),
+        "cache": get_llm_cache().stats(),
+        "coalescing": _inflight.stats(),
+        "scheduler": get_scheduler().stats(),
+    }
@@ -0,0 +1,105 @@
+"""
+Prompt size and latency of /admin/analyze: raw-table dump vs. aggregate-first.
+
+For each user count it generates synthetic `hackathon_data` rows and measures
+  * the old path: json.dumps of every row into the prompt
+  * the new path: initial ingest, a 1% incremental refresh, and prompt build
+Token counts are estimated at ~4 characters per token. Pass --ollama-url to
+also time real generations (the raw prompt is only sent while it fits in
+--context-tokens).
+
+    python benchmarks/bench_admin_analyze.py --sizes 1000 100000 1000000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from admin_analytics import UserAnalytics
+
+QUERY = "How many paying users do we have and how are credits distributed?"
+STATUSES = ("Active", "Free", "Free", "Free", "Cancelled")
+
+
+def make_rows(start_id: int, count: int):
+    base = datetime.datetime(2025, 1, 1)
+    rows = []
+    for i in range(start_id, start_id + count):
+        status = random.choice(STATUSES)
+        rows.append({
+            "id": i,
+            "name": f"User {i}",
+            "email": f"user{i}@example.com",
+            "status": status,
+            "phone": f"+9198{i:08d}"[:13],
+            "payment_id": f"pay_{i:010d}" if status == "Active" else None,
+            "credits": random.randint(0, 100) if status == "Active" else random.randint(0, 5),
+            "created_at": (base + datetime.timedelta(minutes=i % 525600)).isoformat(),
+        })
+    return rows
+
+
+def old_prompt(rows, query):
+    return f"You are a Data Analyst AI. Look at this raw user database JSON:\n\n{json.dumps(rows)}\n\nAnswer the CEO's question accurately based ONLY on this data: '{query}'"
+
+
+def time_llm(url, prompt):
+    import requests
+    started = time.perf_counter()
+    response = requests.post(f"{url}/api/chat", json={
+        "model": "phi3", "stream": False,
+        "messages": [{"role": "user", "content": prompt}],
+    }, timeout=600)
+    response.raise_for_status()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--ollama-url", default=None)
+    parser.add_argument("--context-tokens", type=int, default=4096)
+    args = parser.parse_args()
+    random.seed(7)
+
+    header = f"{'users':>9} | {'raw prompt':>14} {'~tokens':>11} {'build s':>8} | {'summary prompt':>14} {'~tokens':>8} {'ingest s':>9} {'+1% s':>7} {'build ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for size in args.sizes:
+        rows = make_rows(1, size)
+
+        started = time.perf_counter()
+        raw = old_prompt(rows, QUERY)
+        raw_build = time.perf_counter() - started
+
+        analytics = UserAnalytics()
+        started = time.perf_counter()
+        analytics.ingest(rows)
+        ingest = time.perf_counter() - started
+
+        delta = make_rows(size + 1, max(1, size // 100))
+        started = time.perf_counter()
+        analytics.ingest(delta)
+        incremental = time.perf_counter() - started
+
+        started = time.perf_counter()
+        summary = analytics.build_prompt(QUERY)
+        summary_build = (time.perf_counter() - started) * 1000
+
+        print(f"{size:>9} | {len(raw):>14,} {len(raw) // 4:>11,} {raw_build:>8.2f} | "
+              f"{len(summary):>14,} {len(summary) // 4:>8,} {ingest:>9.2f} {incremental:>7.3f} {summary_build:>9.2f}")
+
+        if args.ollama_url:
+            fits = len(raw) // 4 <= args.context_tokens
+            raw_llm = f"{time_llm(args.ollama_url, raw):.2f}s" if fits else "exceeds context"
+            print(f"{'':>9}   LLM latency raw: {raw_llm:<16} summary: {time_llm(args.ollama_url, summary):.2f}s")
+        del rows, raw
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Catalog endpoint: full-table ORM listing vs keyset pages.
+
+Seeds --products products over --vendors vendors in a throwaway SQLite file
+and times, through FastAPI's TestClient:
+  * legacy:  every active product as ORM objects + Pydantic models (the old handler)
+  * page:    first page, cold (page cache cleared before each request)
+  * deep:    a page --depth pages in, reached by its cursor, cold
+  * cached:  the same page again within one catalog version
+  * 304:     revalidation with If-None-Match
+and checks that walking every page returns each product exactly once.
+
+    python benchmarks/bench_catalog.py --products 50000 --vendors 200 --limit 100
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+# One process, so the per-process ETag window only needs to outlast the run
+os.environ.setdefault("CATALOG_PAGE_CACHE_TTL", "3600")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+
+from config_db import engine, SessionLocal, init_db
+from models import Product
+import catalog_cache
+import p1_marketplace
+
+URL = "/api/p1/marketplace/products"
+
+
+def legacy_products():
+    with SessionLocal() as db:
+        products = db.query(Product).filter(Product.is_active == True).all()
+        return [p1_marketplace.ProductResponse.model_validate(p, from_attributes=True).model_dump() for p in products]
+
+
+def timed(fn, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=50000)
+    parser.add_argument("--vendors", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--depth", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    init_db()
+    rng = random.Random(3)
+    with SessionLocal() as db:
+        db.execute(insert(Product), [
+            {"vendor_id": 1 + i % args.vendors, "name": f"Product {i}", "slug": f"product-{i}",
+             "description": "Handloom cotton kurta, machine washable. " * 4, "price": round(rng.uniform(99, 4999), 2),
+             "stock_qty": rng.randint(0, 500), "images": f"https://img.example/{i}.jpg", "is_active": i % 10 != 0}
+            for i in range(args.products)
+        ])
+        db.commit()
+
+    app = FastAPI()
+    app.include_router(p1_marketplace.router)
+    client = TestClient(app)
+
+    def cold(params):
+        catalog_cache.page_cache = p1_marketplace.page_cache = catalog_cache.MemoryBackend(ttl=0)
+        return client.get(URL, params=params)
+
+    params = {"limit": args.limit}
+    cursor = None
+    for _ in range(args.depth):
+        cursor = client.get(URL, params={**params, **({"cursor": cursor} if cursor else {})}).headers["x-next-cursor"]
+    deep = {**params, "cursor": cursor}
+    first = client.get(URL, params=params)
+
+    rows = [
+        ("legacy", *timed(legacy_products, max(1, args.repeat // 10))),
+        ("page", *timed(lambda: cold(params), args.repeat)),
+        ("deep", *timed(lambda: cold(deep), args.repeat)),
+        ("cached", *timed(lambda: client.get(URL, params=params), args.repeat)),
+        ("304", *timed(lambda: client.get(URL, params=params, headers={"If-None-Match": first.headers["etag"]}), args.repeat)),
+    ]
+    print(f"{args.products} products, {args.vendors} vendors, pages of {args.limit} ({engine.url.get_backend_name()})\n")
+    print(f"{'path':<8} {'ms':>9} {'products':>9}")
+    for name, ms, result in rows:
+        count = len(result) if isinstance(result, list) else (len(result.json()) if result.status_code == 200 else 0)
+        status = "" if isinstance(result, list) else f"  HTTP {result.status_code}"
+        print(f"{name:<8} {ms:>9.2f} {count:>9}{status}")
+
+    for sort, filters in (("id", {}), ("-price", {"vendor_id": 7}), ("price", {"min_price": 500, "max_price": 1500})):
+        seen, cursor, pages = [], None, 0
+        while True:
+            page = client.get(URL, params={"sort": sort, "limit": args.limit, **filters, **({"cursor": cursor} if cursor else {})})
+            seen.extend(p["id"] for p in page.json())
+            pages += 1
+            cursor = page.headers.get("x-next-cursor")
+            if not cursor:
+                break
+        with SessionLocal() as db:
+            q = db.query(Product.id).filter(Product.is_active == True)
+            if "vendor_id" in filters:
+                q = q.filter(Product.vendor_id == filters["vendor_id"])
+            if "min_price" in filters:
+                q = q.filter(Product.price >= filters["min_price"], Product.price <= filters["max_price"])
+            expected = q.count()
+        print(f"walk sort={sort} {filters}: {len(seen)} products in {pages} pages, expected {expected}")
+        assert len(seen) == len(set(seen)) == expected
+
+    p1_marketplace.bump_catalog_version()
+    revalidated = client.get(URL, params=params, headers={"If-None-Match": first.headers["etag"]})
+    assert revalidated.status_code == 200, "ETag survived a catalog version bump"
+
+
+if __name__ == "__main__":
+    main()
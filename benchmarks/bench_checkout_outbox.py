@@ -0,0 +1,148 @@
+"""
+Checkout latency and event delivery with the transactional outbox.
+
+Runs /checkout against a throwaway SQLite database while the event bus is
+replaced by one that takes --bus-latency seconds per event and fails
+--fail-rate of them. Reports checkout latency for
+  * inline: commit, then publish on the request thread (the old path)
+  * outbox: commit order + outbox row, relay publishes in the background
+and verifies every order produced exactly one distinct event_id.
+
+    python benchmarks/bench_checkout_outbox.py --orders 300 --bus-latency 0.02 --fail-rate 0.1
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+
+import kafka_producer
+from config_db import engine, SessionLocal as Session
+from models import Base, Product, OutboxEvent
+from outbox_relay import OutboxRelay
+import outbox_relay
+import p1_marketplace
+
+
+class FlakyBus:
+    """Event bus double: slow and occasionally failing, records what it delivered."""
+
+    def __init__(self, latency, fail_rate):
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.delivered = []
+        self.failures = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(7)
+
+    def publish(self, topic, event, delivery=None):
+        time.sleep(self.latency)
+        with self._lock:
+            if self._rng.random() < self.fail_rate:
+                self.failures += 1
+                raise ConnectionError("broker unavailable")
+            self.delivered.append(event)
+
+    def publish_batch(self, events, delivery=None, timeout=None):
+        # One round-trip for the whole batch, like a linger-batched producer
+        time.sleep(self.latency)
+        results = []
+        for topic, event in events:
+            with self._lock:
+                if self._rng.random() < self.fail_rate:
+                    self.failures += 1
+                    results.append(ConnectionError("broker unavailable"))
+                else:
+                    self.delivered.append(event)
+                    results.append(None)
+        return results
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run_checkouts(n_orders, after_commit=None):
+    latencies = []
+    for i in range(n_orders):
+        request = p1_marketplace.CheckoutRequest(
+            customer_id=1, items=[{"product_id": 1 + i % 10, "quantity": 1}],
+            payment_method="upi", shipping_address="Pune",
+        )
+        db = Session()
+        started = time.perf_counter()
+        try:
+            result = p1_marketplace.checkout(request, db)
+            if after_commit:
+                after_commit(result)
+        except ConnectionError:
+            pass  # old path: order committed, event lost
+        finally:
+            latencies.append((time.perf_counter() - started) * 1000)
+            db.close()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=300)
+    parser.add_argument("--bus-latency", type=float, default=0.02)
+    parser.add_argument("--fail-rate", type=float, default=0.1)
+    args = parser.parse_args()
+
+    Base.metadata.create_all(engine)
+    with Session() as db:
+        db.add_all([Product(id=i, vendor_id=1, name=f"P{i}", price=99.0, stock_qty=10 ** 6) for i in range(1, 11)])
+        db.commit()
+
+    # Inline publishing, as checkout did before the outbox
+    bus = FlakyBus(args.bus_latency, args.fail_rate)
+    kafka_producer.producer = bus
+    relay = OutboxRelay(session_factory=Session, interval=0.05)
+    outbox_relay._relay = relay
+
+    def publish_inline(result):
+        bus.publish("marketplace.orders", {"event_type": "checkout_completed", "order_id": result["order_id"]})
+
+    inline = run_checkouts(args.orders, publish_inline)
+    inline_lost = args.orders - len(bus.delivered)
+    with Session() as db:
+        # Rows staged by the inline phase were already "published" above
+        db.query(OutboxEvent).delete()
+        db.commit()
+
+    bus = FlakyBus(args.bus_latency, args.fail_rate)
+    kafka_producer.producer = bus
+    relay.start()
+    started = time.perf_counter()
+    outbox = run_checkouts(args.orders)
+    while True:
+        with Session() as db:
+            pending = db.query(OutboxEvent).filter(OutboxEvent.published_at.is_(None)).count()
+        if not pending:
+            break
+        time.sleep(0.05)
+    drained = time.perf_counter() - started
+    relay.stop()
+
+    ids = [e["event_id"] for e in bus.delivered]
+    print(f"bus: {args.bus_latency * 1000:.0f}ms per round-trip, {args.fail_rate:.0%} failures\n")
+    print(f"{'path':<8} {'p50 ms':>8} {'p99 ms':>8} {'orders/s':>9} {'events lost':>12}")
+    print(f"{'inline':<8} {percentile(inline, 50):>8.2f} {percentile(inline, 99):>8.2f} "
+          f"{1000 * len(inline) / sum(inline):>9.0f} {inline_lost:>12}")
+    print(f"{'outbox':<8} {percentile(outbox, 50):>8.2f} {percentile(outbox, 99):>8.2f} "
+          f"{1000 * len(outbox) / sum(outbox):>9.0f} {args.orders - len(set(ids)):>12}")
+    print(f"\noutbox: {len(set(ids))} distinct events for {args.orders} orders, {len(ids) - len(set(ids))} duplicates, "
+          f"{bus.failures} failed sends retried, all drained {drained:.2f}s after the first order")
+    print(relay.metrics())
+    assert len(set(ids)) == args.orders
+
+
+if __name__ == "__main__":
+    main()
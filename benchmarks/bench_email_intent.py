@@ -0,0 +1,76 @@
+"""
+Latency and LLM-call savings of the /email-webhook intent router.
+
+Runs every email in benchmarks/fixtures/emails_labeled.jsonl through
+classify_email() and reports how many were settled by the keyword/date rules,
+their accuracy against the expected intent, and per-path latency. Without
+--ollama-url the ambiguous ones go to a local fake Ollama answering in JSON
+after --latency seconds.
+
+    python benchmarks/bench_email_intent.py --rounds 20
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "emails_labeled.jsonl")
+
+
+def json_responder(payload: dict) -> str:
+    prompt = payload["messages"][-1]["content"].lower()
+    if any(word in prompt for word in ("meet", "call", "availab")):
+        return json.dumps({"intent": "schedule", "date": "soon", "time": "TBD"})
+    return json.dumps({"intent": "support"})
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--ollama-url", default=None)
+    args = parser.parse_args()
+
+    fake = None
+    if not args.ollama_url:
+        from fake_ollama import start_fake_ollama
+        fake = start_fake_ollama(latency=args.latency, responder=json_responder)
+        args.ollama_url = fake.url
+    os.environ["OLLAMA_URLS"] = args.ollama_url
+    os.environ["LLM_CACHE_BACKEND"] = "memory"
+
+    from email_intent import rule_classify, classify_email, get_intent_stats
+
+    with open(FIXTURE) as f:
+        emails = [json.loads(line) for line in f if line.strip()]
+
+    confident = correct = 0
+    for email in emails:
+        result = rule_classify(email["subject"], email["body"])
+        if result["confident"]:
+            confident += 1
+            correct += result["intent"] == email["intent"]
+    print(f"Rules settle {confident}/{len(emails)} emails, {correct}/{confident} of them correctly")
+
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        for email in emails:
+            classify_email("bench@example.com", email["subject"], email["body"])
+    elapsed = time.perf_counter() - started
+    total = args.rounds * len(emails)
+    print(f"{total} emails classified in {elapsed:.2f}s ({total / elapsed:.1f}/s; old path: 1 LLM call each)\n")
+
+    stats = get_intent_stats()
+    print(f"LLM calls avoided: {stats['llm_calls_avoided']} ({stats['llm_avoided_rate']:.0%})")
+    print(f"{'path':<13} {'count':>6} {'avg ms':>9} {'max ms':>9}")
+    for path, s in stats["paths"].items():
+        print(f"{path:<13} {s['count']:>6} {s['avg_ms']:>9.2f} {s['max_ms']:>9.2f}")
+    if fake:
+        print(f"\nfake Ollama served {fake.requests} requests (repeats are answered from the LLM cache)")
+
+
+if __name__ == "__main__":
+    main()
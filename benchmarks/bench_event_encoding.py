@@ -0,0 +1,77 @@
+"""
+Bytes per event and encode/decode throughput: JSON vs. the binary schema encoding.
+
+Builds realistic instances of each registered event type (as the routers
+publish them) and times, per type,
+  * json.dumps(...).encode() / json.loads(...)   - the current producer path
+  * encode_event(..., binary=True) / decode_event(...)
+
+    python benchmarks/bench_event_encoding.py --events 100000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_schemas import encode_event, decode_event, registry
+
+
+def ts(rng):
+    return (datetime.datetime(2025, 1, 1) + datetime.timedelta(seconds=rng.randrange(31536000), microseconds=rng.randrange(10 ** 6))).isoformat()
+
+
+def samples(rng):
+    txn = {"user_id": rng.randrange(10 ** 6), "amount": round(rng.uniform(1, 5000), 2), "merchant": rng.choice(["Amazon", "Swiggy", "Zomato", "Flipkart"]), "location": rng.choice(["Mumbai", "Delhi", "Pune"])}
+    return {
+        "checkout_completed": ("marketplace.orders", {"event_type": "checkout_completed", "order_id": rng.randrange(10 ** 7), "amount": round(rng.uniform(10, 9999), 2), "timestamp": ts(rng)}),
+        # As the outbox relay publishes it, with its dedup key
+        "checkout_completed v2": ("marketplace.orders", {"event_type": "checkout_completed", "order_id": rng.randrange(10 ** 7), "amount": round(rng.uniform(10, 9999), 2), "timestamp": ts(rng), "event_id": f"checkout_completed:{rng.randrange(10 ** 7)}"}),
+        "bank_sync_transaction": ("finance.transactions", {"event_type": "bank_sync_transaction", "data": {"user_id": txn["user_id"], "plaid_token": "access-sandbox-8f2c1e", "amount": txn["amount"], "description": "Tech subscription renewal"}, "category": "Software Subscriptions", "timestamp": ts(rng)}),
+        "transaction_processed": ("finance.transactions", {"event_type": "transaction_processed", "data": txn, "risk_score": rng.random(), "timestamp": ts(rng)}),
+        "fraud_alert": ("fraud.alerts", {"severity": "CRITICAL", "reason": "XGBoost High Anomaly Score", "details": txn}),
+        "user.behavior": ("user.behavior", {"event": rng.choice(["click", "view", "purchase"]), "user_id": rng.randrange(10 ** 6), "product_id": rng.randrange(10 ** 5), "timestamp": ts(rng)}),
+    }
+
+
+def bench(events, encode, decode):
+    started = time.perf_counter()
+    encoded = [encode(topic, event) for topic, event in events]
+    encode_s = time.perf_counter() - started
+    started = time.perf_counter()
+    for raw in encoded:
+        decode(raw)
+    decode_s = time.perf_counter() - started
+    return sum(len(r) for r in encoded) / len(encoded), len(events) / encode_s, len(events) / decode_s
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=100000)
+    args = parser.parse_args()
+    rng = random.Random(7)
+    per_type = {}
+    for _ in range(args.events):
+        for name, pair in samples(rng).items():
+            per_type.setdefault(name, []).append(pair)
+
+    json_path = (lambda topic, e: json.dumps(e).encode("utf-8"), json.loads)
+    binary_path = (lambda topic, e: encode_event(topic, e, binary=True), decode_event)
+
+    print(f"{'event type':<22} | {'JSON B':>7} {'enc/s':>10} {'dec/s':>10} | {'binary B':>8} {'enc/s':>10} {'dec/s':>10} | {'size':>5}")
+    for name, events in per_type.items():
+        for topic, event in events[:100]:
+            assert decode_event(encode_event(topic, event, binary=True)) == event
+        j = bench(events, *json_path)
+        b = bench(events, *binary_path)
+        print(f"{name:<22} | {j[0]:>7.1f} {j[1]:>10,.0f} {j[2]:>10,.0f} | {b[0]:>8.1f} {b[1]:>10,.0f} {b[2]:>10,.0f} | {b[0] / j[0]:>5.0%}")
+    # Every sample must go out binary; a JSON fallback would make its row meaningless
+    assert registry.counts["fallback"] == 0, registry.counts
+
+
+if __name__ == "__main__":
+    main()
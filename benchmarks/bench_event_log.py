@@ -0,0 +1,91 @@
+"""
+Append and replay throughput of the local event log (EVENT_BUS_BACKEND=local).
+
+Generates a deterministic stream of /p5/track-style events, then measures
+  * publish_event-style single appends
+  * batched appends
+  * a cold replay through a consumer group after reopening the log (mmap reads)
+Everything is written to a temp directory unless --dir is given.
+
+    python benchmarks/bench_event_log.py --events 1000000 --segment-mb 16
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from local_event_log import EventLog, EventLogConsumer
+
+
+def make_events(n, seed=7):
+    rng = random.Random(seed)
+    base = 1735689600
+    return [
+        json.dumps({"event": rng.choice(("click", "view", "purchase")), "user_id": rng.randrange(50000),
+                    "product_id": rng.randrange(5000), "timestamp": base + i // 100}).encode("utf-8")
+        for i in range(n)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=500000)
+    parser.add_argument("--single", type=int, default=100000, help="events appended one at a time")
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--segment-mb", type=int, default=16)
+    parser.add_argument("--dir", default=None)
+    args = parser.parse_args()
+
+    root = args.dir or tempfile.mkdtemp(prefix="event_log_")
+    events = make_events(args.events)
+    total_bytes = sum(len(e) for e in events)
+    log = EventLog(root, segment_bytes=args.segment_mb * 1024 * 1024)
+
+    started = time.perf_counter()
+    for value in events[:args.single]:
+        log.append("bench.single", value)
+    elapsed = time.perf_counter() - started
+    print(f"single appends   {args.single:>10,} events  {args.single / elapsed:>12,.0f} ev/s")
+
+    started = time.perf_counter()
+    for i in range(0, len(events), args.batch):
+        log.append_many("user.behavior", events[i:i + args.batch])
+    elapsed = time.perf_counter() - started
+    print(f"batched appends  {len(events):>10,} events  {len(events) / elapsed:>12,.0f} ev/s  "
+          f"{total_bytes / elapsed / 1e6:>7.1f} MB/s  segments={len(log.topic('user.behavior').segments)}")
+    log.close()
+
+    reopened = EventLog(root, segment_bytes=args.segment_mb * 1024 * 1024)
+    consumer = EventLogConsumer(reopened, "bench-replay", ["user.behavior"])
+    started = time.perf_counter()
+    replayed = 0
+    while True:
+        batch = consumer.poll(5000)
+        if not batch:
+            break
+        replayed += len(batch)
+    elapsed = time.perf_counter() - started
+    consumer.commit()
+    print(f"replay (decoded) {replayed:>10,} events  {replayed / elapsed:>12,.0f} ev/s")
+
+    started = time.perf_counter()
+    raw, offset = 0, 0
+    while True:
+        records = reopened.read("user.behavior", offset, 10000)
+        if not records:
+            break
+        raw += len(records)
+        offset = records[-1][0] + 1
+    elapsed = time.perf_counter() - started
+    print(f"replay (raw)     {raw:>10,} events  {raw / elapsed:>12,.0f} ev/s  {total_bytes / elapsed / 1e6:>7.1f} MB/s")
+    assert replayed == raw == len(events)
+    print(f"\nlog directory: {root}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Invoice PDFs: FPDF per invoice through a temp file vs InvoiceRenderer.
+
+Seeds --orders orders (1 to --max-items items each) created last month
+into a throwaway SQLite file. It loads their invoices with
+iter_order_invoices and renders them three ways:
+  * fpdf:      the old generate_invoice_pdf flow: a new FPDF document laid
+               out cell by cell (one row per item), written to
+               temp_invoice_*.pdf, read back and deleted, one process
+  * renderer:  InvoiceRenderer.render() into memory, one process
+  * batch:     render_batch() on --processes processes, fed straight from
+               iter_order_invoices (the month-end run, including the loads)
+It checks every flow produced a PDF per order and prints invoices/s.
+
+    python benchmarks/bench_invoice_renderer.py --orders 20000 --processes 8
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import datetime
+import tempfile
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+
+from fpdf import FPDF
+from sqlalchemy import insert
+
+from config_db import SessionLocal, init_db
+from models import Order, OrderItem, OrderStatus, Product, User, Vendor
+from invoice_renderer import InvoiceRenderer, iter_order_invoices, render_batch
+
+
+def seed(args, rng, start):
+    with SessionLocal() as db:
+        db.execute(insert(User), [{"id": u, "name": f"Customer {u}", "email": f"c{u}@example.com", "password_hash": "x"}
+                                  for u in range(1, 1001)])
+        db.execute(insert(Vendor), [{"id": 1, "user_id": 1, "store_name": "Store"}])
+        db.execute(insert(Product), [{"id": p, "vendor_id": 1, "name": f"Handloom Cotton Saree, Style {p}",
+                                      "price": round(rng.uniform(99, 2999), 2)} for p in range(1, 501)])
+        orders, items = [], []
+        for order_id in range(1, args.orders + 1):
+            lines = [(rng.randint(1, 500), rng.randint(1, 3), round(rng.uniform(99, 2999), 2))
+                     for _ in range(rng.randint(1, args.max_items))]
+            orders.append({"id": order_id, "customer_id": rng.randint(1, 1000), "status": OrderStatus.paid,
+                           "total_amount": round(sum(q * p for _, q, p in lines), 2), "stripe_payment_id": f"pi_{order_id:08d}",
+                           "created_at": start + datetime.timedelta(seconds=rng.uniform(0, 28 * 86400))})
+            items.extend({"order_id": order_id, "product_id": product, "quantity": q, "unit_price": p}
+                         for product, q, p in lines)
+        db.execute(insert(Order), orders)
+        db.execute(insert(OrderItem), items)
+        db.commit()
+
+
+def fpdf_invoice(invoice: dict) -> bytes:
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("helvetica", "B", 16)
+    pdf.cell(0, 10, "SaaS Starter Template - Official Invoice", ln=True, align="C")
+    pdf.ln(10)
+    pdf.set_font("helvetica", "", 12)
+    pdf.cell(0, 10, f"Date: {invoice['date']}", ln=True)
+    pdf.cell(0, 10, f"Customer Name: {invoice['customer']}", ln=True)
+    pdf.cell(0, 10, f"Transaction ID: {invoice['transaction_id']}", ln=True)
+    pdf.ln(10)
+    pdf.set_font("helvetica", "B", 12)
+    pdf.cell(100, 10, "Description", border=1)
+    pdf.cell(40, 10, "Qty", border=1, align="C")
+    pdf.cell(50, 10, "Amount", border=1, align="R")
+    pdf.ln()
+    pdf.set_font("helvetica", "", 12)
+    for item in invoice["items"]:
+        pdf.cell(100, 10, item["description"], border=1)
+        pdf.cell(40, 10, str(item["quantity"]), border=1, align="C")
+        pdf.cell(50, 10, f"INR {item['quantity'] * item['unit_price']:.2f}", border=1, align="R")
+        pdf.ln()
+    pdf.ln(20)
+    pdf.set_font("helvetica", "I", 10)
+    pdf.cell(0, 10, "Thank you for your business!", ln=True, align="C")
+    path = f"temp_invoice_{invoice['transaction_id']}.pdf"
+    pdf.output(path)
+    with open(path, "rb") as f:
+        data = f.read()
+    os.remove(path)
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--max-items", type=int, default=8)
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunksize", type=int, default=64)
+    parser.add_argument("--fpdf-sample", type=int, default=1000, help="invoices timed for the (slow) fpdf flow")
+    args = parser.parse_args()
+
+    init_db()
+    rng = random.Random(25)
+    today = datetime.datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    start = (today - datetime.timedelta(days=1)).replace(day=1)
+    seed(args, rng, start)
+
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        invoices = list(iter_order_invoices(db, start, today))
+    load = time.perf_counter() - started
+    assert len(invoices) == args.orders
+    print(f"{args.orders} orders, 1-{args.max_items} items each; loaded their invoices in {load:.2f}s\n")
+    print(f"{'flow':<10} {'invoices':>9} {'seconds':>8} {'invoices/s':>11}")
+
+    def report(name, count, elapsed):
+        print(f"{name:<10} {count:>9} {elapsed:>8.2f} {count / elapsed:>11.0f}")
+
+    sample = invoices[:args.fpdf_sample]
+    with tempfile.TemporaryDirectory() as workdir, warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)  # ln=True, as the old code used it
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            started = time.perf_counter()
+            pdfs = [fpdf_invoice(invoice) for invoice in sample]
+            report("fpdf", len(pdfs), time.perf_counter() - started)
+        finally:
+            os.chdir(cwd)
+    assert all(pdf.startswith(b"%PDF") for pdf in pdfs)
+
+    renderer = InvoiceRenderer()
+    started = time.perf_counter()
+    pdfs = [renderer.render(invoice) for invoice in invoices]
+    report("renderer", len(pdfs), time.perf_counter() - started)
+    assert all(pdf.startswith(b"%PDF") and pdf.endswith(b"%%EOF\n") for pdf in pdfs)
+    size = sum(map(len, pdfs)) / len(pdfs)
+
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        results = list(render_batch(iter_order_invoices(db, start, today), processes=args.processes,
+                                    chunksize=args.chunksize))
+    report("batch", len(results), time.perf_counter() - started)
+    assert [number for number, _ in results] == [invoice["number"] for invoice in invoices]
+    assert [pdf for _, pdf in results] == pdfs, "batch output differs from the single-process render"
+    print(f"\nbatch on {args.processes} processes (load included); average PDF {size / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
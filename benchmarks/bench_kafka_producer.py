@@ -0,0 +1,80 @@
+"""
+Request-path cost of publish_event: flush-per-event vs. batched producer.
+
+Needs a reachable broker (`docker compose up kafka`). For each mode and
+delivery level it publishes --events /p5/track-style events from --threads
+threads and reports publish() latency percentiles as seen by the caller,
+throughput, and how long the final flush took.
+
+    python benchmarks/bench_kafka_producer.py --broker localhost:9092 --events 20000
+"""
+import os
+import sys
+import time
+import argparse
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kafka_producer import EventProducer
+
+CASES = (
+    ("sync", "leader"),
+    ("batched", "fire_and_forget"),
+    ("batched", "leader"),
+    ("batched", "all"),
+)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def run(broker, mode, delivery, n_events, threads, linger_ms):
+    producer = EventProducer(bootstrap_servers=broker, mode=mode, delivery=delivery, linger_ms=linger_ms)
+    producer.publish("bench.warmup", {"warmup": True})
+    producer.flush(10)
+
+    def publish(i):
+        event = {"event": "click", "user_id": i % 1000, "product_id": i % 97,
+                 "timestamp": datetime.datetime.utcnow().isoformat()}
+        started = time.perf_counter()
+        producer.publish("bench.user.behavior", event)
+        return (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        latencies = list(pool.map(publish, range(n_events)))
+    publish_elapsed = time.perf_counter() - started
+    flush_started = time.perf_counter()
+    producer.flush(30)
+    flush_elapsed = time.perf_counter() - flush_started
+    total = time.perf_counter() - started
+
+    topic = producer.metrics()["topics"].get("bench.user.behavior", {})
+    producer.close()
+    print(f"{mode:<8} {delivery:<16} {percentile(latencies, 50):>8.3f} {percentile(latencies, 99):>8.3f} "
+          f"{n_events / publish_elapsed:>12,.0f} {flush_elapsed * 1000:>9.1f} {n_events / total:>12,.0f} "
+          f"{topic.get('acked', 0):>7} {topic.get('failed', 0):>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--broker", default=os.getenv("KAFKA_BROKER_URL", "localhost:9092"))
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--linger-ms", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'delivery':<16} {'p50 ms':>8} {'p99 ms':>8} {'publish/s':>12} {'flush ms':>9} "
+          f"{'end-to-end/s':>12} {'acked':>7} {'failed':>6}")
+    for mode, delivery in CASES:
+        # The old path waits on the broker per event; keep it to a sample
+        n_events = min(args.events, 2000) if mode == "sync" else args.events
+        run(args.broker, mode, delivery, n_events, args.threads, args.linger_ms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark / smoke test for the multi-backend Ollama router.
+
+Starts three fake Ollama servers (only one has phi3 loaded) plus one dead URL,
+then fires concurrent chat requests and reports how they were spread, how the
+dead node was ejected, and how a node shut down mid-run is failed over. A
+last phase oversubscribes a few small pools to check that queued requests
+still spread evenly once every backend is saturated.
+
+    python benchmarks/bench_ollama_router.py --requests 300 --workers 24
+"""
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_ollama import start_fake_ollama
+from ollama_router import OllamaRouter
+
+
+def run(router, n_requests, workers, model="phi3"):
+    def call(i):
+        return router.chat([{"role": "user", "content": f"request {i}"}], model=model)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(workers) as pool:
+        results = list(pool.map(call, range(n_requests)))
+    elapsed = time.perf_counter() - started
+    assert all(r["message"]["content"].startswith("Echo:") for r in results)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=24)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    warm = start_fake_ollama(latency=args.latency, models=("phi3",))
+    cold_a = start_fake_ollama(latency=args.latency, load_latency=0.5, models=())
+    cold_b = start_fake_ollama(latency=args.latency, load_latency=0.5, models=())
+    dead_url = "http://127.0.0.1:9"  # discard port, nothing listens
+
+    router = OllamaRouter([warm.url, cold_a.url, cold_b.url, dead_url], pool_size=8)
+    router.check_health()
+    print("After health check:")
+    for b in router.backends:
+        print(f"  {b.url:<28} healthy={b.healthy!s:<5} loaded={sorted(b.loaded_models)}")
+
+    elapsed = run(router, args.requests, args.workers)
+    print(f"\nPhase 1 (model affinity, spill-over when saturated): {args.requests} requests in {elapsed:.2f}s "
+          f"({args.requests / elapsed:.0f} req/s)")
+    for name, srv in (("warm", warm), ("cold_a", cold_a), ("cold_b", cold_b)):
+        print(f"  {name:<7} served {srv.requests}")
+
+    router.warm_up(["phi3"])
+    for srv in (warm, cold_a, cold_b):
+        srv.requests = 0
+    elapsed = run(router, args.requests, args.workers)
+    print(f"\nPhase 2 (all warm, least-loaded): {args.requests} requests in {elapsed:.2f}s "
+          f"({args.requests / elapsed:.0f} req/s)")
+    for name, srv in (("warm", warm), ("cold_a", cold_a), ("cold_b", cold_b)):
+        print(f"  {name:<7} served {srv.requests}")
+
+    cold_b.down = True
+    elapsed = run(router, args.requests, args.workers)
+    print(f"\nPhase 3 (one node killed): {args.requests} requests in {elapsed:.2f}s, no request failed")
+    for b in router.backends:
+        print(f"  {b.url:<28} healthy={b.healthy!s:<5} failures={b.failures}")
+
+    router.stop()
+
+    # Far more concurrent requests than pooled connections: every backend is
+    # saturated and the spread depends on counting queued requests as load
+    nodes = [start_fake_ollama(latency=args.latency, models=("phi3",)) for _ in range(3)]
+    saturated = OllamaRouter([n.url for n in nodes], pool_size=2)
+    saturated.check_health()
+    elapsed = run(saturated, 30, 30)
+    served = [n.requests for n in nodes]
+    print(f"\nPhase 4 (3 backends x pool 2, 30 concurrent): 30 requests in {elapsed:.2f}s, served {served}")
+    assert max(served) - min(served) <= 4, f"uneven spread under saturation: {served}"
+    saturated.stop()
+
+
+if __name__ == "__main__":
+    main()
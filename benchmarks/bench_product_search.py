@@ -0,0 +1,201 @@
+"""
+Product search index: build, snapshot and query latency on a synthetic catalog.
+
+Generates --products products whose names and descriptions draw from a
+Zipf-distributed vocabulary (stopwords at the head, a few real catalog
+words among the common terms), indexes them,
+saves and reloads the snapshot, applies a burst of incremental updates and
+times a mix of queries: common and rare terms, multi-word, prefix, typo and
+filtered. Checks that every query's top 20 scores match a brute-force
+BM25 pass over all products (same query expansion, no candidate cap),
+that filters hold, that a misspelt query reaches the corrected term and
+that updated products are searchable before and after the pending layer
+is merged.
+
+    python benchmarks/bench_product_search.py --products 1000000 --queries 2000
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import itertools
+import tempfile
+from collections import Counter
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import product_search
+from product_search import BM25_B, BM25_K1, SEARCH_NAME_WEIGHT, ProductSearchIndex, STOPWORDS, tokenize
+
+REAL_WORDS = ["cotton", "kurta", "saree", "silk", "handloom", "jute", "bag", "brass", "lamp", "leather",
+              "wallet", "steel", "bottle", "organic", "honey", "masala", "chai", "printed", "embroidered", "wooden"]
+QUERIES = [
+    ("common", "cotton"),
+    ("two words", "silk saree"),
+    ("three words", "handloom cotton kurta"),
+    ("rare", "khadiweave"),
+    ("prefix", "embroi"),
+    ("typo", "handlom kurta"),
+    ("filtered", "brass lamp"),
+]
+
+
+def synthetic_words(n, rng):
+    """Zipf rank order: stopwords first, then catalog words spread over ranks 30-500, then made-up words."""
+    syllables = ["ka", "ri", "to", "mu", "zu", "bo", "ta", "wi", "ne", "sha", "lo", "pa", "di", "ve", "ga"]
+    words = set()
+    while len(words) < n - len(STOPWORDS) - len(REAL_WORDS):
+        word = "".join(rng.choice(syllables) for _ in range(rng.randint(2, 4)))
+        if word not in REAL_WORDS:
+            words.add(word)
+    vocab = sorted(STOPWORDS) + sorted(words)
+    for rank, word in enumerate(REAL_WORDS):
+        vocab.insert(30 + rank * 25, word)
+    return vocab
+
+
+def products(count, vocab, rng, start_id=1):
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocab))))
+    for i in range(start_id, start_id + count):
+        words = rng.choices(vocab, cum_weights=cum_weights, k=rng.randint(18, 36))
+        yield {"id": i, "name": " ".join(words[:4]).title(), "description": " ".join(words[4:]),
+               "vendor_id": 1 + i % 500, "price": round(rng.uniform(99, 4999), 2), "stock_qty": rng.randint(0, 50)}
+
+
+def query_filters(name):
+    return {"vendor_id": 7, "max_price": 1000, "in_stock": True} if name == "filtered" else {}
+
+
+def brute_force_check(index, catalog, limit=20):
+    """Scores every product for each query from its raw text and compares the top `limit` scores."""
+    expansions = {}
+    for name, text in QUERIES:
+        weights = Counter()
+        for term, weight in index._expand(list(dict.fromkeys(tokenize(text)))):
+            weights[term] += weight
+        expansions[name] = weights
+    wanted = set().union(*expansions.values())
+
+    n = len(catalog)
+    lengths = np.zeros(n)
+    tf = {term: np.zeros(n) for term in wanted}
+    for i, product in enumerate(catalog):
+        terms = Counter({t: c * SEARCH_NAME_WEIGHT for t, c in Counter(tokenize(product["name"])).items()})
+        terms.update(tokenize(product["description"]))
+        lengths[i] = sum(terms.values())
+        for term in wanted.intersection(terms):
+            tf[term][i] = terms[term]
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / lengths.mean())
+    vendors = np.array([p["vendor_id"] for p in catalog])
+    prices = np.array([p["price"] for p in catalog])
+    stocks = np.array([p["stock_qty"] for p in catalog])
+
+    capped, product_search.SEARCH_MAX_CANDIDATES = product_search.SEARCH_MAX_CANDIDATES, 0
+    try:
+        for name, text in QUERIES:
+            scores = np.zeros(n)
+            for term, weight in expansions[name].items():
+                df = np.count_nonzero(tf[term])
+                idf = weight * np.log(1 + (n - df + 0.5) / (df + 0.5))
+                scores += idf * tf[term] * (BM25_K1 + 1) / (tf[term] + norm)
+            filters = query_filters(name)
+            if filters:
+                scores[(vendors != 7) | (prices > 1000) | (stocks <= 0)] = 0
+            expected = np.sort(scores[scores > 0])[::-1][:limit]
+            got = index.search(text, limit=limit, **filters).scores
+            assert np.allclose(got, expected, rtol=1e-4), f"{name}: top-{limit} differs from brute-force BM25"
+    finally:
+        product_search.SEARCH_MAX_CANDIDATES = capped
+    print(f"top-{limit} scores match brute-force BM25 for all {len(QUERIES)} queries\n")
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=200000)
+    parser.add_argument("--vocab", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--no-check", action="store_true", help="skip the brute-force BM25 comparison")
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    vocab = synthetic_words(args.vocab, rng)
+    path = os.path.join(tempfile.mkdtemp(), "search_index.npz")
+    index = ProductSearchIndex(path=path)
+
+    catalog = [] if not args.no_check else None
+    started = time.perf_counter()
+    batch = []
+    for product in products(args.products, vocab, rng):
+        batch.append(product)
+        if len(batch) == 10000:
+            index.upsert_many(batch)
+            if catalog is not None:
+                catalog.extend(batch)
+            batch = []
+    index.upsert_many(batch)
+    if catalog is not None:
+        catalog.extend(batch)
+    index.merge()
+    build_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index.save()
+    save_s = time.perf_counter() - started
+    loaded = ProductSearchIndex(path=path)
+    started = time.perf_counter()
+    loaded.load()
+    load_s = time.perf_counter() - started
+    print(f"{args.products} products, {len(index._base.terms)} terms, {len(index._base)} postings, "
+          f"snapshot {os.path.getsize(path) / 1e6:.0f} MB")
+    print(f"build {build_s:.1f}s   save {save_s:.2f}s   load {load_s:.2f}s\n")
+    if catalog is not None:
+        brute_force_check(loaded, catalog)
+        catalog = None
+
+    # Incremental updates land in the pending layer and are searched alongside the base
+    updated = rng.sample(range(1, args.products + 1), min(args.updates, args.products))
+    started = time.perf_counter()
+    for pid in updated:
+        loaded.upsert({"id": pid, "name": "Handloom Khadiweave Kurta", "description": "cotton", "vendor_id": 7,
+                       "price": 799.0, "stock_qty": 3})
+    update_ms = (time.perf_counter() - started) * 1000 / len(updated)
+    print(f"upsert {update_ms:.3f} ms/product, {loaded._pending_postings} pending postings\n")
+
+    print(f"{'query':<12} {'text':<24} {'p50 ms':>8} {'p99 ms':>8} {'total':>9}")
+    for name, text in QUERIES:
+        filters = query_filters(name)
+        times = []
+        for _ in range(max(1, args.queries // len(QUERIES))):
+            result = loaded.search(text, limit=20, **filters)
+            times.append(result.took_ms)
+        total = f"{result.total}" if result.exact else f"~{result.total}"
+        print(f"{name:<12} {text:<24} {percentile(times, 50):>8.2f} {percentile(times, 99):>8.2f} {total:>9}")
+        for pid in result.ids:
+            doc = loaded._doc_of[pid]
+            if filters:
+                assert loaded._vendor[doc] == 7 and loaded._price[doc] <= 1000 and loaded._stock[doc] > 0
+        if name == "typo":
+            assert set(result.ids) & set(loaded.search("handloom kurta", limit=20).ids), "typo did not reach the corrected term"
+
+    marked = loaded.search("khadiweave", limit=len(updated) + 10)
+    assert set(updated) <= set(marked.ids), "incrementally added products not found"
+
+    started = time.perf_counter()
+    loaded.merge()
+    print(f"\nmerge of pending layer {(time.perf_counter() - started) * 1000:.0f} ms")
+    after = loaded.search("khadiweave", limit=len(updated) + 10)
+    assert set(after.ids) == set(marked.ids)
+    print(loaded.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Registration latency: side effects inside /register vs the registration pipeline.
+
+Stand-ins with fixed latencies replace the external services: the
+Supabase insert (--db ms), the invoice PDF (--invoice ms), a Gmail SMTP
+login + send (--email ms) and a Twilio WhatsApp send (--whatsapp ms).
+--fail of email and WhatsApp attempts fail and are retried after
+--backoff seconds. --registrations registrations arrive from --clients
+concurrent clients, and two flows are compared:
+  * serial:   every step runs inside the request, as process_framework_action did
+  * pipeline: the request waits for the insert only; steps run on the thread pool
+It reports request latency percentiles, and the time until every step has
+finished. It then checks each registration's step rows: all terminal, and
+the email never started before its invoice was done.
+
+    python benchmarks/bench_registration_pipeline.py --registrations 200 --clients 16
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+
+from sqlalchemy import select
+
+from config_db import SessionLocal, init_db
+from models import RegistrationStep
+from registration_pipeline import TERMINAL, RegistrationPipeline
+
+
+class Services:
+    """Fake external services; failures are drawn from a seeded generator."""
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(23)
+        self.lock = threading.Lock()
+        self.invoice_done = {}
+        self.email_started = {}
+
+    def _fails(self):
+        with self.lock:
+            return self.rng.random() < self.args.fail
+
+    def insert_user(self, user):
+        time.sleep(self.args.db / 1000)
+
+    def invoice(self, registration_id, user):
+        time.sleep(self.args.invoice / 1000)
+        self.invoice_done[registration_id] = time.monotonic()
+        return "invoice.pdf"
+
+    def email(self, registration_id, user, invoice=None):
+        self.email_started.setdefault(registration_id, time.monotonic())
+        time.sleep(self.args.email / 1000)
+        if self._fails():
+            raise RuntimeError("SMTP 421 service not available")
+        return "sent with invoice"
+
+    def whatsapp(self, registration_id, user):
+        time.sleep(self.args.whatsapp / 1000)
+        if self._fails():
+            raise RuntimeError("Twilio 503")
+        return "SM123"
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def users(n):
+    return [{"name": f"User {i}", "email": f"user{i}@example.com", "phone": f"+9190000{i:05d}", "payment_id": f"pay_{i}"}
+            for i in range(n)]
+
+
+def serial(args, services, user):
+    services.insert_user(user)
+    for step in (services.invoice, services.email, services.whatsapp):
+        for attempt in range(args.attempts):
+            try:
+                step("serial", user)
+                break
+            except Exception:
+                time.sleep(args.backoff * 2 ** attempt)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--registrations", type=int, default=100)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--db", type=float, default=80.0)
+    parser.add_argument("--invoice", type=float, default=40.0)
+    parser.add_argument("--email", type=float, default=1200.0)
+    parser.add_argument("--whatsapp", type=float, default=600.0)
+    parser.add_argument("--fail", type=float, default=0.15)
+    parser.add_argument("--backoff", type=float, default=0.2)
+    parser.add_argument("--attempts", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=32, help="pipeline thread pool size")
+    args = parser.parse_args()
+
+    init_db()
+    people = users(args.registrations)
+    print(f"{args.registrations} registrations from {args.clients} clients; db {args.db:.0f} ms, invoice {args.invoice:.0f} ms, "
+          f"email {args.email:.0f} ms, whatsapp {args.whatsapp:.0f} ms, {args.fail:.0%} failures\n")
+    print(f"{'flow':<9} {'p50 ms':>8} {'p95 ms':>8} {'all done s':>11}")
+
+    services = Services(args)
+
+    def timed(fn, user):
+        started = time.perf_counter()
+        result = fn(user)
+        return (time.perf_counter() - started) * 1000, result
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.clients) as clients:
+        latencies = [ms for ms, _ in clients.map(lambda u: timed(lambda u: serial(args, services, u), u), people)]
+    print(f"{'serial':<9} {percentile(latencies, 50):>8.0f} {percentile(latencies, 95):>8.0f} {time.perf_counter() - started:>11.1f}")
+
+    services = Services(args)
+    pipeline = RegistrationPipeline(
+        steps={"invoice": services.invoice, "email": services.email, "whatsapp": services.whatsapp},
+        mode="local", workers=args.workers, attempts=args.attempts, backoff=args.backoff,
+    )
+
+    def register(user):
+        services.insert_user(user)
+        return pipeline.start(user)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.clients) as clients:
+        timings = list(clients.map(lambda u: timed(register, u), people))
+    latencies = [ms for ms, _ in timings]
+    ids = [registration_id for _, registration_id in timings]
+    while not all(pipeline.status(r)["status"] != "in_progress" for r in ids):
+        time.sleep(0.05)
+    done = time.perf_counter() - started
+    print(f"{'pipeline':<9} {percentile(latencies, 50):>8.0f} {percentile(latencies, 95):>8.0f} {done:>11.1f}")
+    pipeline.shutdown()
+
+    with SessionLocal() as db:
+        rows = db.execute(select(RegistrationStep.status)).scalars().all()
+    assert len(rows) == 3 * args.registrations and all(status in TERMINAL for status in rows)
+    assert all(services.email_started[r] >= services.invoice_done[r] for r in ids), "email started before its invoice"
+    print(f"\nall {len(rows)} steps finished; every email started after its invoice")
+    print(pipeline.stats())
+    print("example:", pipeline.status(ids[0]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Throughput and accuracy of the local review sentiment classifier.
+
+Uses benchmarks/fixtures/reviews_labeled.jsonl (reviews with the label phi3
+gave them) and reports
+  * reviews/sec of classify_batch over the fixture repeated to --reviews
+  * agreement with the LLM label, overall and on the confident subset
+  * how many reviews would be escalated to the LLM at each threshold
+Pass --ollama-url to also time the old one-LLM-call-per-review path.
+
+    python benchmarks/bench_sentiment.py --reviews 100000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sentiment import SentimentClassifier, SENTIMENT_BATCH_SIZE
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "reviews_labeled.jsonl")
+THRESHOLDS = (0.5, 0.6, 0.7, 0.8, 0.9)
+
+
+def load_fixture(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def time_llm(url, texts):
+    import requests
+    started = time.perf_counter()
+    for text in texts:
+        response = requests.post(f"{url}/api/chat", json={
+            "model": "phi3", "stream": False,
+            "messages": [
+                {"role": "system", "content": "You are a zero-shot sentiment classification API."},
+                {"role": "user", "content": f"Analyze this product product review. Output ONLY ONE WORD (Positive, Negative, or Neutral): '{text}'"},
+            ],
+        }, timeout=120)
+        response.raise_for_status()
+    return len(texts) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reviews", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=SENTIMENT_BATCH_SIZE)
+    parser.add_argument("--fixture", default=FIXTURE)
+    parser.add_argument("--ollama-url", default=None)
+    args = parser.parse_args()
+
+    rows = load_fixture(args.fixture)
+    texts = [r["text"] for r in rows]
+    classifier = SentimentClassifier()
+
+    corpus = (texts * (args.reviews // len(texts) + 1))[:args.reviews]
+    started = time.perf_counter()
+    for i in range(0, len(corpus), args.batch_size):
+        classifier.classify_batch(corpus[i:i + args.batch_size])
+    elapsed = time.perf_counter() - started
+    print(f"Local classifier: {len(corpus):,} reviews in {elapsed:.2f}s "
+          f"({len(corpus) / elapsed:,.0f} reviews/s, batch={args.batch_size})")
+
+    results = classifier.classify_batch(texts)
+    agree = sum(label == r["llm_label"] for r, (label, _) in zip(rows, results))
+    print(f"Agreement with LLM labels: {agree}/{len(rows)} ({agree / len(rows):.0%})\n")
+
+    print(f"{'threshold':>9} | {'escalated':>9} | {'confident agreement':>19}")
+    for threshold in THRESHOLDS:
+        confident = [(r, label) for r, (label, conf) in zip(rows, results) if conf >= threshold]
+        escalated = len(rows) - len(confident)
+        hits = sum(label == r["llm_label"] for r, label in confident)
+        accuracy = f"{hits}/{len(confident)} ({hits / len(confident):.0%})" if confident else "-"
+        print(f"{threshold:>9.2f} | {escalated / len(rows):>9.0%} | {accuracy:>19}")
+
+    if args.ollama_url:
+        sample = texts[:20]
+        print(f"\nLLM per-review path: {time_llm(args.ollama_url, sample):.2f} reviews/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Email sending: a new SMTP connection + login per message vs the pooled transport.
+
+Starts a local aiosmtpd server (AUTH allowed without TLS, messages
+discarded) behind a small TCP proxy that delays every packet by --rtt/2
+ms in each direction, so handshakes and command round trips cost what
+they would against a remote provider. Then sends --messages onboarding
+style emails (HTML body, --attachment-kb PDF-sized attachment) three ways:
+  * per-message: smtplib connect, EHLO, login, send, QUIT for each email
+                 (what send_email_via_gmail and send_async_email did),
+                 from --threads threads
+  * pooled:      SMTPTransport.send() from --threads threads
+  * send_many:   --threads SMTPTransport.send_many() batches, one session each
+It checks the server received every message and prints the transport's
+connection counts. STARTTLS is off here, so the per-message flow is
+spared the TLS handshake it pays against Gmail. aiosmtpd does not
+advertise PIPELINING, so send_many runs without it; against Gmail each
+message then takes 2 round trips instead of 4.
+
+Requires aiosmtpd (pip install aiosmtpd).
+
+    python benchmarks/bench_smtp_transport.py --messages 300 --rtt 40 --threads 8
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import smtplib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from email.mime.application import MIMEApplication
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from smtp_transport import SMTPTransport
+
+
+class Sink:
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return "250 Message accepted for delivery"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def _pump(reader, writer, delay):
+    """Forwards bytes, each chunk `delay` seconds after it arrived, keeping order."""
+    queue = asyncio.Queue()
+
+    async def deliver():
+        while True:
+            due, data = await queue.get()
+            if data is None:
+                writer.close()
+                return
+            await asyncio.sleep(max(0.0, due - time.monotonic()))
+            writer.write(data)
+            await writer.drain()
+
+    task = asyncio.ensure_future(deliver())
+    try:
+        while True:
+            data = await reader.read(65536)
+            await queue.put((time.monotonic() + delay, data or None))
+            if not data:
+                break
+        await task
+    except (ConnectionError, asyncio.CancelledError):
+        task.cancel()
+
+
+def start_latency_proxy(upstream_port: int, rtt_ms: float) -> int:
+    port = free_port()
+    loop = asyncio.new_event_loop()
+
+    async def handle(client_reader, client_writer):
+        server_reader, server_writer = await asyncio.open_connection("127.0.0.1", upstream_port)
+        await asyncio.gather(_pump(client_reader, server_writer, rtt_ms / 2000),
+                             _pump(server_reader, client_writer, rtt_ms / 2000))
+
+    loop.run_until_complete(asyncio.start_server(handle, "127.0.0.1", port))
+    threading.Thread(target=loop.run_forever, name="latency-proxy", daemon=True).start()
+    return port
+
+
+def build(i: int, attachment: bytes):
+    msg = MIMEMultipart()
+    msg["From"] = "founder@example.com"
+    msg["To"] = f"user{i}@example.com"
+    msg["Subject"] = "Action Confirmed & Your Invoice! 🚀"
+    msg.attach(MIMEText(f"<strong>Hi User {i}, your action was successful!</strong><p>Welcome to the framework.</p>", "html"))
+    if attachment:
+        part = MIMEApplication(attachment, Name="Invoice.pdf")
+        part["Content-Disposition"] = 'attachment; filename="Invoice.pdf"'
+        msg.attach(part)
+    return msg
+
+
+def per_message(port: int, msg):
+    with smtplib.SMTP("127.0.0.1", port, timeout=30) as server:
+        server.ehlo()
+        server.login("bench", "secret")
+        server.send_message(msg)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--rtt", type=float, default=40.0, help="simulated round trip to the provider, ms")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--pool", type=int, default=8)
+    parser.add_argument("--attachment-kb", type=int, default=2)
+    args = parser.parse_args()
+
+    try:
+        from aiosmtpd.controller import Controller
+        from aiosmtpd.smtp import AuthResult
+    except ImportError:
+        sys.exit("aiosmtpd is required: pip install aiosmtpd")
+
+    sink = Sink()
+    smtp_port = free_port()
+    controller = Controller(
+        sink, hostname="127.0.0.1", port=smtp_port, auth_require_tls=False,
+        authenticator=lambda server, session, envelope, mechanism, auth_data: AuthResult(success=True),
+    )
+    controller.start()
+    port = start_latency_proxy(smtp_port, args.rtt)
+    attachment = os.urandom(args.attachment_kb * 1024)
+    messages = [build(i, attachment) for i in range(args.messages)]
+    print(f"{args.messages} messages, {args.rtt:.0f} ms RTT, {args.threads} threads, pool of {args.pool}\n")
+    print(f"{'flow':<12} {'seconds':>8} {'msg/s':>8} {'connects':>9}")
+
+    def run(name, fn, connects):
+        before = sink.received
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        assert sink.received - before == args.messages, (name, sink.received - before)
+        print(f"{name:<12} {elapsed:>8.2f} {args.messages / elapsed:>8.1f} {connects():>9}")
+
+    with ThreadPoolExecutor(args.threads) as pool:
+        run("per-message", lambda: list(pool.map(lambda m: per_message(port, m), messages)), lambda: args.messages)
+
+        transport = SMTPTransport("127.0.0.1", port, username="bench", password="secret", starttls=False,
+                                  pool_size=args.pool, rate=0)
+        run("pooled", lambda: list(pool.map(transport.send, messages)), lambda: transport.connects)
+        pooled_connects = transport.connects
+        transport.close()
+
+    transport = SMTPTransport("127.0.0.1", port, username="bench", password="secret", starttls=False,
+                              pool_size=args.pool, rate=0)
+    batches = [messages[i::args.threads] for i in range(args.threads)]
+
+    def bulk():
+        with ThreadPoolExecutor(args.threads) as pool:
+            errors = [e for results in pool.map(transport.send_many, batches) for e in results if e is not None]
+        assert not errors, errors[:3]
+
+    run("send_many", bulk, lambda: transport.connects)
+    print(f"\npooled flow opened {pooled_connects} sessions for {args.messages} messages")
+    print(transport.stats())
+    transport.close()
+    controller.stop()
+
+
+if __name__ == "__main__":
+    main()
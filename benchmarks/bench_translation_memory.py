@@ -0,0 +1,77 @@
+"""
+Round-trips and wall time to translate a UI locale bundle.
+
+Compares, against a fake Ollama with --latency seconds per generation:
+  * the old path: one /translate LLM call per string
+  * /translate/batch on a cold translation memory (misses packed into groups)
+  * /translate/batch again once the memory is warm
+  * a warm lookup after a restart (SQLite only, empty in-memory front)
+
+    python benchmarks/bench_translation_memory.py --strings 300
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_ollama import start_fake_ollama
+
+
+def fake_translator(payload: dict) -> str:
+    prompt = payload["messages"][-1]["content"]
+    if payload.get("format") == "json":
+        group = json.loads(prompt.rsplit("\n", 1)[-1])
+        return json.dumps({k: f"[hi] {v}" for k, v in group.items()}, ensure_ascii=False)
+    return "[hi] " + prompt.rsplit(": '", 1)[-1].rstrip("'")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--strings", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    fake = start_fake_ollama(latency=args.latency, responder=fake_translator)
+    os.environ["OLLAMA_URLS"] = fake.url
+    os.environ["LLM_CACHE_BACKEND"] = "memory"
+
+    from ai_service import chat_completion
+    from translation_memory import TranslationMemory, _single_prompt
+
+    bundle = [f"Button label number {i}: Save changes" for i in range(args.strings)]
+    path = os.path.join(tempfile.mkdtemp(), "tm.db")
+
+    started = time.perf_counter()
+    for text in bundle:
+        chat_completion(_single_prompt(text, "Hindi"), use_cache=False)
+    old = time.perf_counter() - started
+    print(f"{'old, one call per string':<34} {old:>7.2f}s  {fake.requests:>4} LLM calls")
+
+    memory = TranslationMemory(path=path)
+    fake.requests = 0
+    started = time.perf_counter()
+    result = memory.translate_batch(bundle, "Hindi")
+    cold = time.perf_counter() - started
+    assert all(t.startswith("[hi]") for t in result["translations"])
+    print(f"{'batch, cold memory':<34} {cold:>7.2f}s  {fake.requests:>4} LLM calls")
+
+    fake.requests = 0
+    started = time.perf_counter()
+    memory.translate_batch(bundle, "Hindi")
+    warm = time.perf_counter() - started
+    print(f"{'batch, warm memory':<34} {warm * 1000:>6.1f}ms  {fake.requests:>4} LLM calls")
+
+    restarted = TranslationMemory(path=path)
+    started = time.perf_counter()
+    restarted.translate_batch(bundle, "Hindi")
+    disk = time.perf_counter() - started
+    print(f"{'batch, after restart (SQLite)':<34} {disk * 1000:>6.1f}ms  {fake.requests:>4} LLM calls")
+    print(f"\n{restarted.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+User profile lookups: one Supabase query per request vs the user cache.
+
+Replays --requests lookups from --threads concurrent workers against a
+simulated hackathon_data table with --latency ms of round trip per query
+(Supabase is a remote HTTP API). Users are drawn Zipf-like from --users
+registered profiles, by email (/chat, /login) or phone (WhatsApp), plus a
+share of unregistered WhatsApp senders. Every --write-every requests a
+credit update invalidates the user, and the next read must see it.
+Reports throughput, queries issued and the cache's hit rates.
+
+    python benchmarks/bench_user_cache.py --requests 20000 --users 2000 --latency 40
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from user_cache import UserCache
+
+
+class Table:
+    """Stand-in for hackathon_data: rows by email, a fixed latency per query."""
+
+    def __init__(self, users: int, latency: float):
+        self.latency = latency
+        self.rows = {f"user{i}@example.com": {"id": i, "name": f"User {i}", "email": f"user{i}@example.com",
+                                              "phone": f"+9190000{i:05d}", "status": "Free", "credits": 5}
+                     for i in range(users)}
+        self.by_phone = {row["phone"]: row for row in self.rows.values()}
+        self.queries = 0
+        self._lock = threading.Lock()
+
+    def fetch(self, field, value):
+        time.sleep(self.latency)
+        with self._lock:
+            self.queries += 1
+            row = self.rows.get(value) if field == "email" else self.by_phone.get(value)
+            return dict(row) if row else None
+
+    def spend_credit(self, email):
+        with self._lock:
+            self.rows[email]["credits"] -= 1
+            return self.rows[email]["credits"]
+
+
+def workload(args, rng):
+    weights = [1 / (i + 1) ** 1.1 for i in range(args.users)]
+    users = rng.choices(range(args.users), weights, k=args.requests)
+    ops = []
+    for n, user in enumerate(users):
+        roll = rng.random()
+        if roll < args.unknown:
+            ops.append(("phone", f"+4470000{rng.randint(0, 200):05d}", False))
+        elif roll < 0.5:
+            ops.append(("phone", f"+9190000{user:05d}", False))
+        else:
+            ops.append(("email", f"user{user}@example.com", args.write_every and n % args.write_every == 0))
+    return ops
+
+
+def run(args, ops, cached: bool):
+    table = Table(args.users, args.latency / 1000)
+    cache = UserCache() if cached else None
+    stale = []
+
+    def one(op):
+        field, value, write = op
+        if cache is None:
+            user = table.fetch(field, value)
+        else:
+            user = cache.lookup(field, value, lambda: table.fetch(field, value))
+        if write and user:
+            credits = table.spend_credit(value)
+            if cache is not None:
+                cache.invalidate(email=value)
+                seen = cache.lookup(field, value, lambda: table.fetch(field, value))
+                # Concurrent spends for the same user may have moved it further
+                if seen["credits"] > credits:
+                    stale.append((value, seen["credits"], credits))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as pool:
+        list(pool.map(one, ops))
+    elapsed = time.perf_counter() - started
+    return elapsed, table.queries, cache, stale
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=64)
+    parser.add_argument("--latency", type=float, default=40.0, help="simulated Supabase round trip, ms")
+    parser.add_argument("--unknown", type=float, default=0.1, help="share of lookups for unregistered phones")
+    parser.add_argument("--write-every", type=int, default=50, help="credit update + invalidation every N requests")
+    args = parser.parse_args()
+
+    ops = workload(args, random.Random(21))
+    print(f"{args.requests} lookups, {args.users} users, {args.threads} threads, {args.latency:.0f} ms per query\n")
+    print(f"{'path':<12} {'seconds':>8} {'req/s':>9} {'queries':>9}")
+    for name, cached in (("uncached", False), ("user cache", True)):
+        elapsed, queries, cache, stale = run(args, ops, cached)
+        print(f"{name:<12} {elapsed:>8.2f} {args.requests / elapsed:>9.0f} {queries:>9}")
+    assert not stale, stale[:5]
+    print(f"\nno stale reads after {sum(1 for op in ops if op[2])} credit updates")
+    print(cache.stats())
+
+
+if __name__ == "__main__":
+    main()
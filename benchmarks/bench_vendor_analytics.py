@@ -0,0 +1,172 @@
+"""
+Vendor sales totals: join scan over order history vs prefix sums.
+
+Seeds --orders orders (1-4 items each) spread over --days days for
+--vendors vendors in a throwaway SQLite file, then:
+  * times vendor_analytics.rebuild() over the whole history
+  * for random vendors and date ranges, times the naive aggregate over
+    order_items x orders x products and VendorSales.totals() cold (first
+    load of the vendor) and warm, and checks they agree
+  * runs real checkouts through p1_marketplace.checkout, cancels a fifth of
+    them with cancel_order() and checks that the incrementally maintained
+    rows match a fresh rebuild
+
+    python benchmarks/bench_vendor_analytics.py --orders 500000 --vendors 200 --days 730
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import datetime
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+
+from sqlalchemy import func, insert, select
+
+from config_db import SessionLocal, init_db
+from models import Order, OrderItem, OrderStatus, Product, Vendor, VendorDailySales
+import p1_marketplace
+import vendor_analytics
+
+
+def naive_totals(db, vendor_id, start, end):
+    revenue = OrderItem.quantity * OrderItem.unit_price
+    rate = func.coalesce(Vendor.commission_rate, 10.0)
+    row = db.execute(
+        select(func.sum(revenue), func.sum(OrderItem.quantity), func.count(func.distinct(Order.id)),
+               func.sum(revenue * rate / 100))
+        .select_from(OrderItem)
+        .join(Order, OrderItem.order_id == Order.id)
+        .join(Product, OrderItem.product_id == Product.id)
+        .join(Vendor, Product.vendor_id == Vendor.id)
+        .where(Product.vendor_id == vendor_id, Order.status != OrderStatus.cancelled,
+               Order.created_at >= datetime.datetime.combine(start, datetime.time.min),
+               Order.created_at < datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min))
+    ).one()
+    return {"revenue": row[0] or 0.0, "units": row[1] or 0, "orders": row[2], "commission": row[3] or 0.0}
+
+
+def timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - started) * 1000, result
+
+
+def seed(args, rng):
+    today = datetime.datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    products_per_vendor = 20
+    with SessionLocal() as db:
+        db.execute(insert(Vendor), [
+            {"id": v, "user_id": v, "store_name": f"Store {v}", "commission_rate": rng.choice([5.0, 8.0, 10.0, 12.5])}
+            for v in range(1, args.vendors + 1)
+        ])
+        db.execute(insert(Product), [
+            {"id": p, "vendor_id": 1 + (p - 1) // products_per_vendor, "name": f"Product {p}", "slug": f"product-{p}",
+             "price": round(rng.uniform(99, 2999), 2), "stock_qty": 1_000_000, "is_active": True}
+            for p in range(1, args.vendors * products_per_vendor + 1)
+        ])
+        prices = dict(db.execute(select(Product.id, Product.price)).all())
+        # Vendor popularity is skewed, as in a real marketplace
+        weights = [1 / (v + 1) ** 0.7 for v in range(args.vendors)]
+        batch = 20000
+        for first in range(1, args.orders + 1, batch):
+            orders, items = [], []
+            for order_id in range(first, min(first + batch, args.orders + 1)):
+                created = today - datetime.timedelta(days=args.days) + datetime.timedelta(seconds=rng.uniform(0, args.days * 86400))
+                orders.append({"id": order_id, "customer_id": 1, "total_amount": 0.0, "created_at": created,
+                               "status": OrderStatus.cancelled if rng.random() < 0.03 else OrderStatus.paid})
+                for vendor in set(rng.choices(range(1, args.vendors + 1), weights, k=rng.randint(1, 4))):
+                    product = (vendor - 1) * products_per_vendor + rng.randint(1, products_per_vendor)
+                    items.append({"order_id": order_id, "product_id": product, "quantity": rng.randint(1, 3),
+                                  "unit_price": prices[product]})
+            db.execute(insert(Order), orders)
+            db.execute(insert(OrderItem), items)
+        db.commit()
+
+
+def close(a, b):
+    return all(abs(a[m] - b[m]) <= 1e-6 * max(1.0, abs(b[m])) + 0.01 for m in vendor_analytics.METRICS)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=200000)
+    parser.add_argument("--vendors", type=int, default=200)
+    parser.add_argument("--days", type=int, default=730)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--checkouts", type=int, default=200)
+    args = parser.parse_args()
+
+    init_db()
+    rng = random.Random(19)
+    started = time.perf_counter()
+    seed(args, rng)
+    print(f"seeded {args.orders} orders over {args.days} days, {args.vendors} vendors in {time.perf_counter() - started:.1f}s")
+
+    with SessionLocal() as db:
+        rebuild_ms, rows = timed(lambda: vendor_analytics.rebuild(db))
+        db.commit()
+    print(f"rebuild: {rows} vendor-day rows in {rebuild_ms:.0f} ms\n")
+
+    sales = vendor_analytics.VendorSales()
+    today = datetime.datetime.utcnow().date()
+    naive_ms, cold_ms, warm_ms = [], [], []
+    with SessionLocal() as db:
+        for _ in range(args.queries):
+            vendor_id = rng.randint(1, args.vendors)
+            start = today - datetime.timedelta(days=rng.randint(0, args.days))
+            end = min(today, start + datetime.timedelta(days=rng.randint(0, args.days)))
+            ms, expected = timed(lambda: naive_totals(db, vendor_id, start, end))
+            naive_ms.append(ms)
+            sales.clear()
+            ms, cold = timed(lambda: sales.totals(db, vendor_id, start, end))
+            cold_ms.append(ms)
+            ms, warm = timed(lambda: sales.totals(db, vendor_id, start, end))
+            warm_ms.append(ms)
+            assert close(cold, expected) and close(warm, expected), (vendor_id, start, end, cold, expected)
+
+    def avg(values):
+        return sum(values) / len(values)
+
+    print(f"{'path':<16} {'avg ms':>9} {'max ms':>9}")
+    for name, values in (("naive join scan", naive_ms), ("prefix, cold", cold_ms), ("prefix, warm", warm_ms)):
+        print(f"{name:<16} {avg(values):>9.3f} {max(values):>9.3f}")
+
+    # Incremental maintenance through the real checkout must agree with a rebuild
+    with SessionLocal() as db:
+        product_ids = db.execute(select(Product.id)).scalars().all()
+        order_ids = []
+        for _ in range(args.checkouts):
+            cart = [p1_marketplace.CartItem(product_id=pid, quantity=rng.randint(1, 3)) for pid in rng.sample(product_ids, rng.randint(1, 4))]
+            placed = p1_marketplace.checkout(p1_marketplace.CheckoutRequest(customer_id=1, items=cart, payment_method="upi",
+                                                                            shipping_address="Pune"), db)
+            order_ids.append(placed["order_id"])
+        # Cancellations are taken back out incrementally; rebuild skips them
+        cancelled = rng.sample(order_ids, len(order_ids) // 5)
+        for order_id in cancelled:
+            assert vendor_analytics.cancel_order(db, order_id)
+        if cancelled:
+            assert not vendor_analytics.cancel_order(db, cancelled[0]), "cancelled twice"
+        db.commit()
+        # A vendor whose only orders were cancelled keeps an all-zero row
+        incremental = {row[:2]: row[2:] for row in db.execute(
+            select(VendorDailySales.vendor_id, VendorDailySales.day, VendorDailySales.revenue, VendorDailySales.units,
+                   VendorDailySales.orders, VendorDailySales.commission).where(VendorDailySales.day == today)).all()
+            if row[4] != 0}
+        vendor_analytics.rebuild(db, since=today)
+        db.commit()
+        rebuilt = {row[:2]: row[2:] for row in db.execute(
+            select(VendorDailySales.vendor_id, VendorDailySales.day, VendorDailySales.revenue, VendorDailySales.units,
+                   VendorDailySales.orders, VendorDailySales.commission).where(VendorDailySales.day == today)).all()}
+    assert incremental.keys() == rebuilt.keys()
+    for key, values in rebuilt.items():
+        assert close(dict(zip(vendor_analytics.METRICS, incremental[key])), dict(zip(vendor_analytics.METRICS, values))), key
+    print(f"\n{args.checkouts} checkouts, {len(cancelled)} cancelled: incremental rows for today match a rebuild ({len(rebuilt)} vendors)")
+    print(sales.stats())
+
+
+if __name__ == "__main__":
+    main()
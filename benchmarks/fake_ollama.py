@@ -0,0 +1,129 @@
+"""
+Minimal stand-in for the Ollama HTTP API used by the benchmarks.
+
+Implements /api/chat (plain and streamed), /api/generate (model warm-up),
+/api/ps and /api/tags with a configurable per-request latency, so routing,
+caching and scheduling can be exercised without a GPU.
+
+    python benchmarks/fake_ollama.py --port 11435 --latency 0.2
+"""
+import json
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _drop_if_down(self):
+        # A "killed" node resets connections instead of answering
+        if self.server.down:
+            self.close_connection = True
+            return True
+        return False
+
+    def do_GET(self):
+        if self._drop_if_down():
+            return
+        if self.path in ("/api/ps", "/api/tags"):
+            self._send_json({"models": [{"name": m} for m in sorted(self.server.loaded_models)]})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if self._drop_if_down():
+            return
+        model = payload.get("model", "phi3")
+        tag = model if ":" in model else f"{model}:latest"
+        with self.server.lock:
+            self.server.requests += 1
+
+        if tag not in self.server.loaded_models:
+            time.sleep(self.server.load_latency)
+            self.server.loaded_models.add(tag)
+
+        if self.path == "/api/generate":
+            self._send_json({"model": model, "response": "", "done": True})
+            return
+        if self.path != "/api/chat":
+            self._send_json({"error": "not found"}, 404)
+            return
+
+        reply = self.server.responder(payload)
+        if not payload.get("stream"):
+            time.sleep(self.server.latency)
+            self._send_json({"model": model, "message": {"role": "assistant", "content": reply}, "done": True})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = reply.split(" ")
+        try:
+            for i, word in enumerate(words):
+                time.sleep(self.server.latency / max(1, len(words)))
+                token = word if i == 0 else " " + word
+                self._chunk({"model": model, "message": {"role": "assistant", "content": token}, "done": False})
+            self._chunk({"model": model, "message": {"role": "assistant", "content": ""}, "done": True})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            with self.server.lock:
+                self.server.cancelled += 1
+
+    def _chunk(self, data):
+        line = (json.dumps(data) + "\n").encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+
+def echo_responder(payload: dict) -> str:
+    messages = payload.get("messages") or [{}]
+    return f"Echo: {messages[-1].get('content', '')}"
+
+
+def start_fake_ollama(port: int = 0, latency: float = 0.05, load_latency: float = 0.0, models=("phi3",), responder=echo_responder):
+    """Starts a fake Ollama on a daemon thread and returns the server; `server.url` is its base URL."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeOllamaHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.load_latency = load_latency
+    server.loaded_models = {m if ":" in m else f"{m}:latest" for m in models}
+    server.responder = responder
+    server.requests = 0
+    server.cancelled = 0
+    server.down = False
+    server.lock = threading.Lock()
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--load-latency", type=float, default=1.0)
+    args = parser.parse_args()
+    srv = start_fake_ollama(args.port, args.latency, args.load_latency, models=())
+    print(f"Fake Ollama listening on {srv.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        srv.shutdown()
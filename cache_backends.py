@@ -0,0 +1,167 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+
+class MemoryBackend:
+    """
+    In-process LRU store with a per-entry TTL. Values are plain strings.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at and expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else 0
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteBackend:
+    """
+    Disk-backed store that survives restarts. LRU is approximated with an
+    `accessed_at` column; once the table grows past `max_entries` the least
+    recently used tenth is evicted in one statement.
+    """
+
+    # Hits only rewrite accessed_at when it is older than this, to keep reads cheap
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, path: str, max_entries: int = 100000, ttl: float = 86400, table: str = "cache"):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_accessed ON {table} (accessed_at)")
+        self._count = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at, accessed_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at, accessed_at = row
+            if expires_at and expires_at < now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._count -= 1
+                return None
+            if now - accessed_at > self.TOUCH_INTERVAL:
+                self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            return value
+
+    def set(self, key: str, value: str, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = now + ttl if ttl else 0
+        with self._lock:
+            cur = self._conn.execute(
+                f"INSERT OR IGNORE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now),
+            )
+            if cur.rowcount:
+                self._count += 1
+            else:
+                self._conn.execute(
+                    f"UPDATE {self.table} SET value = ?, expires_at = ?, accessed_at = ? WHERE key = ?",
+                    (value, expires_at, now, key),
+                )
+            if self._count > self.max_entries:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at != 0 AND expires_at < ?", (now,))
+        self._count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        overflow = self._count - int(self.max_entries * 0.9)
+        if overflow > 0:
+            self._conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY accessed_at LIMIT ?)",
+                (overflow,),
+            )
+            self._count -= overflow
+
+    def delete(self, key: str):
+        with self._lock:
+            cur = self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            self._count -= cur.rowcount
+
+    def __len__(self):
+        return self._count
+
+
+class RedisBackend:
+    """
+    Shared store for multiple uvicorn workers. Entries expire via Redis TTLs;
+    size-bounded LRU is delegated to the server's `maxmemory-policy allkeys-lru`.
+    """
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = "cache:", ttl: float = 3600):
+        import redis
+
+        self.prefix = prefix
+        self.ttl = ttl
+        self._redis = redis.Redis.from_url(url, decode_responses=True, socket_timeout=1.0)
+
+    def get(self, key: str):
+        return self._redis.get(self.prefix + key)
+
+    def set(self, key: str, value: str, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        self._redis.set(self.prefix + key, value, ex=int(ttl) if ttl else None)
+
+    def delete(self, key: str):
+        self._redis.delete(self.prefix + key)
+
+    def __len__(self):
+        return 0
+
+
+def make_backend(kind: str, max_entries: int, ttl: float, path: str = None, prefix: str = "cache:"):
+    """Builds a backend by name: memory, sqlite or redis."""
+    kind = (kind or "memory").lower()
+    if kind == "sqlite":
+        return SQLiteBackend(path, max_entries=max_entries, ttl=ttl)
+    if kind == "redis":
+        return RedisBackend(prefix=prefix, ttl=ttl)
+    return MemoryBackend(max_entries=max_entries, ttl=ttl)
@@ -0,0 +1,89 @@
+import os
+import time
+import secrets
+import threading
+
+from cache_backends import MemoryBackend, REDIS_URL
+
+# memory: per-process counter; redis: shared by every uvicorn worker
+CATALOG_VERSION_BACKEND = os.getenv("CATALOG_VERSION_BACKEND", "memory")
+CATALOG_PAGE_CACHE_ENTRIES = int(os.getenv("CATALOG_PAGE_CACHE_ENTRIES", "2000"))
+# Upper bound on how stale a page can be when another process changed the
+# catalog and this one cannot see the bump (per-process version counter)
+CATALOG_PAGE_CACHE_TTL = float(os.getenv("CATALOG_PAGE_CACHE_TTL", "30"))
+CATALOG_VERSION_KEY = "catalog:version"
+
+
+class CatalogVersion:
+    """
+    Monotonic counter bumped on every product write. Catalog ETags embed it,
+    so a bump invalidates every cached page at once.
+    """
+
+    def __init__(self, backend: str = CATALOG_VERSION_BACKEND):
+        self._lock = threading.Lock()
+        self._local = 1
+        self._nonce = secrets.token_hex(4)
+        self._redis = None
+        if backend == "redis":
+            try:
+                import redis
+
+                self._redis = redis.Redis.from_url(REDIS_URL, decode_responses=True, socket_timeout=0.5)
+                self._redis.setnx(CATALOG_VERSION_KEY, 1)
+            except Exception as e:
+                print(f"[CATALOG] Redis unavailable, using a per-process version counter: {e}")
+                self._redis = None
+
+    def get(self) -> int:
+        if self._redis is not None:
+            try:
+                return int(self._redis.get(CATALOG_VERSION_KEY) or 1)
+            except Exception as e:
+                print(f"[CATALOG] Redis version read failed: {e}")
+        return self._local
+
+    def tag(self) -> str:
+        """
+        Version as embedded in ETags. The shared Redis counter means the same
+        thing in every worker; a per-process counter does not, so its tag
+        carries this process's nonce and rolls over every
+        CATALOG_PAGE_CACHE_TTL seconds to pick up writes made elsewhere.
+        """
+        if self._redis is not None:
+            try:
+                return str(int(self._redis.get(CATALOG_VERSION_KEY) or 1))
+            except Exception as e:
+                print(f"[CATALOG] Redis version read failed: {e}")
+        window = int(time.time() // CATALOG_PAGE_CACHE_TTL) if CATALOG_PAGE_CACHE_TTL > 0 else 0
+        return f"{self._nonce}.{self._local}.{window}"
+
+    def bump(self) -> int:
+        with self._lock:
+            self._local += 1
+        if self._redis is not None:
+            try:
+                return int(self._redis.incr(CATALOG_VERSION_KEY))
+            except Exception as e:
+                print(f"[CATALOG] Redis version bump failed: {e}")
+        return self._local
+
+
+_version = None
+_version_lock = threading.Lock()
+# Serialized catalog pages keyed by ETag; stale versions simply stop being asked for
+page_cache = MemoryBackend(max_entries=CATALOG_PAGE_CACHE_ENTRIES, ttl=CATALOG_PAGE_CACHE_TTL)
+
+
+def get_catalog_version() -> CatalogVersion:
+    global _version
+    if _version is None:
+        with _version_lock:
+            if _version is None:
+                _version = CatalogVersion()
+    return _version
+
+
+def bump_catalog_version() -> int:
+    """Call after committing any change to products (stock, price, activation, new rows)."""
+    return get_catalog_version().bump()
@@ -1,6 +1,5 @@
 import os
 from celery import Celery
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
@@ -29,10 +28,37 @@ def send_async_email(to_email: str, subject: str, body_html: str):
         msg['Subject'] = subject
         msg.attach(MIMEText(body_html, 'html'))
 
-        with smtplib.SMTP('smtp.gmail.com', 587) as server:
-            server.starttls()
-            server.login(sender_email, sender_password)
-            server.send_message(msg)
+        # Sessions stay open across tasks handled by this worker process
+        from smtp_transport import get_smtp_transport
+        get_smtp_transport().send(msg)
         return f"Sent to {to_email}"
     except Exception as e:
         return str(e)
+
+@celery_app.task(name="llm.generate")
+def generate_llm_response(messages: list, model: str = "phi3", options: dict = None, format: str = None):
+    """
+    Runs a background Ollama generation on a worker (LLM_SCHEDULER_MODE=celery).
+    Errors are returned as data so the API process can map them back.
+    """
+    from ollama_client import OllamaTimeout, OllamaUnavailable
+    from ollama_router import get_ollama_router
+
+    try:
+        return {"data": get_ollama_router().chat(messages, model=model, options=options, format=format)}
+    except OllamaTimeout as e:
+        return {"error": str(e), "kind": "timeout"}
+    except OllamaUnavailable as e:
+        return {"error": str(e), "kind": "unavailable"}
+    except Exception as e:
+        return {"error": str(e), "kind": "error"}
+
+@celery_app.task(name="registration.step")
+def run_registration_step(registration_id: str, step: str, user: dict):
+    """
+    One attempt at a registration side effect (REGISTRATION_PIPELINE_MODE=celery).
+    Status and retries are handled by the pipeline, not by Celery.
+    """
+    from registration_pipeline import get_registration_pipeline
+
+    get_registration_pipeline().run_step(registration_id, step, user)
@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import sessionmaker
 from models import Base
 import os
@@ -11,6 +12,30 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so indexes added later to the
+    # models would never reach an existing database without this
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+    # ...and the same goes for nullable columns added to existing tables
+    inspector = inspect(engine)
+    quote = engine.dialect.identifier_preparer
+    # Every worker runs this at startup; on PostgreSQL the loser of the race is a no-op
+    if_not_exists = "IF NOT EXISTS " if engine.dialect.name == "postgresql" else ""
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            try:
+                with engine.begin() as conn:
+                    conn.execute(text(f"ALTER TABLE {quote.format_table(table)} "
+                                      f"ADD COLUMN {if_not_exists}{quote.quote(column.name)} {column_type}"))
+            except DBAPIError:
+                # Elsewhere another worker may have added it first (duplicate column)
+                if column.name not in {c["name"] for c in inspect(engine).get_columns(table.name)}:
+                    raise
 
 def get_db():
     db = SessionLocal()
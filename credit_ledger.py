@@ -0,0 +1,411 @@
+"""
+Credit metering for the paid SaaS features (/ai-writer): reserve a credit
+before generating, commit it once the output has been delivered, refund
+it if generation fails.
+
+credit_accounts holds each user's balance and credit_ledger is the
+append-only audit trail: a balance always equals the sum of the user's
+ledger amounts. A user's credits are carried over from
+hackathon_data.credits (as a "grant" entry) the first time they are
+metered. From then on the ledger is authoritative and the Supabase column
+is a mirror, updated after each flush.
+
+Reservations normally don't touch the database. Each worker leases
+credits in small blocks into a per-user in-memory bucket, and reserves
+from the bucket under a per-user lock. A lease is a conditional UPDATE
+(balance - leased >= n), so all workers together can never lease more
+than the balance. Committed usage is written every CREDIT_FLUSH_INTERVAL
+in one transaction: the ledger rows, plus one UPDATE per user. Unused
+tokens go back after CREDIT_LEASE_IDLE seconds without use.
+
+If a worker dies, its leases are released once they have gone
+CREDIT_LEASE_TTL without a heartbeat. Any usage it had not yet flushed is
+lost, in the user's favour.
+"""
+import os
+import time
+import uuid
+import datetime
+import threading
+
+from sqlalchemy import bindparam, insert, select, update
+from sqlalchemy.exc import IntegrityError
+
+from models import CreditAccount, CreditLedgerEntry
+
+CREDIT_LEASE_SIZE = int(os.getenv("CREDIT_LEASE_SIZE", "10"))
+CREDIT_FLUSH_INTERVAL = float(os.getenv("CREDIT_FLUSH_INTERVAL", "0.5"))
+CREDIT_LEASE_IDLE = float(os.getenv("CREDIT_LEASE_IDLE", "5"))
+CREDIT_LEASE_TTL = float(os.getenv("CREDIT_LEASE_TTL", "60"))
+# Reservations neither committed nor refunded by then (a crashed handler) are refunded
+CREDIT_RESERVATION_TTL = float(os.getenv("CREDIT_RESERVATION_TTL", "900"))
+
+
+class UnknownUser(LookupError):
+    """No such user to meter."""
+
+
+class InsufficientCredits(Exception):
+    """The user has no credit left."""
+
+
+class Reservation:
+    __slots__ = ("id", "email", "created_at")
+
+    def __init__(self, email: str):
+        self.id = uuid.uuid4().hex
+        self.email = email
+        self.created_at = time.monotonic()
+
+
+class _Bucket:
+    """One user's leased credits in this worker. Guarded by `lock`."""
+
+    __slots__ = ("lock", "lease_lock", "tokens", "reserved", "used", "balance", "touched", "empty_at", "dead")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.lease_lock = threading.Lock()  # one lease in flight per user per worker; taken before `lock`
+        self.tokens = 0  # leased, free to reserve
+        self.reserved = 0  # leased, reserved, not yet settled
+        self.used = []  # committed ledger rows waiting for the next flush
+        self.balance = None  # balance as of the last lease or flush
+        self.touched = time.monotonic()
+        self.empty_at = None  # when a lease last found the account empty
+        self.dead = False  # dropped from the bucket table; callers must fetch a fresh one
+
+
+class CreditLedger:
+    def __init__(self, session_factory=None, source=None, mirror=None, lease_size: int = CREDIT_LEASE_SIZE,
+                 flush_interval: float = CREDIT_FLUSH_INTERVAL, lease_idle: float = CREDIT_LEASE_IDLE,
+                 lease_ttl: float = CREDIT_LEASE_TTL, reservation_ttl: float = CREDIT_RESERVATION_TTL):
+        if session_factory is None:
+            from config_db import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+        self.source = source  # email -> starting credits, None for an unknown user
+        self.mirror = mirror  # (email, balance) after a flush changed the balance
+        self.lease_size = lease_size
+        self.flush_interval = flush_interval
+        self.lease_idle = lease_idle
+        self.lease_ttl = lease_ttl
+        self.reservation_ttl = reservation_ttl
+        self._buckets = {}
+        self._buckets_lock = threading.Lock()
+        self._reservations = {}  # id -> Reservation, outstanding
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_recovery = 0.0
+        self.reserved = 0
+        self.committed = 0
+        self.refunded = 0
+        self.rejected = 0
+        self.expired = 0
+        self.leases = 0
+        self.flushes = 0
+        self.flushed_entries = 0
+        self.flush_errors = 0
+
+    def _count(self, field: str, n: int = 1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + n)
+
+    def _bucket(self, email: str) -> _Bucket:
+        with self._buckets_lock:
+            bucket = self._buckets.get(email)
+            if bucket is None:
+                bucket = self._buckets[email] = _Bucket()
+            return bucket
+
+    # ---------- database ----------
+
+    def _open(self, db, email: str):
+        """Creates the account from the user's starting credits, recorded as a grant."""
+        credits = self.source(email) if self.source is not None else None
+        if credits is None:
+            raise UnknownUser(email)
+        credits = max(int(credits), 0)
+        try:
+            db.add(CreditAccount(email=email, balance=credits, leased=0))
+            db.add(CreditLedgerEntry(email=email, kind="grant", amount=credits, feature="import"))
+            db.commit()
+        except IntegrityError:
+            # Another worker opened it first
+            db.rollback()
+
+    def _lease(self, bucket: _Bucket, email: str) -> int:
+        """Moves up to lease_size credits from the account into the bucket; returns how many."""
+        with self.session_factory() as db:
+            while True:
+                row = db.execute(
+                    select(CreditAccount.balance, CreditAccount.leased).where(CreditAccount.email == email)
+                ).first()
+                if row is None:
+                    # Hand the connection back while the source is asked (it may need one of its own)
+                    db.rollback()
+                    self._open(db, email)
+                    continue
+                bucket.balance = row.balance
+                available = row.balance - row.leased
+                if available <= 0:
+                    bucket.empty_at = time.monotonic()
+                    return 0
+                # At most a quarter of what's left, so a low balance isn't stranded in one worker's bucket
+                n = min(self.lease_size, max(1, available // 4))
+                result = db.execute(
+                    update(CreditAccount)
+                    .where(CreditAccount.email == email, CreditAccount.balance - CreditAccount.leased >= n)
+                    .values(leased=CreditAccount.leased + n, leased_at=datetime.datetime.utcnow())
+                )
+                db.commit()
+                if result.rowcount:
+                    self._count("leases")
+                    return n
+                # Another worker leased in between; look again
+
+    def flush(self, release_all: bool = False) -> int:
+        """
+        Writes committed usage to the ledger, returns idle (or, with
+        release_all, all) unused tokens and heartbeats the leases still held.
+        Returns the number of ledger rows written.
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = [r for r in self._reservations.values() if now - r.created_at > self.reservation_ttl]
+        for reservation in expired:
+            if self.refund(reservation):
+                print(f"[CREDITS] Reservation {reservation.id} for {reservation.email} expired unsettled, refunded")
+                self._count("expired")
+
+        with self._buckets_lock:
+            buckets = list(self._buckets.items())
+        batches = []  # (email, bucket, usage rows, tokens released)
+        for email, bucket in buckets:
+            with bucket.lock:
+                used, bucket.used = bucket.used, []
+                release = 0
+                if bucket.tokens and (release_all or now - bucket.touched > self.lease_idle):
+                    release, bucket.tokens = bucket.tokens, 0
+                held = bucket.tokens or bucket.reserved
+            if used or release or held:
+                batches.append((email, bucket, used, release))
+        if not batches:
+            self._drop_idle(now)
+            return 0
+
+        entries = [entry for _, _, used, _ in batches for entry in used]
+        changed = [email for email, _, used, _ in batches if used]
+        try:
+            with self.session_factory() as db:
+                if entries:
+                    db.execute(insert(CreditLedgerEntry.__table__), entries)
+                table = CreditAccount.__table__
+                db.execute(
+                    update(table).where(table.c.email == bindparam("b_email"))
+                    .values(balance=table.c.balance - bindparam("b_used"),
+                            leased=table.c.leased - bindparam("b_freed"), leased_at=bindparam("b_at")),
+                    [{"b_email": email, "b_used": len(used), "b_freed": len(used) + release,
+                      "b_at": datetime.datetime.utcnow()} for email, _, used, release in batches],
+                )
+                balances = dict(db.execute(
+                    select(CreditAccount.email, CreditAccount.balance).where(CreditAccount.email.in_(changed))
+                ).all()) if changed else {}
+                db.commit()
+        except Exception:
+            # Keep everything for the next attempt
+            for _, bucket, used, release in batches:
+                with bucket.lock:
+                    bucket.used[:0] = used
+                    bucket.tokens += release
+            self._count("flush_errors")
+            raise
+
+        for email, bucket, used, _ in batches:
+            if email in balances:
+                with bucket.lock:
+                    bucket.balance = balances[email]
+        self._count("flushes")
+        self._count("flushed_entries", len(entries))
+        self._drop_idle(now)
+        if self.mirror is not None:
+            for email, balance in balances.items():
+                try:
+                    self.mirror(email, balance)
+                except Exception as e:
+                    print(f"[CREDITS] Mirroring balance of {email} failed: {e}")
+        return len(entries)
+
+    def _drop_idle(self, now: float):
+        """Forgets buckets that hold nothing and have not been used for a while."""
+        with self._buckets_lock:
+            for email, bucket in list(self._buckets.items()):
+                # A lease in flight would land its tokens in a dropped bucket
+                if not bucket.lease_lock.acquire(blocking=False):
+                    continue
+                try:
+                    with bucket.lock:
+                        if (not bucket.tokens and not bucket.reserved and not bucket.used
+                                and now - bucket.touched > self.lease_idle):
+                            bucket.dead = True
+                            del self._buckets[email]
+                finally:
+                    bucket.lease_lock.release()
+
+    def recover_stale_leases(self) -> int:
+        """Releases leases of workers that stopped heartbeating (crashed); returns accounts touched."""
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.lease_ttl)
+        with self.session_factory() as db:
+            result = db.execute(
+                update(CreditAccount)
+                .where(CreditAccount.leased > 0, CreditAccount.leased_at < cutoff)
+                .values(leased=0)
+            )
+            db.commit()
+        if result.rowcount:
+            print(f"[CREDITS] Released stale leases on {result.rowcount} accounts")
+        return result.rowcount
+
+    # ---------- metering ----------
+
+    def reserve(self, email: str) -> Reservation:
+        """
+        Holds one credit for a generation. Raises UnknownUser or
+        InsufficientCredits; otherwise commit() or refund() the reservation.
+        """
+        while True:
+            bucket = self._bucket(email)
+            if self._take(bucket):
+                break
+            if bucket.dead:
+                continue
+            # The database round trip holds only the lease lock, so commits and refunds don't wait on it
+            with bucket.lease_lock:
+                if self._take(bucket):
+                    break
+                if bucket.dead:
+                    continue
+                # Just found empty: don't re-read the account for every rejected request
+                if bucket.empty_at is None or time.monotonic() - bucket.empty_at > self.flush_interval:
+                    leased = self._lease(bucket, email)
+                    with bucket.lock:
+                        bucket.tokens += leased
+                    if self._take(bucket):
+                        break
+            self._count("rejected")
+            raise InsufficientCredits(email)
+        reservation = Reservation(email)
+        with self._lock:
+            self._reservations[reservation.id] = reservation
+            self.reserved += 1
+        return reservation
+
+    def _take(self, bucket: _Bucket) -> bool:
+        with bucket.lock:
+            if bucket.dead or not bucket.tokens:
+                return False
+            bucket.tokens -= 1
+            bucket.reserved += 1
+            bucket.touched = time.monotonic()
+            return True
+
+    def _settle(self, reservation: Reservation) -> bool:
+        with self._lock:
+            if self._reservations.pop(reservation.id, None) is None:
+                print(f"[CREDITS] Reservation {reservation.id} was already settled")
+                return False
+        return True
+
+    def commit(self, reservation: Reservation, feature: str = None) -> int:
+        """Spends the reserved credit. Returns the user's remaining credits (as far as this worker knows)."""
+        bucket = self._buckets.get(reservation.email)
+        if not self._settle(reservation):
+            return self.remaining(reservation.email)
+        with bucket.lock:
+            bucket.reserved -= 1
+            bucket.touched = time.monotonic()
+            bucket.used.append({
+                "email": reservation.email, "kind": "usage", "amount": -1, "reservation_id": reservation.id,
+                "feature": feature, "created_at": datetime.datetime.utcnow(),
+            })
+        self._count("committed")
+        return self.remaining(reservation.email)
+
+    def refund(self, reservation: Reservation) -> bool:
+        """Returns the reserved credit to the user. False if it was already settled."""
+        bucket = self._buckets.get(reservation.email)
+        if not self._settle(reservation):
+            return False
+        with bucket.lock:
+            bucket.reserved -= 1
+            bucket.tokens += 1
+        self._count("refunded")
+        return True
+
+    def remaining(self, email: str) -> int:
+        bucket = self._buckets.get(email)
+        if bucket is None or bucket.balance is None:
+            return 0
+        with bucket.lock:
+            return bucket.balance - len(bucket.used)
+
+    # ---------- lifecycle ----------
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.monotonic() - self._last_recovery > self.lease_ttl:
+                    self._last_recovery = time.monotonic()
+                    self.recover_stale_leases()
+            except Exception as e:
+                print(f"[CREDITS] Flush failed, will retry: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="credit-ledger", daemon=True)
+            self._thread.start()
+
+    def close(self, timeout: float = 10):
+        """Stops the flusher, writes pending usage and returns all unused tokens."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        try:
+            self.flush(release_all=True)
+        except Exception as e:
+            print(f"[CREDITS] Final flush failed: {e}")
+
+    def stats(self) -> dict:
+        with self._buckets_lock:
+            buckets = list(self._buckets.values())
+        return {
+            "users": len(buckets),
+            "tokens_held": sum(b.tokens for b in buckets),
+            "outstanding_reservations": len(self._reservations),
+            "pending_entries": sum(len(b.used) for b in buckets),
+            "reserved": self.reserved,
+            "committed": self.committed,
+            "refunded": self.refunded,
+            "rejected": self.rejected,
+            "expired": self.expired,
+            "leases": self.leases,
+            "flushes": self.flushes,
+            "flushed_entries": self.flushed_entries,
+            "flush_errors": self.flush_errors,
+        }
+
+
+_ledger = None
+_ledger_lock = threading.Lock()
+
+
+def get_credit_ledger() -> CreditLedger:
+    global _ledger
+    if _ledger is None:
+        with _ledger_lock:
+            if _ledger is None:
+                from database import get_user_credits, set_user_credits
+                _ledger = CreditLedger(source=get_user_credits, mirror=set_user_credits)
+    return _ledger
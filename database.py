@@ -3,12 +3,9 @@ from supabase import create_client, Client
 from dotenv import load_dotenv
 import razorpay
 from twilio.rest import Client as TwilioClient
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
-from fpdf import FPDF
-import datetime
 
 # Load keys from .env file
 load_dotenv()
@@ -31,7 +28,7 @@ def create_razorpay_order(amount, currency="INR"):
         # Re-raise the exception or return it so main.py can capture it
         raise e
 
-def send_email_via_gmail(to_email, subject, body_html, attachment_path=None, attachment_name=None):
+def send_email_via_gmail(to_email, subject, body_html, attachment_path=None, attachment_name=None, attachment_data=None):
     sender_email = os.getenv("EMAIL_USER")
     sender_password = os.getenv("EMAIL_PASS")
 
@@ -47,19 +44,20 @@ def send_email_via_gmail(to_email, subject, body_html, attachment_path=None, att
 
         msg.attach(MIMEText(body_html, 'html'))
 
-        if attachment_path and attachment_name:
+        if (attachment_path or attachment_data) and attachment_name:
             try:
-                with open(attachment_path, "rb") as f:
-                    part = MIMEApplication(f.read(), Name=attachment_name)
+                if attachment_data is None:
+                    with open(attachment_path, "rb") as f:
+                        attachment_data = f.read()
+                part = MIMEApplication(attachment_data, Name=attachment_name)
                 part['Content-Disposition'] = f'attachment; filename="{attachment_name}"'
                 msg.attach(part)
             except Exception as e:
                 print(f"[ERROR] Could not attach file: {e}")
 
-        with smtplib.SMTP('smtp.gmail.com', 587) as server:
-            server.starttls()
-            server.login(sender_email, sender_password)
-            server.send_message(msg)
+        # Pooled, already logged-in session (see smtp_transport.py)
+        from smtp_transport import get_smtp_transport
+        get_smtp_transport().send(msg)
         
         print(f"[SUCCESS] Email sent to {to_email}")
         return "success"
@@ -68,48 +66,54 @@ def send_email_via_gmail(to_email, subject, body_html, attachment_path=None, att
         return str(e)
 
 def generate_invoice_pdf(user_name, payment_id):
-    """Generates a dynamic PDF invoice and returns the local file path."""
-    if not payment_id:
-        payment_id = "N/A"
-        
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("helvetica", "B", 16)
-    pdf.cell(0, 10, "SaaS Starter Template - Official Invoice", ln=True, align="C")
-    
-    pdf.ln(10) # Line break
-    
-    pdf.set_font("helvetica", "", 12)
-    pdf.cell(0, 10, f"Date: {datetime.date.today()}", ln=True)
-    pdf.cell(0, 10, f"Customer Name: {user_name}", ln=True)
-    pdf.cell(0, 10, f"Transaction ID: {payment_id}", ln=True)
-    
-    pdf.ln(10)
-    pdf.set_font("helvetica", "B", 12)
-    pdf.cell(100, 10, "Description", border=1)
-    pdf.cell(40, 10, "Qty", border=1, align="C")
-    pdf.cell(50, 10, "Amount", border=1, align="R")
-    pdf.ln()
-    
-    pdf.set_font("helvetica", "", 12)
-    pdf.cell(100, 10, "SaaS App Subscription", border=1)
-    pdf.cell(40, 10, "1", border=1, align="C")
-    pdf.cell(50, 10, "INR 999.00", border=1, align="R")
-    pdf.ln(20)
-    
-    pdf.set_font("helvetica", "I", 10)
-    pdf.cell(0, 10, "Thank you for your business!", ln=True, align="C")
-    
-    file_path = f"temp_invoice_{payment_id}.pdf"
-    pdf.output(file_path)
-    return file_path
+    """Renders the subscription invoice in memory and returns the PDF bytes (see invoice_renderer.py)."""
+    from invoice_renderer import get_invoice_renderer, registration_invoice
+    return get_invoice_renderer().render(registration_invoice(user_name, payment_id))
+
+_twilio_client = None
+
+def get_twilio_client():
+    """Shared Twilio client (it keeps an HTTP session), or None if credentials are missing."""
+    global _twilio_client
+    if _twilio_client is None:
+        twilio_sid = os.getenv("TWILIO_SID")
+        twilio_token = os.getenv("TWILIO_TOKEN")
+        if not twilio_sid or not twilio_token:
+            return None
+        _twilio_client = TwilioClient(twilio_sid, twilio_token)
+    return _twilio_client
+
+def send_whatsapp_message(to_phone, body):
+    """
+    Sends a WhatsApp message from the Twilio sandbox number. Returns the message SID,
+    or None if Twilio credentials are missing. Raises on Twilio errors.
+    """
+    twilio_client = get_twilio_client()
+    if twilio_client is None:
+        print("[ERROR] Twilio Credentials Missing!")
+        return None
+
+    # Ensure number formatting
+    formatted_phone = to_phone
+    if not formatted_phone.startswith("whatsapp:"):
+        formatted_phone = f"whatsapp:{formatted_phone}"
+
+    print(f"Attempting to send WhatsApp message to {formatted_phone}...")
+    message = twilio_client.messages.create(
+        from_='whatsapp:+14155238886', # Twilio Sandbox Number
+        body=body,
+        to=formatted_phone
+    )
+    print(f"[SUCCESS] WhatsApp message sent. SID: {message.sid}")
+    return message.sid
 
 def process_framework_action(user_name, user_email, user_phone, payment_id=None, initial_credits=5):
     """
     The 'Magic' Function (SaaS Framework):
     1. Saves user/action to Database with INITIAL CREDITS
-    2. Sends a Confirmation Email (via Gmail) with PDF Invoice
-    3. Sends a WhatsApp Notification
+    2. Hands the PDF invoice, confirmation email (via Gmail) and WhatsApp
+       notification to the registration pipeline, which runs them
+       concurrently in the background (see registration_pipeline.py)
     """
     
     results = {}
@@ -126,77 +130,76 @@ def process_framework_action(user_name, user_email, user_phone, payment_id=None,
         }
         # Note: 'hackathon_data' table name kept for now.
         supabase.table("hackathon_data").insert(user_data).execute()
+        # Drop any cached "no such user" for this email / phone
+        from user_cache import get_user_cache
+        get_user_cache().invalidate(email=user_email, phone=user_phone)
         print(f"[SUCCESS] User {user_name} saved to Supabase.")
         results["supabase"] = "success"
     except Exception as e:
         print(f"[ERROR] Database Error: {e}")
         results["supabase"] = str(e)
+        # Nothing was registered, so don't confirm anything
+        return {"message": "Framework action failed", "results": results}
 
-    # 2. PDF Invoice & Confirmation Email
-    invoice_path = None
+    # 2. Invoice, email and WhatsApp run off the request path
+    from registration_pipeline import get_registration_pipeline
     try:
-        invoice_path = generate_invoice_pdf(user_name, payment_id)
+        registration_id = get_registration_pipeline().start(
+            {"name": user_name, "email": user_email, "phone": user_phone, "payment_id": payment_id}
+        )
+        results.update({"invoice": "queued", "email": "queued", "whatsapp": "queued"})
     except Exception as e:
-        print(f"[ERROR] PDF Gen Error: {e}")
-        
-    email_status = send_email_via_gmail(
-        user_email,
-        "Action Confirmed & Your Invoice! 🚀",
-        f"<strong>Hi {user_name}, your action was successful! Payment ID: {payment_id}</strong><p>Please find your official invoice attached to this email.</p><p>Welcome to the framework.</p>",
-        attachment_path=invoice_path,
-        attachment_name="Invoice.pdf"
-    )
-    results["email"] = email_status
-    
-    # Clean up temp invoice file
-    if invoice_path and os.path.exists(invoice_path):
-        os.remove(invoice_path)
+        # The user exists now; a failed hand-off must not turn that into an error response
+        print(f"[ERROR] Could not queue the invoice, email and WhatsApp for {user_email}: {e}")
+        registration_id = None
+        results.update({"invoice": "not_queued", "email": "not_queued", "whatsapp": "not_queued"})
 
-    # 3. Send WhatsApp Notification (via Twilio)
-    try:
-        twilio_sid = os.getenv("TWILIO_SID")
-        twilio_token = os.getenv("TWILIO_TOKEN")
-        
-        if not twilio_sid or not twilio_token:
-            print("[ERROR] Twilio Credentials Missing!")
-            results["whatsapp"] = "credentials_missing"
-        else:
-            twilio_client = TwilioClient(twilio_sid, twilio_token)
-            
-            # Ensure number formatting
-            formatted_phone = user_phone
-            if not formatted_phone.startswith("whatsapp:"):
-                formatted_phone = f"whatsapp:{formatted_phone}"
-            
-            print(f"Attempting to send WhatsApp message to {formatted_phone}...")
-            
-            message = twilio_client.messages.create(
-                from_='whatsapp:+14155238886', # Twilio Sandbox Number
-                body=f"Hello {user_name}! Your transaction was successful. Welcome to the SaaS Starter Kit! 🚀",
-                to=formatted_phone
-            )
-            print(f"[SUCCESS] WhatsApp message sent. SID: {message.sid}")
-            results["whatsapp"] = "success"
-            results["whatsapp_sid"] = message.sid
-    except Exception as e:
-        print(f"[ERROR] WhatsApp Error: {e}")
-        results["whatsapp"] = str(e)
+    return {"message": "Framework action processed successfully", "registration_id": registration_id, "results": results}
 
-    return {"message": "Framework action processed successfully", "results": results}
+def _fetch_user(field, value):
+    response = supabase.table("hackathon_data").select("*").eq(field, value).execute()
+    if response.data and len(response.data) > 0:
+        return response.data[0]
+    return None
 
-def get_user_by_email(email: str):
-    """
-    Fetch user details from the Supabase database.
-    """
+def _cached_user(field, value):
+    from user_cache import get_user_cache
     try:
-        response = supabase.table("hackathon_data").select("*").eq("email", email).execute()
-        if response.data and len(response.data) > 0:
-            return response.data[0]
-        return None
+        return get_user_cache().lookup(field, value, lambda: _fetch_user(field, value))
     except Exception as e:
         print(f"[ERROR] Fetching User Error: {e}")
         return None
 
+def get_user_by_email(email: str):
+    """
+    Fetch user details from the Supabase database (through the user cache).
+    """
+    return _cached_user("email", email)
+
+def get_user_by_phone(phone: str):
+    """
+    Fetch user details by phone number, e.g. '+919876543210' (through the user cache).
+    """
+    return _cached_user("phone", phone)
+
+def get_user_credits(email: str):
+    """
+    Current hackathon_data credits of a user, or None if there is no such user.
+    Raises if Supabase can't be reached. Used once per user, to open their credit ledger account.
+    """
+    response = supabase.table("hackathon_data").select("credits").eq("email", email).execute()
+    if response.data and len(response.data) > 0:
+        return response.data[0].get("credits") or 0
+    return None
+
+def set_user_credits(email: str, credits: int):
+    """
+    Mirrors a credit ledger balance into hackathon_data.credits.
+    """
+    supabase.table("hackathon_data").update({"credits": credits}).eq("email", email).execute()
+    from user_cache import get_user_cache
+    get_user_cache().invalidate(email=email)
+
 def process_login_action(user_email, user_name="User"):
     """
     Simulates Login and sends a Welcome Email.
@@ -0,0 +1,161 @@
+import os
+import re
+import time
+import threading
+
+# Rule scores at or past these bounds are trusted without asking the LLM. A
+# score of 0 means no signal at all, so the support bound must sit below it.
+EMAIL_INTENT_SCHEDULE_SCORE = float(os.getenv("EMAIL_INTENT_SCHEDULE_SCORE", "2"))
+EMAIL_INTENT_SUPPORT_SCORE = float(os.getenv("EMAIL_INTENT_SUPPORT_SCORE", "-1"))
+
+SCHEDULE_PATTERNS = [
+    (re.compile(r"\b(schedule|reschedule|book|set up|arrange)\b.{0,40}\b(meeting|call|demo|chat|appointment|slot|time)\b"), 2.0),
+    (re.compile(r"\b(meeting|call|demo|appointment|catch[- ]up|sync)\b"), 1.0),
+    (re.compile(r"\b(are you|would you be|will you be|is .{1,20}) (free|available)\b"), 1.5),
+    (re.compile(r"\b(availability|calendar invite|calendar|time slot)\b"), 1.0),
+    (re.compile(r"\b(let'?s|can we|could we|shall we) (meet|talk|connect|hop on)\b"), 1.5),
+]
+SUPPORT_PATTERNS = [
+    (re.compile(r"\b(error|bug|broken|crash|crashes|not working|doesn'?t work|issue|problem|fail(ed|s|ing)?)\b"), -1.5),
+    (re.compile(r"\b(refund|invoice|payment|charged|billing|password|login|log in|account|cancel)\b"), -1.0),
+    (re.compile(r"\b(how do i|how can i|help|support)\b"), -0.5),
+]
+
+_MONTH = r"(?:jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|jun(?:e)?|jul(?:y)?|aug(?:ust)?|sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)"
+_DAY = r"\d{1,2}(?:st|nd|rd|th)?"
+
+DATE_PATTERNS = [
+    re.compile(r"\b(\d{4}-\d{2}-\d{2})\b"),
+    re.compile(rf"\b({_DAY}(?: of)? {_MONTH})\b"),
+    re.compile(rf"\b({_MONTH} {_DAY})\b"),
+    re.compile(r"\b(\d{1,2}/\d{1,2}(?:/\d{2,4})?)\b"),
+    re.compile(r"\b((?:next|this|coming) (?:monday|tuesday|wednesday|thursday|friday|saturday|sunday|week))\b"),
+    re.compile(r"\b(monday|tuesday|wednesday|thursday|friday|saturday|sunday|today|tomorrow|day after tomorrow)\b"),
+]
+TIME_PATTERNS = [
+    re.compile(r"\b(\d{1,2}(?::\d{2})? ?(?:am|pm|a\.m\.|p\.m\.))"),
+    re.compile(r"\b((?:[01]?\d|2[0-3]):[0-5]\d)\b"),
+    re.compile(r"\b(noon|midday|midnight)\b"),
+    re.compile(r"\b(morning|afternoon|evening|eod|end of day)\b"),
+]
+
+
+def _first_match(patterns, text: str):
+    for pattern in patterns:
+        match = pattern.search(text)
+        if match:
+            return match.group(1)
+    return None
+
+
+def extract_date(text: str):
+    """First date-like phrase in `text` ("2025-03-05", "5th March", "next friday", "tomorrow"), or None."""
+    return _first_match(DATE_PATTERNS, text.lower())
+
+
+def extract_time(text: str):
+    """First time-like phrase in `text` ("3pm", "10:30 am", "15:00", "noon", "afternoon"), or None."""
+    found = _first_match(TIME_PATTERNS, text.lower())
+    return found.strip() if found else None
+
+
+def rule_classify(subject: str, body: str) -> dict:
+    """
+    Keyword / regex pre-classifier. Returns the intent, extracted date/time
+    and whether the rules are confident enough to skip the LLM.
+    """
+    text = f"{subject}\n{body}".lower()
+    score = sum(weight for pattern, weight in SCHEDULE_PATTERNS if pattern.search(text))
+    score += sum(weight for pattern, weight in SUPPORT_PATTERNS if pattern.search(text))
+    date, time_ = extract_date(text), extract_time(text)
+    if date or time_:
+        score += 1.0
+
+    if score >= EMAIL_INTENT_SCHEDULE_SCORE and (date or time_):
+        return {"intent": "schedule", "date": date, "time": time_, "confident": True, "score": score}
+    if score <= EMAIL_INTENT_SUPPORT_SCORE and not (date and time_):
+        return {"intent": "support", "confident": True, "score": score}
+    return {"intent": "schedule" if score > 0 else "support", "date": date, "time": time_,
+            "confident": False, "score": score}
+
+
+class IntentStats:
+    """Per-path counts and latency for the email intent router."""
+
+    PATHS = ("rules", "llm", "llm_fallback")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {p: 0 for p in self.PATHS}
+        self.total_ms = {p: 0.0 for p in self.PATHS}
+        self.max_ms = {p: 0.0 for p in self.PATHS}
+
+    def record(self, path: str, elapsed_ms: float):
+        with self._lock:
+            self.counts[path] += 1
+            self.total_ms[path] += elapsed_ms
+            self.max_ms[path] = max(self.max_ms[path], elapsed_ms)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            total = sum(self.counts.values())
+            return {
+                "classified": total,
+                "llm_calls_avoided": self.counts["rules"],
+                "llm_avoided_rate": round(self.counts["rules"] / total, 3) if total else 0.0,
+                "paths": {
+                    p: {
+                        "count": self.counts[p],
+                        "avg_ms": round(self.total_ms[p] / self.counts[p], 2) if self.counts[p] else 0.0,
+                        "max_ms": round(self.max_ms[p], 2),
+                    }
+                    for p in self.PATHS
+                },
+            }
+
+
+_stats = IntentStats()
+
+
+def _llm_classify(sender_email: str, subject: str, body: str) -> dict:
+    from ai_service import chat_json
+
+    messages = [
+        {"role": "system", "content": "You are an email intent router. Reply with a JSON object only."},
+        {"role": "user", "content": (
+            f"Analyze this email from {sender_email}: '{subject} - {body}'. "
+            'If they are asking to schedule a meeting, reply {"intent": "schedule", "date": "<date>", "time": "<time>"}. '
+            'Otherwise reply {"intent": "support"}.'
+        )},
+    ]
+    return chat_json(messages, model="phi3")
+
+
+def classify_email(sender_email: str, subject: str, body: str) -> dict:
+    """
+    Decides between the schedule and support workflows. Confident rule
+    matches never reach the LLM; the rest use Ollama structured output,
+    falling back to the rules' date/time where the model left them out.
+    """
+    started = time.perf_counter()
+    rules = rule_classify(subject, body)
+    if rules["confident"]:
+        _stats.record("rules", (time.perf_counter() - started) * 1000)
+        return {**rules, "path": "rules"}
+
+    path = "llm"
+    try:
+        parsed = _llm_classify(sender_email, subject, body)
+        intent = "schedule" if parsed.get("intent") == "schedule" else "support"
+        result = {"intent": intent, "date": parsed.get("date") or rules.get("date"),
+                  "time": parsed.get("time") or rules.get("time")}
+    except Exception as e:
+        print(f"[EMAIL INTENT] LLM classification failed, using rule guess: {e}")
+        path = "llm_fallback"
+        result = {"intent": rules["intent"], "date": rules.get("date"), "time": rules.get("time")}
+    _stats.record(path, (time.perf_counter() - started) * 1000)
+    return {**result, "confident": False, "path": path}
+
+
+def get_intent_stats() -> dict:
+    return _stats.snapshot()
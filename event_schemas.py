@@ -0,0 +1,224 @@
+"""
+Versioned schemas and a compact binary encoding for the platform's events.
+
+A binary event is MAGIC followed by a msgpack array
+    [schema_id, version, [field values in schema order (+ extras map)]]
+so the repeated key strings disappear and ISO timestamps travel as integer
+microseconds since the epoch. decode_event() reads both this and the JSON
+the producers used to send, and returns the same dict either way.
+
+Rollout: deploy consumers that use decode_event(), then list topics in
+EVENT_BINARY_TOPICS (or "*"). Events without a schema, or that don't match
+theirs (missing field, unparsable timestamp), are still sent as JSON.
+Schemas only ever grow by registering a new version; old versions stay
+registered so queued events keep decoding.
+"""
+import os
+import json
+import datetime
+import threading
+
+import msgpack
+
+# Comma-separated topics published in the binary format, or "*" for all
+EVENT_BINARY_TOPICS = {t.strip() for t in os.getenv("EVENT_BINARY_TOPICS", "").split(",") if t.strip()}
+
+# 0xC1 is never used by msgpack and can't start a JSON document
+MAGIC = b"\xc1"
+CONTENT_TYPE_BINARY = b"application/x-event-msgpack"
+CONTENT_TYPE_JSON = b"application/json"
+
+TS = "timestamp"
+_EPOCH = datetime.datetime(1970, 1, 1)
+_MICROS = datetime.timedelta(microseconds=1)
+
+
+class SchemaMismatch(ValueError):
+    pass
+
+
+class EventSchema:
+    """
+    An ordered field list. A field is a name, (name, TS) for an ISO
+    timestamp, or (name, [sub-fields]) for a nested record such as the
+    pydantic `data` payloads.
+    """
+
+    def __init__(self, name: str, schema_id: int, version: int, fields: list, type_field: str = "event_type"):
+        self.name = name
+        self.schema_id = schema_id
+        self.version = version
+        self.fields = _normalize(fields)
+        self.type_field = type_field
+
+    def encode(self, event: dict) -> list:
+        skip = (self.type_field,) if self.type_field else ()
+        return _encode_record(self.fields, event, skip)
+
+    def decode(self, values: list) -> dict:
+        event = {self.type_field: self.name} if self.type_field else {}
+        event.update(_decode_record(self.fields, values))
+        return event
+
+
+def _normalize(fields: list) -> tuple:
+    """Field specs as (name, kind) pairs, kind being None, TS or a nested tuple."""
+    out = []
+    for spec in fields:
+        name, kind = (spec, None) if isinstance(spec, str) else spec
+        out.append((name, kind if kind in (None, TS) else _normalize(kind)))
+    return tuple(out)
+
+
+def _encode_record(fields: list, record: dict, skip=()) -> list:
+    if not isinstance(record, dict):
+        raise SchemaMismatch(f"expected a record, got {type(record).__name__}")
+    values = []
+    names = set(skip)
+    for name, kind in fields:
+        names.add(name)
+        if name not in record:
+            raise SchemaMismatch(f"missing field {name!r}")
+        value = record[name]
+        if kind == TS:
+            try:
+                value = (datetime.datetime.fromisoformat(value) - _EPOCH) // _MICROS
+            except (TypeError, ValueError):
+                raise SchemaMismatch(f"{name!r} is not an ISO timestamp: {value!r}")
+        elif kind is not None:
+            value = _encode_record(kind, value)
+        values.append(value)
+    extras = {k: v for k, v in record.items() if k not in names}
+    if extras:
+        values.append(extras)
+    return values
+
+
+def _decode_record(fields: list, values: list) -> dict:
+    record = {}
+    for (name, kind), value in zip(fields, values):
+        if kind == TS:
+            value = (_EPOCH + datetime.timedelta(microseconds=value)).isoformat()
+        elif kind is not None:
+            value = _decode_record(kind, value)
+        record[name] = value
+    if len(values) > len(fields):
+        record.update(values[len(fields)])
+    return record
+
+
+class SchemaRegistry:
+    def __init__(self):
+        self._by_id = {}  # (schema_id, version) -> EventSchema
+        self._latest = {}  # name -> EventSchema
+        self._versions = {}  # name -> [EventSchema], newest first
+        self._warned = set()  # (name, version) already logged as not fitting
+        self._ids = {}  # name -> schema_id
+        self._topics = {}  # topic -> schema name, for events without an event_type
+        self._lock = threading.Lock()
+        self.counts = {"binary": 0, "json": 0, "fallback": 0}
+
+    def register(self, name: str, schema_id: int, version: int, fields: list, type_field: str = "event_type", topic: str = None):
+        if self._ids.get(name, schema_id) != schema_id:
+            raise ValueError(f"schema {name!r} already has id {self._ids[name]}")
+        if (schema_id, version) in self._by_id:
+            raise ValueError(f"{name!r} v{version} is already registered")
+        schema = EventSchema(name, schema_id, version, fields, type_field)
+        self._ids[name] = schema_id
+        self._by_id[(schema_id, version)] = schema
+        if name not in self._latest or self._latest[name].version < version:
+            self._latest[name] = schema
+        self._versions[name] = sorted(self._versions.get(name, []) + [schema], key=lambda s: -s.version)
+        if topic:
+            self._topics[topic] = name
+        return schema
+
+    def schema_for(self, topic: str, event: dict):
+        name = event.get("event_type") if isinstance(event.get("event_type"), str) else None
+        return self._latest.get(name) or self._latest.get(self._topics.get(topic))
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counts[key] += 1
+
+    def encode(self, topic: str, event: dict, binary: bool = None) -> bytes:
+        if binary is None:
+            binary = "*" in EVENT_BINARY_TOPICS or topic in EVENT_BINARY_TOPICS
+        latest = self.schema_for(topic, event) if binary else None
+        if latest is None:
+            self._count("json")
+            return json.dumps(event).encode("utf-8")
+
+        # Newest version first; producers not yet sending a newer field still fit an older one
+        error = None
+        for schema in self._versions[latest.name]:
+            try:
+                payload = msgpack.packb([schema.schema_id, schema.version, schema.encode(event)])
+            except (SchemaMismatch, TypeError) as e:
+                error = error or e
+                continue
+            self._count("binary")
+            return MAGIC + payload
+
+        self._count("fallback")
+        # Once per schema version; the fallback counter tracks how often it happens
+        if (latest.name, latest.version) not in self._warned:
+            self._warned.add((latest.name, latest.version))
+            print(f"[EVENTS] No version of {latest.name} fits this event, sending JSON: {error}")
+        return json.dumps(event).encode("utf-8")
+
+    def decode(self, raw: bytes) -> dict:
+        if raw[:1] != MAGIC:
+            return json.loads(raw)
+        schema_id, version, values = msgpack.unpackb(raw[1:])
+        schema = self._by_id.get((schema_id, version))
+        if schema is None:
+            raise ValueError(f"unknown event schema {schema_id} v{version}; upgrade this consumer")
+        return schema.decode(values)
+
+    def describe(self) -> dict:
+        return {
+            name: {"id": s.schema_id, "latest_version": s.version,
+                   "versions": sorted(v for (i, v) in self._by_id if i == s.schema_id)}
+            for name, s in sorted(self._latest.items())
+        }
+
+
+registry = SchemaRegistry()
+
+# ---------- P1 marketplace ----------
+_PRODUCT = ["name", "description", "price", "vendor_id", "stock_qty"]
+_ORDER = ["customer_id", "vendor_id", "product_id", "quantity", "total_price"]
+registry.register("checkout_completed", 1, 1, ["order_id", "amount", ("timestamp", TS)])
+# v2: published through the outbox, with its dedup key
+registry.register("checkout_completed", 1, 2, ["order_id", "amount", ("timestamp", TS), "event_id"])
+registry.register("product_created", 2, 1, [("data", _PRODUCT), ("timestamp", TS)])
+registry.register("order_placed", 3, 1, [("data", _ORDER), ("timestamp", TS)])
+# products: list of {id, name, description, vendor_id, price, stock_qty, is_active}
+registry.register("products_imported", 4, 1, ["import_id", "vendor_id", "products", ("timestamp", TS), "event_id"])
+
+# ---------- P2 finance / P3 fraud ----------
+_TRANSACTION = ["user_id", "amount", "merchant", "location"]
+registry.register("bank_sync_transaction", 10, 1, [("data", ["user_id", "plaid_token", "amount", "description"]), "category", ("timestamp", TS)])
+registry.register("transaction_processed", 11, 1, [("data", _TRANSACTION), "risk_score", ("timestamp", TS)])
+registry.register("fraud_alert", 12, 1, ["severity", "reason", ("details", _TRANSACTION)], type_field=None, topic="fraud.alerts")
+
+# ---------- P4 resume / P5 recommendations / P6 feedback ----------
+registry.register("resume_uploaded", 20, 1, ["job_id", "s3_path", ("timestamp", TS)])
+registry.register("user_behavior", 30, 1, ["event", "user_id", "product_id", ("timestamp", TS)], type_field=None, topic="user.behavior")
+registry.register("review_submitted", 40, 1, [("data", ["product_id", "user_id", "review_text"]), ("timestamp", TS)])
+registry.register("review_analyzed", 41, 1, ["product_id", "sentiment", "method", "confidence", "text"])
+
+
+def encode_event(topic: str, event: dict, binary: bool = None) -> bytes:
+    """Bytes for `event` on `topic`: binary if the topic is enabled and a schema fits, else JSON."""
+    return registry.encode(topic, event, binary)
+
+
+def decode_event(raw: bytes) -> dict:
+    """Dict for a binary or JSON event payload."""
+    return registry.decode(bytes(raw))
+
+
+def content_type(raw: bytes) -> bytes:
+    return CONTENT_TYPE_BINARY if raw[:1] == MAGIC else CONTENT_TYPE_JSON
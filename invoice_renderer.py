@@ -0,0 +1,390 @@
+"""
+Invoice PDFs rendered in memory.
+
+Invoices come back as bytes and never touch the disk. Concurrent renders
+cannot collide on a file name, and there is nothing to clean up.
+
+InvoiceRenderer builds everything that never changes once, as bytes:
+the title, field labels, table header, the font objects and the PDF
+objects around the pages. Per invoice it only writes the field values
+and the line-item rows, then returns the PDF as bytes. Text uses the
+standard Helvetica fonts, which PDF viewers supply, so no font is
+embedded. Widths come from fpdf2's metrics, so right-aligned amounts
+line up. Orders that don't fit on one page continue on more pages,
+each repeating the table header.
+
+Those fonts only cover Windows-1252 (Latin) text. An invoice with other
+text (a Devanagari or Cyrillic name, say) is laid out by fpdf2 with the
+TrueType font at INVOICE_UNICODE_FONT embedded instead; without one,
+render() raises ValueError rather than printing "?" marks.
+
+Invoices are plain dicts, so they can be sent to worker processes:
+    {"number", "date", "customer", "transaction_id",
+     "items": [{"description", "quantity", "unit_price"}], "total" (optional)}
+
+render_batch() spreads a month-end run over a process pool. Each worker
+builds its renderer once.
+"""
+import os
+import zlib
+import datetime
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from fpdf.fonts import CORE_FONTS_CHARWIDTHS
+
+INVOICE_TITLE = os.getenv("INVOICE_TITLE", "SaaS Starter Template - Official Invoice")
+INVOICE_CURRENCY = os.getenv("INVOICE_CURRENCY", "INR")
+INVOICE_COMPRESS = os.getenv("INVOICE_COMPRESS", "true").lower() == "true"
+INVOICE_BATCH_PROCESSES = int(os.getenv("INVOICE_BATCH_PROCESSES", str(os.cpu_count() or 1)))
+INVOICE_BATCH_CHUNKSIZE = int(os.getenv("INVOICE_BATCH_CHUNKSIZE", "64"))
+# TrueType font (e.g. NotoSans-Regular.ttf) for invoices with non-Latin text
+INVOICE_UNICODE_FONT = os.getenv("INVOICE_UNICODE_FONT", "")
+
+SUBSCRIPTION_ITEM = {"description": "SaaS App Subscription", "quantity": 1, "unit_price": 999.0}
+
+# Layout in mm on A4, as FPDF() laid it out: 10 mm margins, 10 mm rows
+PAGE_WIDTH, PAGE_HEIGHT = 210.0, 297.0
+MARGIN = 10.0
+CELL_MARGIN = 1.0
+ROW = 10.0
+K = 72 / 25.4  # points per mm
+FIELDS = (("Invoice No", "number"), ("Date", "date"), ("Customer Name", "customer"), ("Transaction ID", "transaction_id"))
+FIELDS_TOP = 30.0
+TABLE_TOP = FIELDS_TOP + ROW * len(FIELDS) + ROW
+# (heading, width, align)
+COLUMNS = (("Description", 95.0, "L"), ("Qty", 20.0, "C"), ("Unit Price", 35.0, "R"), ("Amount", 40.0, "R"))
+ROWS_END = PAGE_HEIGHT - 20.0  # FPDF's automatic page break margin
+FOOTER_END = PAGE_HEIGHT - MARGIN
+
+REGULAR, BOLD, ITALIC = 1, 2, 3
+FONTS = {REGULAR: ("helvetica", "Helvetica"), BOLD: ("helveticaB", "Helvetica-Bold"), ITALIC: ("helveticaI", "Helvetica-Oblique")}
+# Objects 3-6 never change; catalog (1), page tree (2) and the pages follow
+RESOURCES_OBJ = 6
+FIRST_PAGE_OBJ = 7
+
+
+def _money(currency: str, value: float) -> str:
+    return f"{currency} {value:,.2f}"
+
+
+class InvoiceRenderer:
+    def __init__(self, title: str = INVOICE_TITLE, currency: str = INVOICE_CURRENCY, compress: bool = INVOICE_COMPRESS,
+                 unicode_font: str = INVOICE_UNICODE_FONT):
+        self.title = title
+        self.currency = currency
+        self.compress = compress
+        self.unicode_font = unicode_font
+        self._widths = {font: [CORE_FONTS_CHARWIDTHS[key][chr(b)] for b in range(256)] for font, (key, _) in FONTS.items()}
+
+        self._line_width = f"{0.2 * K:.2f} w".encode()
+        first = [self._line_width, self._cell(title, BOLD, 16, MARGIN, MARGIN, PAGE_WIDTH - 2 * MARGIN, "C")]
+        self._value_x = []
+        for i, (label, _) in enumerate(FIELDS):
+            first.append(self._cell(f"{label}:", REGULAR, 12, MARGIN, FIELDS_TOP + i * ROW, 0, "L"))
+            self._value_x.append(MARGIN + CELL_MARGIN + self._width(self._encode(f"{label}: "), REGULAR, 12))
+        first.append(self._header_row(TABLE_TOP))
+        self._first_page = b"\n".join(first)
+        self._next_page = b"\n".join([self._line_width, self._header_row(MARGIN)])
+        self._thanks = self._encode("Thank you for your business!")
+        self._thanks_x = (PAGE_WIDTH - self._width(self._thanks, ITALIC, 10)) / 2
+
+        prefix = [b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"]
+        self._prefix_offsets = []
+        for font, (_, name) in FONTS.items():
+            self._prefix_offsets.append(sum(map(len, prefix)))
+            prefix.append(f"{2 + font} 0 obj\n<</Type /Font /Subtype /Type1 /BaseFont /{name} /Encoding /WinAnsiEncoding>>\nendobj\n".encode())
+        self._prefix_offsets.append(sum(map(len, prefix)))
+        fonts = " ".join(f"/F{font} {2 + font} 0 R" for font in FONTS)
+        prefix.append(f"{RESOURCES_OBJ} 0 obj\n<</Font <<{fonts}>>>>\nendobj\n".encode())
+        self._prefix = b"".join(prefix)
+
+    # ---------- text ----------
+
+    @staticmethod
+    def _encode(text) -> bytes:
+        # Strict: anything WinAnsiEncoding can't show goes to _render_unicode
+        return str(text).encode("cp1252")
+
+    def _width(self, data: bytes, font: int, size: float) -> float:
+        return sum(map(self._widths[font].__getitem__, data)) * size / 1000 / K
+
+    def _cell(self, text, font: int, size: float, x: float, y: float, w: float, align: str, border: bool = False) -> bytes:
+        """Content-stream operators for an FPDF-style cell of height ROW at (x, y) mm from the top left."""
+        data = text if isinstance(text, bytes) else self._encode(text)
+        if w:
+            # Cut text that doesn't fit short with "..."
+            width = self._width(data, font, size)
+            if width > w - 2 * CELL_MARGIN:
+                while data and self._width(data + b"...", font, size) > w - 2 * CELL_MARGIN:
+                    data = data[:-1]
+                data += b"..."
+                width = self._width(data, font, size)
+        if align == "R":
+            tx = x + w - CELL_MARGIN - width
+        elif align == "C":
+            tx = x + (w - width) / 2
+        else:
+            tx = x + CELL_MARGIN
+        ty = PAGE_HEIGHT - y - ROW / 2 - 0.3 * size / K
+        escaped = data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)").replace(b"\r", b"\\r")
+        ops = b"BT /F%d %.2f Tf %.2f %.2f Td (%s) Tj ET" % (font, size, tx * K, ty * K, escaped)
+        if border:
+            ops = b"%.2f %.2f %.2f %.2f re S\n" % (x * K, (PAGE_HEIGHT - y) * K, w * K, -ROW * K) + ops
+        return ops
+
+    def _header_row(self, y: float) -> bytes:
+        cells, x = [], MARGIN
+        for heading, width, align in COLUMNS:
+            cells.append(self._cell(heading, BOLD, 12, x, y, width, align, border=True))
+            x += width
+        return b"\n".join(cells)
+
+    def _row(self, values, font: int, y: float) -> bytes:
+        cells, x = [], MARGIN
+        for value, (_, width, align) in zip(values, COLUMNS):
+            cells.append(self._cell(value, font, 12, x, y, width, align, border=True))
+            x += width
+        return b"\n".join(cells)
+
+    # ---------- rendering ----------
+
+    def render(self, invoice: dict) -> bytes:
+        """The invoice as PDF bytes. ValueError if it has non-Latin text and no INVOICE_UNICODE_FONT is set."""
+        try:
+            return self._render(invoice)
+        except UnicodeEncodeError as e:
+            if not self.unicode_font:
+                raise ValueError(f"Invoice {invoice.get('number')} has text the built-in PDF fonts can't show "
+                                 f"({e.object[e.start:e.end]!r}); set INVOICE_UNICODE_FONT to a TrueType font") from None
+        return self._render_unicode(invoice)
+
+    def _render(self, invoice: dict) -> bytes:
+        currency = invoice.get("currency") or self.currency
+        ops = [self._first_page]
+        for i, ((_, key), x) in enumerate(zip(FIELDS, self._value_x)):
+            ops.append(self._cell(invoice.get(key) or "N/A", REGULAR, 12, x - CELL_MARGIN, FIELDS_TOP + i * ROW,
+                                  PAGE_WIDTH - MARGIN - x + CELL_MARGIN, "L"))
+
+        pages, y, total = [], TABLE_TOP + ROW, 0.0
+        for item in invoice.get("items") or ():
+            if y + ROW > ROWS_END:
+                pages.append(ops)
+                ops, y = [self._next_page], MARGIN + ROW
+            amount = round(item["quantity"] * item["unit_price"], 2)
+            total += amount
+            ops.append(self._row((item["description"], item["quantity"], _money(currency, item["unit_price"]),
+                                  _money(currency, amount)), REGULAR, y))
+            y += ROW
+
+        # The total row and, 10 mm under it, the footer stay together
+        if y + 3 * ROW > FOOTER_END:
+            pages.append(ops)
+            ops, y = [self._line_width], MARGIN
+        total_width = sum(width for _, width, _ in COLUMNS[:-1])
+        ops.append(self._cell("Total", BOLD, 12, MARGIN, y, total_width, "R", border=True))
+        ops.append(self._cell(_money(currency, invoice.get("total", total)), BOLD, 12, MARGIN + total_width, y,
+                              COLUMNS[-1][1], "R", border=True))
+        ops.append(self._cell(self._thanks, ITALIC, 10, self._thanks_x - CELL_MARGIN, y + 2 * ROW, 0, "L"))
+        pages.append(ops)
+        return self._document([b"\n".join(page) for page in pages])
+
+    def _render_unicode(self, invoice: dict) -> bytes:
+        """The same layout through fpdf2, with unicode_font embedded (one face for every style)."""
+        from fpdf import FPDF
+
+        currency = invoice.get("currency") or self.currency
+        pdf = FPDF()
+        pdf.add_font("invoice", "", self.unicode_font)
+        pdf.set_auto_page_break(False)
+
+        def header():
+            pdf.set_font("invoice", "", 12)
+            for heading, width, align in COLUMNS:
+                pdf.cell(width, ROW, heading, border=1, align=align)
+            pdf.ln()
+
+        pdf.add_page()
+        pdf.set_font("invoice", "", 16)
+        pdf.cell(0, ROW, self.title, align="C")
+        pdf.set_font("invoice", "", 12)
+        for i, (label, key) in enumerate(FIELDS):
+            pdf.set_xy(MARGIN, FIELDS_TOP + i * ROW)
+            pdf.cell(0, ROW, f"{label}: {invoice.get(key) or 'N/A'}")
+        pdf.set_xy(MARGIN, TABLE_TOP)
+        header()
+        total = 0.0
+        for item in invoice.get("items") or ():
+            if pdf.get_y() + ROW > ROWS_END:
+                pdf.add_page()
+                header()
+            amount = round(item["quantity"] * item["unit_price"], 2)
+            total += amount
+            for value, (_, width, align) in zip((item["description"], item["quantity"], _money(currency, item["unit_price"]),
+                                                 _money(currency, amount)), COLUMNS):
+                pdf.cell(width, ROW, str(value), border=1, align=align)
+            pdf.ln()
+        if pdf.get_y() + 3 * ROW > FOOTER_END:
+            pdf.add_page()
+        pdf.cell(sum(width for _, width, _ in COLUMNS[:-1]), ROW, "Total", border=1, align="R")
+        pdf.cell(COLUMNS[-1][1], ROW, _money(currency, invoice.get("total", total)), border=1, align="R")
+        pdf.ln(2 * ROW)
+        pdf.set_font("invoice", "", 10)
+        pdf.cell(0, ROW, "Thank you for your business!", align="C")
+        return bytes(pdf.output())
+
+    def _document(self, contents: list) -> bytes:
+        out = [self._prefix]
+        offsets = {obj: offset for obj, offset in zip(range(3, RESOURCES_OBJ + 1), self._prefix_offsets)}
+        size = len(self._prefix)
+
+        def add(obj: int, body: bytes):
+            nonlocal size
+            offsets[obj] = size
+            chunk = b"%d 0 obj\n%s\nendobj\n" % (obj, body)
+            out.append(chunk)
+            size += len(chunk)
+
+        page_objs = [FIRST_PAGE_OBJ + 2 * i for i in range(len(contents))]
+        add(1, b"<</Type /Catalog /Pages 2 0 R>>")
+        add(2, b"<</Type /Pages /Kids [%s] /Count %d /MediaBox [0 0 %.2f %.2f]>>" % (
+            b" ".join(b"%d 0 R" % obj for obj in page_objs), len(page_objs), PAGE_WIDTH * K, PAGE_HEIGHT * K))
+        for obj, stream in zip(page_objs, contents):
+            add(obj, b"<</Type /Page /Parent 2 0 R /Resources %d 0 R /Contents %d 0 R>>" % (RESOURCES_OBJ, obj + 1))
+            if self.compress:
+                stream = zlib.compress(stream)
+                add(obj + 1, b"<</Filter /FlateDecode /Length %d>>\nstream\n%s\nendstream" % (len(stream), stream))
+            else:
+                add(obj + 1, b"<</Length %d>>\nstream\n%s\nendstream" % (len(stream), stream))
+
+        count = max(offsets) + 1
+        xref = [b"xref\n0 %d\n0000000000 65535 f \n" % count]
+        xref.extend(b"%010d 00000 n \n" % offsets[obj] for obj in range(1, count))
+        out.extend(xref)
+        out.append(b"trailer\n<</Size %d /Root 1 0 R>>\nstartxref\n%d\n%%%%EOF\n" % (count, size))
+        return b"".join(out)
+
+
+# ---------- invoices ----------
+
+def registration_invoice(user_name: str, payment_id: str = None) -> dict:
+    """The one-line subscription invoice sent after a registration."""
+    return {
+        "number": payment_id or "N/A",
+        "date": datetime.date.today().isoformat(),
+        "customer": user_name,
+        "transaction_id": payment_id or "N/A",
+        "items": [SUBSCRIPTION_ITEM],
+    }
+
+
+def order_invoices(db, orders) -> list:
+    """
+    Invoices for `orders` (Order rows), in the same order: two queries for
+    all their customers, items and product names.
+    """
+    from sqlalchemy import select
+    from models import OrderItem, Product, User
+
+    if not orders:
+        return []
+    order_ids = [order.id for order in orders]
+    items = {}
+    for item, name in db.execute(
+        select(OrderItem, Product.name)
+        .join(Product, Product.id == OrderItem.product_id, isouter=True)
+        .where(OrderItem.order_id.in_(order_ids))
+        .order_by(OrderItem.order_id, OrderItem.id)
+    ).all():
+        items.setdefault(item.order_id, []).append(
+            {"description": name or f"Product #{item.product_id}", "quantity": item.quantity, "unit_price": item.unit_price}
+        )
+    customers = dict(db.execute(
+        select(User.id, User.name).where(User.id.in_({order.customer_id for order in orders}))
+    ).all())
+    return [
+        {
+            "number": f"ORD-{order.id:06d}",
+            "date": (order.created_at or datetime.datetime.utcnow()).date().isoformat(),
+            "customer": customers.get(order.customer_id, "N/A"),
+            "transaction_id": order.stripe_payment_id or "N/A",
+            "items": items.get(order.id, []),
+            "total": order.total_amount,
+        }
+        for order in orders
+    ]
+
+
+def iter_order_invoices(db, start: datetime.datetime, end: datetime.datetime, batch_size: int = 500):
+    """Invoices for orders created in [start, end), in id order, loaded `batch_size` orders at a time."""
+    from sqlalchemy import select
+    from models import Order
+
+    last_id = 0
+    while True:
+        orders = db.execute(
+            select(Order)
+            .where(Order.created_at >= start, Order.created_at < end, Order.id > last_id)
+            .order_by(Order.id)
+            .limit(batch_size)
+        ).scalars().all()
+        if not orders:
+            return
+        yield from order_invoices(db, orders)
+        last_id = orders[-1].id
+        db.expunge_all()
+
+
+# ---------- batch mode ----------
+
+_worker_renderer = None
+
+
+def _init_worker(options: dict):
+    global _worker_renderer
+    _worker_renderer = InvoiceRenderer(**options)
+
+
+def _render_chunk(invoices: list) -> list:
+    return [(invoice.get("number"), _worker_renderer.render(invoice)) for invoice in invoices]
+
+
+def render_batch(invoices, processes: int = INVOICE_BATCH_PROCESSES, chunksize: int = INVOICE_BATCH_CHUNKSIZE, **options):
+    """
+    Renders `invoices` (any iterable, e.g. iter_order_invoices) on a process
+    pool and yields (number, pdf bytes) in input order. At most two chunks
+    per process are in flight, so a long run doesn't pile up in memory.
+    """
+    if processes <= 1:
+        renderer = InvoiceRenderer(**options)
+        for invoice in invoices:
+            yield invoice.get("number"), renderer.render(invoice)
+        return
+
+    with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(options,)) as pool:
+        pending, chunk = deque(), []
+        for invoice in invoices:
+            chunk.append(invoice)
+            if len(chunk) == chunksize:
+                pending.append(pool.submit(_render_chunk, chunk))
+                chunk = []
+                if len(pending) >= 2 * processes:
+                    yield from pending.popleft().result()
+        if chunk:
+            pending.append(pool.submit(_render_chunk, chunk))
+        while pending:
+            yield from pending.popleft().result()
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_invoice_renderer() -> InvoiceRenderer:
+    global _renderer
+    if _renderer is None:
+        with _renderer_lock:
+            if _renderer is None:
+                _renderer = InvoiceRenderer()
+    return _renderer
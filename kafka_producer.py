@@ -1,27 +1,326 @@
 import os
-import json
-from kafka import KafkaProducer
+import time
+import threading
+from collections import deque
 
+from event_schemas import encode_event, content_type
+
+# kafka: publish to the broker; local: append to the file-backed log in local_event_log
+EVENT_BUS_BACKEND = os.getenv("EVENT_BUS_BACKEND", "kafka")
 KAFKA_BROKER_URL = os.getenv("KAFKA_BROKER_URL", "localhost:9092")
+# batched: sends return immediately and are delivered by the client's I/O thread
+# sync: wait for the broker on every publish (the old flush-per-event behaviour)
+KAFKA_PRODUCER_MODE = os.getenv("KAFKA_PRODUCER_MODE", "batched")
+KAFKA_DELIVERY = os.getenv("KAFKA_DELIVERY", "leader")  # fire_and_forget | leader | all
+KAFKA_LINGER_MS = int(os.getenv("KAFKA_LINGER_MS", "10"))
+KAFKA_BATCH_SIZE = int(os.getenv("KAFKA_BATCH_SIZE", str(64 * 1024)))
+# Upper bound on how long send() may block the request thread (metadata fetch / full buffer)
+KAFKA_MAX_BLOCK_MS = int(os.getenv("KAFKA_MAX_BLOCK_MS", "200"))
+KAFKA_RETRY_BUFFER = int(os.getenv("KAFKA_RETRY_BUFFER", "10000"))
+KAFKA_RETRY_INTERVAL = float(os.getenv("KAFKA_RETRY_INTERVAL", "2"))
+KAFKA_MAX_ATTEMPTS = int(os.getenv("KAFKA_MAX_ATTEMPTS", "5"))
+KAFKA_RECONNECT_INTERVAL = float(os.getenv("KAFKA_RECONNECT_INTERVAL", "10"))
+KAFKA_SYNC_TIMEOUT = float(os.getenv("KAFKA_SYNC_TIMEOUT", "10"))
 
-# Global producer instance
-producer = None
+ACKS = {"fire_and_forget": 0, "leader": 1, "all": "all"}
 
-def get_kafka_producer():
-    global producer
-    if producer is None:
+
+class TopicMetrics:
+    """Counters and delivery latency (send -> broker ack) for one topic."""
+
+    WINDOW = 60
+
+    def __init__(self):
+        self.sent = 0
+        self.acked = 0
+        self.failed = 0
+        self.retried = 0
+        self.dropped = 0
+        self.bytes = 0
+        self.latency_ms_total = 0.0
+        self.latency_ms_max = 0.0
+        self._recent = deque(maxlen=self.WINDOW)  # [second, acked]
+
+    def record_ack(self, latency_ms: float):
+        self.acked += 1
+        self.latency_ms_total += latency_ms
+        self.latency_ms_max = max(self.latency_ms_max, latency_ms)
+        second = int(time.time())
+        if self._recent and self._recent[-1][0] == second:
+            self._recent[-1][1] += 1
+        else:
+            self._recent.append([second, 1])
+
+    def snapshot(self) -> dict:
+        cutoff = int(time.time()) - self.WINDOW
+        recent = sum(count for second, count in self._recent if second > cutoff)
+        return {
+            "sent": self.sent,
+            "acked": self.acked,
+            "failed": self.failed,
+            "retried": self.retried,
+            "dropped": self.dropped,
+            "bytes": self.bytes,
+            "acked_per_sec_1m": round(recent / self.WINDOW, 2),
+            "avg_latency_ms": round(self.latency_ms_total / self.acked, 2) if self.acked else 0.0,
+            "max_latency_ms": round(self.latency_ms_max, 2),
+        }
+
+
+class EventProducer:
+    """
+    Kafka publisher that keeps the broker round-trip off the request path.
+
+    In batched mode send() only appends to the client's buffer; records are
+    grouped per partition for up to `linger_ms` / `batch_size` and shipped by
+    kafka-python's I/O thread. Each delivery level (acks=0/1/all) gets its own
+    underlying producer, created on first use. Failed or unsendable events go
+    to a bounded retry buffer drained by a background thread; the oldest are
+    dropped (and counted) when it overflows.
+    """
+
+    def __init__(self, bootstrap_servers: str = KAFKA_BROKER_URL, mode: str = KAFKA_PRODUCER_MODE,
+                 delivery: str = KAFKA_DELIVERY, linger_ms: int = KAFKA_LINGER_MS, batch_size: int = KAFKA_BATCH_SIZE,
+                 retry_buffer: int = KAFKA_RETRY_BUFFER):
+        if delivery not in ACKS:
+            raise ValueError(f"unknown delivery level {delivery!r}, expected one of {sorted(ACKS)}")
+        self.bootstrap_servers = bootstrap_servers
+        self.mode = mode
+        self.delivery = delivery
+        self.linger_ms = linger_ms
+        self.batch_size = batch_size
+        self.retry_limit = retry_buffer
+        self._producers = {}
+        self._last_attempt = {}
+        self._retry = deque()
+        self._metrics = {}
+        # Re-entrant: metrics are created lazily from paths that already hold it
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._retry_thread = None
+
+    # ---------- connections ----------
+
+    def _producer(self, delivery: str):
+        prod = self._producers.get(delivery)
+        if prod is not None:
+            return prod
+        with self._lock:
+            prod = self._producers.get(delivery)
+            now = time.monotonic()
+            # Don't stall every request on a dead broker; retry the connection periodically.
+            # Claiming the attempt here means one caller connects; the rest use the retry buffer.
+            if prod is not None or now - self._last_attempt.get(delivery, -KAFKA_RECONNECT_INTERVAL) < KAFKA_RECONNECT_INTERVAL:
+                return prod
+            self._last_attempt[delivery] = now
+
+        # Connecting can take seconds against a dead broker, so not under the lock
         try:
-            producer = KafkaProducer(
-                bootstrap_servers=[KAFKA_BROKER_URL],
-                value_serializer=lambda v: json.dumps(v).encode('utf-8')
+            from kafka import KafkaProducer
+
+            prod = KafkaProducer(
+                bootstrap_servers=[self.bootstrap_servers],
+                acks=ACKS[delivery],
+                linger_ms=self.linger_ms if self.mode == "batched" else 0,
+                batch_size=self.batch_size,
+                max_block_ms=KAFKA_MAX_BLOCK_MS,
+                retries=3,
             )
-            print("[KAFKA] Producer connected successfully")
         except Exception as e:
             print(f"[KAFKA] Connection failed: {e}")
+            return None
+        with self._lock:
+            self._producers[delivery] = prod
+        print(f"[KAFKA] Producer connected successfully (mode={self.mode}, delivery={delivery})")
+        return prod
+
+    # ---------- publishing ----------
+
+    def _topic(self, topic: str) -> TopicMetrics:
+        metrics = self._metrics.get(topic)
+        if metrics is None:
+            with self._lock:
+                metrics = self._metrics.setdefault(topic, TopicMetrics())
+        return metrics
+
+    def publish(self, topic: str, event_data: dict, delivery: str = None):
+        value = encode_event(topic, event_data)
+        self._send(topic, value, delivery or self.delivery, 1)
+
+    def _send(self, topic: str, value: bytes, delivery: str, attempt: int):
+        metrics = self._topic(topic)
+        prod = self._producer(delivery)
+        if prod is None:
+            self._buffer(topic, value, delivery, attempt)
+            return
+        started = time.perf_counter()
+        try:
+            future = prod.send(topic, value, headers=[("content-type", content_type(value))])
+        except Exception as e:
+            print(f"[KAFKA] Send to {topic} failed, buffering for retry: {e}")
+            self._buffer(topic, value, delivery, attempt)
+            return
+        with self._lock:
+            metrics.sent += 1
+            metrics.bytes += len(value)
+
+        if self.mode == "sync":
+            try:
+                future.get(timeout=KAFKA_SYNC_TIMEOUT)
+                self._on_ack(topic, started, None)
+            except Exception as e:
+                self._on_error(topic, value, delivery, attempt, e)
+        else:
+            future.add_callback(self._on_ack, topic, started)
+            future.add_errback(self._on_error, topic, value, delivery, attempt)
+
+    def publish_batch(self, events: list, delivery: str = None, timeout: float = KAFKA_SYNC_TIMEOUT) -> list:
+        """
+        Sends (topic, event) pairs and waits for each broker ack. Returns one
+        entry per event: None if delivered, else the error. Failures are not
+        put in the retry buffer; the caller decides what to resend.
+        """
+        delivery = delivery or self.delivery
+        prod = self._producer(delivery)
+        if prod is None:
+            return [ConnectionError("Kafka producer is not connected")] * len(events)
+        pending = []
+        for topic, event_data in events:
+            value = encode_event(topic, event_data)
+            started = time.perf_counter()
+            try:
+                future = prod.send(topic, value, headers=[("content-type", content_type(value))])
+            except Exception as e:
+                pending.append((topic, None, started, e))
+                continue
+            with self._lock:
+                metrics = self._topic(topic)
+                metrics.sent += 1
+                metrics.bytes += len(value)
+            pending.append((topic, future, started, None))
+
+        results = []
+        for topic, future, started, error in pending:
+            if future is not None:
+                try:
+                    future.get(timeout=timeout)
+                    self._on_ack(topic, started, None)
+                except Exception as e:
+                    error = e
+                    with self._lock:
+                        self._topic(topic).failed += 1
+            results.append(error)
+        return results
+
+    def _on_ack(self, topic: str, started: float, _metadata):
+        with self._lock:
+            self._topic(topic).record_ack((time.perf_counter() - started) * 1000)
+
+    def _on_error(self, topic: str, value: bytes, delivery: str, attempt: int, error):
+        with self._lock:
+            self._topic(topic).failed += 1
+        print(f"[KAFKA] Delivery to {topic} failed (attempt {attempt}): {error}")
+        self._buffer(topic, value, delivery, attempt)
+
+    def _buffer(self, topic: str, value: bytes, delivery: str, attempt: int):
+        with self._lock:
+            metrics = self._topic(topic)
+            if attempt >= KAFKA_MAX_ATTEMPTS:
+                metrics.dropped += 1
+                return
+            if len(self._retry) >= self.retry_limit:
+                dropped_topic = self._retry.popleft()[0]
+                self._metrics[dropped_topic].dropped += 1
+            self._retry.append((topic, value, delivery, attempt + 1))
+            if self._retry_thread is None and not self._stop.is_set():
+                self._retry_thread = threading.Thread(target=self._retry_loop, name="kafka-retry", daemon=True)
+                self._retry_thread.start()
+
+    def _drain_retries(self):
+        with self._lock:
+            pending = list(self._retry)
+            self._retry.clear()
+        for topic, value, delivery, attempt in pending:
+            with self._lock:
+                self._topic(topic).retried += 1
+            self._send(topic, value, delivery, attempt)
+
+    def _retry_loop(self):
+        while not self._stop.wait(KAFKA_RETRY_INTERVAL):
+            if self._retry:
+                self._drain_retries()
+
+    # ---------- lifecycle ----------
+
+    def flush(self, timeout: float = None):
+        self._drain_retries()
+        for prod in list(self._producers.values()):
+            try:
+                prod.flush(timeout=timeout)
+            except Exception as e:
+                print(f"[KAFKA] Flush failed: {e}")
+
+    def close(self, timeout: float = 10):
+        """Delivers everything still buffered (best effort within `timeout`) and closes the producers."""
+        self._stop.set()
+        self.flush(timeout)
+        for prod in list(self._producers.values()):
+            try:
+                prod.close(timeout=timeout)
+            except Exception as e:
+                print(f"[KAFKA] Close failed: {e}")
+        self._producers.clear()
+        if self._retry:
+            print(f"[KAFKA] {len(self._retry)} events still undelivered at shutdown")
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "delivery": self.delivery,
+                "linger_ms": self.linger_ms,
+                "batch_size": self.batch_size,
+                "retry_buffer": len(self._retry),
+                "topics": {topic: m.snapshot() for topic, m in self._metrics.items()},
+            }
+
+
+# Global producer instance
+producer = None
+_producer_lock = threading.Lock()
+
+
+def get_event_producer():
+    """EventProducer for Kafka, or a LocalEventBus when EVENT_BUS_BACKEND=local."""
+    global producer
+    if producer is None:
+        with _producer_lock:
+            if producer is None:
+                if EVENT_BUS_BACKEND == "local":
+                    from local_event_log import LocalEventBus
+                    producer = LocalEventBus()
+                    print(f"[KAFKA] Using local event log at {producer.log.root} instead of a broker")
+                else:
+                    producer = EventProducer()
     return producer
 
-def publish_event(topic: str, event_data: dict):
-    prod = get_kafka_producer()
-    if prod:
-        prod.send(topic, event_data)
-        prod.flush()
+
+def get_kafka_producer():
+    """The underlying KafkaProducer for the default delivery level (None while disconnected or local)."""
+    prod = get_event_producer()
+    if not isinstance(prod, EventProducer):
+        return None
+    return prod._producer(prod.delivery)
+
+
+def publish_event(topic: str, event_data: dict, delivery: str = None):
+    """
+    Publishes a JSON event. Returns without waiting for the broker unless
+    KAFKA_PRODUCER_MODE=sync; `delivery` overrides KAFKA_DELIVERY per call.
+    """
+    get_event_producer().publish(topic, event_data, delivery)
+
+
+def close_kafka_producer(timeout: float = 10):
+    if producer is not None:
+        producer.close(timeout)
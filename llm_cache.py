@@ -0,0 +1,108 @@
+import os
+import re
+import json
+import hashlib
+import threading
+
+from cache_backends import make_backend
+
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")  # memory | sqlite | redis
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "10000"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize_messages(messages: list) -> list:
+    normalized = []
+    for msg in messages:
+        content = msg.get("content", "")
+        if isinstance(content, str):
+            content = _WHITESPACE.sub(" ", content).strip()
+        normalized.append({"role": msg.get("role", "user"), "content": content})
+    return normalized
+
+
+def make_cache_key(model: str, messages: list, options: dict = None, format: str = None) -> str:
+    """SHA-256 over (model, normalized messages, options[, output format])."""
+    material = {"model": model, "messages": _normalize_messages(messages), "options": options or {}}
+    if format:
+        material["format"] = format
+    canonical = json.dumps(
+        material,
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Content-addressed cache of LLM completions with hit/miss counters.
+    A failing backend (e.g. Redis down) is counted and treated as a miss.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.errors = 0
+
+    def _count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def get(self, key: str):
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            print(f"[LLM CACHE] Read failed: {e}")
+            self._count("errors")
+            value = None
+        self._count("hits" if value is not None else "misses")
+        return value
+
+    def set(self, key: str, value: str):
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            print(f"[LLM CACHE] Write failed: {e}")
+            self._count("errors")
+
+    def record_bypass(self):
+        self._count("bypassed")
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Global cache instance
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> LLMCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                try:
+                    backend = make_backend(LLM_CACHE_BACKEND, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL, path=LLM_CACHE_PATH, prefix="llm:")
+                except Exception as e:
+                    print(f"[LLM CACHE] {LLM_CACHE_BACKEND} backend unavailable ({e}), using memory")
+                    backend = make_backend("memory", LLM_CACHE_MAX_ENTRIES, LLM_CACHE_TTL)
+                _cache = LLMCache(backend)
+    return _cache
@@ -0,0 +1,259 @@
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from contextlib import contextmanager, asynccontextmanager
+
+from fastapi import HTTPException
+
+from ollama_client import OllamaError
+
+# Priority classes, highest first
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITY_RANK = {INTERACTIVE: 0, BACKGROUND: 1}
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_SCHEDULER_MODE = os.getenv("LLM_SCHEDULER_MODE", "local")  # local | celery
+QUEUE_LIMITS = {
+    INTERACTIVE: int(os.getenv("LLM_QUEUE_LIMIT_INTERACTIVE", "32")),
+    BACKGROUND: int(os.getenv("LLM_QUEUE_LIMIT_BACKGROUND", "512")),
+}
+DEADLINES = {
+    INTERACTIVE: float(os.getenv("LLM_DEADLINE_INTERACTIVE", "15")),
+    BACKGROUND: float(os.getenv("LLM_DEADLINE_BACKGROUND", "600")),
+}
+
+# Upper bounds (seconds) of the wait-time histogram buckets
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, math.inf)
+
+
+class LLMOverloaded(OllamaError):
+    """Raised when a request is shed instead of queued for an Ollama slot."""
+
+    def __init__(self, priority: str, retry_after: float, reason: str, queue_full: bool = False):
+        super().__init__(f"AI service is busy ({reason}).")
+        self.priority = priority
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+        self.reason = reason
+        self.queue_full = queue_full
+
+
+class _Waiter:
+    __slots__ = ("priority", "event", "loop", "future", "granted", "abandoned")
+
+    def __init__(self, priority, loop=None):
+        self.priority = priority
+        self.event = None if loop else threading.Event()
+        self.loop = loop
+        self.future = loop.create_future() if loop else None
+        self.granted = False
+        self.abandoned = False
+
+
+class LLMScheduler:
+    """
+    Bounded-concurrency gate in front of Ollama.
+
+    At most `concurrency` generations run at once; the rest wait in a priority
+    queue where interactive requests always go before background ones. A
+    request is shed with LLMOverloaded when its class queue is full, when the
+    estimated wait already exceeds the class deadline, or when it actually
+    waited that long. Threads and asyncio tasks share the same queue.
+    """
+
+    def __init__(self, concurrency: int = LLM_MAX_CONCURRENCY, queue_limits: dict = None, deadlines: dict = None):
+        self.concurrency = concurrency
+        self.queue_limits = dict(queue_limits or QUEUE_LIMITS)
+        self.deadlines = dict(deadlines or DEADLINES)
+        self._lock = threading.Lock()
+        self._heap = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._service_time = 2.0  # EWMA of slot hold time, seconds
+        self.depth = {p: 0 for p in PRIORITY_RANK}
+        self.max_depth = {p: 0 for p in PRIORITY_RANK}
+        self.admitted = {p: 0 for p in PRIORITY_RANK}
+        self.shed = {p: 0 for p in PRIORITY_RANK}
+        self.wait_histogram = {p: [0] * len(WAIT_BUCKETS) for p in PRIORITY_RANK}
+
+    # ---------- admission ----------
+
+    def _ahead_of(self, priority: str) -> int:
+        rank = PRIORITY_RANK[priority]
+        return sum(n for p, n in self.depth.items() if PRIORITY_RANK[p] <= rank)
+
+    def _estimate_wait(self, priority: str) -> float:
+        ahead = self._ahead_of(priority)
+        if ahead == 0 and self._active < self.concurrency:
+            return 0.0
+        # Every `concurrency` queued jobs take roughly one service time to drain
+        return (ahead // self.concurrency + 1) * self._service_time
+
+    def _check_admission(self, priority: str):
+        if self.depth[priority] >= self.queue_limits[priority]:
+            self.shed[priority] += 1
+            raise LLMOverloaded(priority, self._service_time, "queue full", queue_full=True)
+        estimate = self._estimate_wait(priority)
+        if estimate > self.deadlines[priority]:
+            self.shed[priority] += 1
+            raise LLMOverloaded(priority, estimate - self.deadlines[priority], "estimated wait exceeds deadline")
+
+    def admit(self, priority: str = INTERACTIVE):
+        """Fast pre-check for endpoints: raises LLMOverloaded without queueing."""
+        with self._lock:
+            self._check_admission(priority)
+
+    # ---------- slots ----------
+
+    def _try_enter(self, priority, loop=None):
+        with self._lock:
+            if self._active < self.concurrency and not any(self.depth.values()):
+                self._active += 1
+                self.admitted[priority] += 1
+                return None
+            self._check_admission(priority)
+            waiter = _Waiter(priority, loop)
+            heapq.heappush(self._heap, (PRIORITY_RANK[priority], next(self._seq), waiter))
+            self.depth[priority] += 1
+            self.max_depth[priority] = max(self.max_depth[priority], self.depth[priority])
+            return waiter
+
+    def _abandon(self, waiter) -> bool:
+        """Returns True if the waiter already owns a slot and must release it."""
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.abandoned = True
+            self.depth[waiter.priority] -= 1
+            self.shed[waiter.priority] += 1
+            return False
+
+    def _release(self, held_for: float):
+        with self._lock:
+            self._service_time = 0.8 * self._service_time + 0.2 * held_for
+            while self._heap:
+                _, _, waiter = heapq.heappop(self._heap)
+                if waiter.abandoned:
+                    continue
+                waiter.granted = True
+                self.depth[waiter.priority] -= 1
+                self.admitted[waiter.priority] += 1
+                if waiter.loop is None:
+                    waiter.event.set()
+                    return
+                try:
+                    waiter.loop.call_soon_threadsafe(_wake, waiter.future)
+                    return
+                except RuntimeError:
+                    continue  # waiter's loop is gone, hand the slot to the next one
+            self._active -= 1
+
+    def _record_wait(self, priority: str, waited: float):
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if waited <= bound:
+                self.wait_histogram[priority][i] += 1
+                break
+
+    @contextmanager
+    def slot(self, priority: str = INTERACTIVE):
+        queued_at = time.perf_counter()
+        waiter = self._try_enter(priority)
+        if waiter is not None and not waiter.event.wait(self.deadlines[priority]):
+            if not self._abandon(waiter):
+                raise LLMOverloaded(priority, self._service_time, "queue wait exceeded deadline")
+        started = time.perf_counter()
+        self._record_wait(priority, started - queued_at)
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - started)
+
+    @asynccontextmanager
+    async def aslot(self, priority: str = INTERACTIVE):
+        queued_at = time.perf_counter()
+        waiter = self._try_enter(priority, asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.deadlines[priority])
+            except asyncio.TimeoutError:
+                if not self._abandon(waiter):
+                    raise LLMOverloaded(priority, self._service_time, "queue wait exceeded deadline")
+            except asyncio.CancelledError:
+                if self._abandon(waiter):
+                    self._release(0.0)
+                raise
+        started = time.perf_counter()
+        self._record_wait(priority, started - queued_at)
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - started)
+
+    # ---------- metrics ----------
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "mode": LLM_SCHEDULER_MODE,
+                "concurrency": self.concurrency,
+                "active": self._active,
+                "avg_service_s": round(self._service_time, 3),
+                "queue_depth": dict(self.depth),
+                "max_queue_depth": dict(self.max_depth),
+                "admitted": dict(self.admitted),
+                "shed": dict(self.shed),
+                "wait_histogram": {
+                    p: {("+Inf" if b == math.inf else str(b)): n for b, n in zip(WAIT_BUCKETS, counts)}
+                    for p, counts in self.wait_histogram.items()
+                },
+            }
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(True)
+
+
+# Global scheduler instance
+_scheduler = LLMScheduler()
+
+
+def get_scheduler() -> LLMScheduler:
+    return _scheduler
+
+
+def require_llm_capacity(priority: str = INTERACTIVE):
+    """
+    FastAPI dependency that sheds load before an endpoint does any work:
+    429 when the class queue is full, 503 when the wait would miss the deadline.
+    """
+    def dependency():
+        try:
+            _scheduler.admit(priority)
+        except LLMOverloaded as e:
+            raise HTTPException(
+                status_code=429 if e.queue_full else 503,
+                detail=str(e),
+                headers={"Retry-After": str(e.retry_after)},
+            )
+    return dependency
+
+
+def run_on_celery(messages: list, model: str, options: dict = None, format: str = None) -> dict:
+    """
+    Celery mode for background jobs: the generation runs on a worker consuming
+    the `llm.background` queue, so worker concurrency bounds Ollama load.
+    """
+    from celery_worker import celery_app
+    from ollama_client import OllamaTimeout, OllamaUnavailable
+
+    result = celery_app.send_task("llm.generate", args=[messages, model, options, format], queue="llm.background")
+    outcome = result.get(timeout=DEADLINES[BACKGROUND])
+    if "error" in outcome:
+        error_cls = {"timeout": OllamaTimeout, "unavailable": OllamaUnavailable}.get(outcome.get("kind"), OllamaError)
+        raise error_cls(outcome["error"])
+    return outcome["data"]
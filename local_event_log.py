@@ -0,0 +1,429 @@
+"""
+File-backed, append-only event log that stands in for Kafka on a single box.
+
+Each topic is a directory of segments. `<base>.log` holds length-prefixed
+records and `<base>.idx` the byte position of every record in it, so a read
+is a bisect to the segment plus an mmap slice. Offsets are per topic and
+start at 0. Consumer groups keep their committed offsets in
+`__consumer_offsets/<group>.json`.
+
+A topic has a single writer process: opening it takes an exclusive flock on
+`<topic>/.lock`, and a second process trying to open the same topic gets an
+error instead of interleaving records. `readonly=True` (used by the dump
+command) skips the lock and never repairs or appends.
+
+    EVENT_BUS_BACKEND=local EVENT_LOG_DIR=./event_log uvicorn main:app
+    python local_event_log.py dump user.behavior --from 0 --limit 20
+"""
+import os
+import re
+import sys
+import json
+import mmap
+import fcntl
+import time
+import struct
+import bisect
+import argparse
+import threading
+from array import array
+
+from event_schemas import encode_event, decode_event
+
+EVENT_LOG_DIR = os.getenv("EVENT_LOG_DIR", "event_log")
+EVENT_LOG_SEGMENT_BYTES = int(os.getenv("EVENT_LOG_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+# Sealed segments beyond this many per topic are deleted (0 keeps everything)
+EVENT_LOG_MAX_SEGMENTS = int(os.getenv("EVENT_LOG_MAX_SEGMENTS", "0"))
+EVENT_LOG_FSYNC = os.getenv("EVENT_LOG_FSYNC", "0") == "1"
+
+# length (uint32), append time in ms (uint64)
+RECORD_HEADER = struct.Struct("<IQ")
+OFFSETS_DIR = "__consumer_offsets"
+LOCK_FILE = ".lock"
+# Same character set and length limit as Kafka topic names
+TOPIC_NAME_RE = re.compile(r"[A-Za-z0-9._-]{1,249}")
+
+
+class Segment:
+    def __init__(self, directory: str, base_offset: int):
+        self.base_offset = base_offset
+        self.log_path = os.path.join(directory, f"{base_offset:020d}.log")
+        self.idx_path = os.path.join(directory, f"{base_offset:020d}.idx")
+        self.positions = array("Q")
+        self.size = 0
+        self._map = None
+        self._map_size = 0
+
+    @property
+    def end_offset(self) -> int:
+        return self.base_offset + len(self.positions)
+
+    def load(self, active: bool, repair: bool = True):
+        """Reads the index; the active segment is rescanned so a torn last write is cut off."""
+        self.size = os.path.getsize(self.log_path) if os.path.exists(self.log_path) else 0
+        if not active and os.path.exists(self.idx_path):
+            with open(self.idx_path, "rb") as f:
+                self.positions.frombytes(f.read())
+            return
+        self.positions = array("Q")
+        position = 0
+        with open(self.log_path, "rb") as f:
+            data = f.read()
+        while position + RECORD_HEADER.size <= len(data):
+            length, _ = RECORD_HEADER.unpack_from(data, position)
+            if position + RECORD_HEADER.size + length > len(data):
+                break
+            self.positions.append(position)
+            position += RECORD_HEADER.size + length
+        self.size = position
+        if not repair:
+            return
+        if position != len(data):
+            print(f"[EVENT LOG] Truncating torn record at {self.log_path}:{position}")
+            with open(self.log_path, "r+b") as f:
+                f.truncate(position)
+        with open(self.idx_path, "wb") as f:
+            f.write(self.positions.tobytes())
+
+    def view(self):
+        """Read-only mmap covering everything written so far (remapped as the segment grows)."""
+        if self._map is None or self._map_size < self.size:
+            if self._map is not None:
+                self._map.close()
+            with open(self.log_path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+            self._map_size = self.size
+        return self._map
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class TopicLog:
+    def __init__(self, directory: str, segment_bytes: int, max_segments: int, readonly: bool = False):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.readonly = readonly
+        self.lock = threading.Lock()
+        self.appended = threading.Condition(self.lock)
+        self._log = self._idx = self._owner = None
+        if not readonly:
+            os.makedirs(directory, exist_ok=True)
+            self._acquire_writer()
+
+        names = os.listdir(directory) if os.path.isdir(directory) else []
+        bases = sorted(int(name[:-4]) for name in names if name.endswith(".log"))
+        self.segments = []
+        for i, base in enumerate(bases or [0]):
+            segment = Segment(directory, base)
+            if readonly and not os.path.exists(segment.log_path):
+                continue
+            if not os.path.exists(segment.log_path):
+                open(segment.log_path, "wb").close()
+            segment.load(active=i == len(bases) - 1 or not bases, repair=not readonly)
+            self.segments.append(segment)
+        if readonly:
+            self.segments = self.segments or [Segment(directory, 0)]
+        else:
+            self._open_active()
+
+    def _acquire_writer(self):
+        # Offsets and segment sizes live in memory, so a second appending
+        # process would write over this one's records
+        self._owner = open(os.path.join(self.directory, LOCK_FILE), "a+")
+        try:
+            fcntl.flock(self._owner.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._owner.close()
+            self._owner = None
+            raise RuntimeError(f"event log topic {self.directory} is open in another process")
+
+    def _open_active(self):
+        active = self.segments[-1]
+        self._log = open(active.log_path, "ab", buffering=0)
+        self._idx = open(active.idx_path, "ab", buffering=0)
+
+    @property
+    def start_offset(self) -> int:
+        return self.segments[0].base_offset
+
+    @property
+    def end_offset(self) -> int:
+        return self.segments[-1].end_offset
+
+    def _roll(self):
+        os.fsync(self._log.fileno())
+        os.fsync(self._idx.fileno())
+        self._log.close()
+        self._idx.close()
+        segment = Segment(self.directory, self.end_offset)
+        open(segment.log_path, "wb").close()
+        self.segments.append(segment)
+        self._open_active()
+        if self.max_segments and len(self.segments) > self.max_segments:
+            for old in self.segments[:-self.max_segments]:
+                old.close()
+                os.remove(old.log_path)
+                os.remove(old.idx_path)
+            self.segments = self.segments[-self.max_segments:]
+
+    def append_many(self, values: list, fsync: bool = False) -> int:
+        """Appends raw record payloads; returns the offset of the first one."""
+        if self.readonly:
+            raise RuntimeError(f"event log topic {self.directory} is open read-only")
+        now_ms = int(time.time() * 1000)
+        with self.lock:
+            first = self.end_offset
+            active = self.segments[-1]
+            chunks, positions = [], array("Q")
+            for value in values:
+                if active.size >= self.segment_bytes and (active.positions or positions):
+                    self._flush(active, chunks, positions, fsync)
+                    chunks, positions = [], array("Q")
+                    self._roll()
+                    active = self.segments[-1]
+                positions.append(active.size)
+                chunks.append(RECORD_HEADER.pack(len(value), now_ms))
+                chunks.append(value)
+                active.size += RECORD_HEADER.size + len(value)
+            self._flush(active, chunks, positions, fsync)
+            self.appended.notify_all()
+            return first
+
+    def _flush(self, segment: Segment, chunks: list, positions: array, fsync: bool):
+        # Records first, index second: a crash in between is repaired by load()
+        self._log.write(b"".join(chunks))
+        self._idx.write(positions.tobytes())
+        segment.positions.extend(positions)
+        if fsync:
+            os.fsync(self._log.fileno())
+
+    def read(self, offset: int, max_records: int = 500) -> list:
+        """[(offset, timestamp_ms, payload bytes)] starting at `offset`."""
+        with self.lock:
+            offset = max(offset, self.start_offset)
+            if offset >= self.end_offset:
+                return []
+            bases = [s.base_offset for s in self.segments]
+            i = bisect.bisect_right(bases, offset) - 1
+            records = []
+            while i < len(self.segments) and len(records) < max_records:
+                segment = self.segments[i]
+                view = segment.view()
+                positions = segment.positions
+                for rel in range(offset - segment.base_offset, len(positions)):
+                    position = positions[rel]
+                    length, timestamp = RECORD_HEADER.unpack_from(view, position)
+                    start = position + RECORD_HEADER.size
+                    records.append((segment.base_offset + rel, timestamp, view[start:start + length]))
+                    if len(records) >= max_records:
+                        break
+                i += 1
+                if i < len(self.segments):
+                    offset = self.segments[i].base_offset
+            return records
+
+    def close(self):
+        with self.lock:
+            for f in (self._log, self._idx, self._owner):
+                if f is not None:
+                    f.close()
+            for segment in self.segments:
+                segment.close()
+
+
+class EventLog:
+    """All topics under one directory, plus consumer-group offsets."""
+
+    def __init__(self, root: str = EVENT_LOG_DIR, segment_bytes: int = EVENT_LOG_SEGMENT_BYTES,
+                 max_segments: int = EVENT_LOG_MAX_SEGMENTS, readonly: bool = False):
+        self.root = root
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        self.readonly = readonly
+        self._topics = {}
+        self._lock = threading.Lock()
+        if not readonly:
+            os.makedirs(os.path.join(root, OFFSETS_DIR), exist_ok=True)
+
+    def topic(self, name: str) -> TopicLog:
+        log = self._topics.get(name)
+        if log is None:
+            with self._lock:
+                log = self._topics.get(name)
+                if log is None:
+                    if name in (".", "..") or name.startswith("__") or not TOPIC_NAME_RE.fullmatch(name):
+                        raise ValueError(f"invalid topic name {name!r}")
+                    log = TopicLog(os.path.join(self.root, name), self.segment_bytes, self.max_segments, self.readonly)
+                    self._topics[name] = log
+        return log
+
+    def topics(self) -> list:
+        return sorted(n for n in os.listdir(self.root) if not n.startswith("__"))
+
+    def append(self, topic: str, value: bytes, fsync: bool = EVENT_LOG_FSYNC) -> int:
+        return self.topic(topic).append_many([value], fsync)
+
+    def append_many(self, topic: str, values: list, fsync: bool = EVENT_LOG_FSYNC) -> int:
+        return self.topic(topic).append_many(values, fsync)
+
+    def read(self, topic: str, offset: int, max_records: int = 500) -> list:
+        return self.topic(topic).read(offset, max_records)
+
+    # ---------- consumer groups ----------
+
+    def _offsets_path(self, group: str) -> str:
+        return os.path.join(self.root, OFFSETS_DIR, f"{group}.json")
+
+    def committed(self, group: str) -> dict:
+        try:
+            with open(self._offsets_path(group)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def commit(self, group: str, offsets: dict):
+        with self._lock:
+            merged = {**self.committed(group), **offsets}
+            path = self._offsets_path(group)
+            with open(path + ".tmp", "w") as f:
+                json.dump(merged, f)
+            os.replace(path + ".tmp", path)
+
+    def close(self):
+        for log in list(self._topics.values()):
+            log.close()
+
+
+class EventLogConsumer:
+    """
+    Reads topics from a group's committed offsets (or the start of the log).
+    Call commit() after processing; an uncommitted batch is redelivered to
+    the next consumer of the group, as with Kafka.
+    """
+
+    def __init__(self, log: EventLog, group: str, topics: list, auto_commit: bool = False):
+        self.log = log
+        self.group = group
+        self.topics = list(topics)
+        self.auto_commit = auto_commit
+        committed = log.committed(group)
+        self.positions = {t: committed.get(t, 0) for t in self.topics}
+
+    def seek(self, topic: str, offset: int):
+        self.positions[topic] = offset
+
+    def poll(self, max_records: int = 500, timeout: float = 0.0) -> list:
+        """[(topic, offset, event dict)], waiting up to `timeout` seconds for new events."""
+        deadline = time.monotonic() + timeout
+        while True:
+            batch = []
+            for topic in self.topics:
+                for offset, _, value in self.log.read(topic, self.positions[topic], max_records - len(batch)):
+                    batch.append((topic, offset, decode_event(value)))
+                    self.positions[topic] = offset + 1
+                if len(batch) >= max_records:
+                    break
+            remaining = deadline - time.monotonic()
+            if batch or remaining <= 0:
+                if batch and self.auto_commit:
+                    self.commit()
+                return batch
+            # Wake on the next append to any of our topics (checked at least every 100ms)
+            log = self.log.topic(self.topics[0])
+            with log.appended:
+                log.appended.wait(min(remaining, 0.1))
+
+    def commit(self):
+        self.log.commit(self.group, dict(self.positions))
+
+    def lag(self) -> dict:
+        return {t: self.log.topic(t).end_offset - self.positions[t] for t in self.topics}
+
+
+class LocalEventBus:
+    """
+    publish_event() backend writing to an EventLog instead of Kafka
+    (EVENT_BUS_BACKEND=local). Appends are synchronous but local; delivery
+    "all" additionally fsyncs the record.
+    """
+
+    def __init__(self, log: EventLog = None):
+        self.log = log or EventLog()
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def publish(self, topic: str, event_data: dict, delivery: str = None):
+        value = encode_event(topic, event_data)
+        started = time.perf_counter()
+        offset = self.log.append(topic, value, fsync=EVENT_LOG_FSYNC or delivery == "all")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            m = self._metrics.setdefault(topic, {"appended": 0, "bytes": 0, "latency_ms_total": 0.0, "latency_ms_max": 0.0})
+            m["appended"] += 1
+            m["bytes"] += len(value)
+            m["latency_ms_total"] += elapsed_ms
+            m["latency_ms_max"] = max(m["latency_ms_max"], elapsed_ms)
+        return offset
+
+    def publish_batch(self, events: list, delivery: str = None, timeout: float = None) -> list:
+        """Same contract as EventProducer.publish_batch: None per appended event, else the error."""
+        results = []
+        for topic, event_data in events:
+            try:
+                self.publish(topic, event_data, delivery)
+                results.append(None)
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def flush(self, timeout: float = None):
+        pass
+
+    def close(self, timeout: float = None):
+        self.log.close()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "local",
+                "directory": os.path.abspath(self.log.root),
+                "topics": {
+                    topic: {
+                        "appended": m["appended"],
+                        "bytes": m["bytes"],
+                        "end_offset": self.log.topic(topic).end_offset,
+                        "avg_latency_ms": round(m["latency_ms_total"] / m["appended"], 3),
+                        "max_latency_ms": round(m["latency_ms_max"], 3),
+                    }
+                    for topic, m in self._metrics.items()
+                },
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect a local event log")
+    parser.add_argument("command", choices=["topics", "dump"])
+    parser.add_argument("topic", nargs="?")
+    parser.add_argument("--dir", default=EVENT_LOG_DIR)
+    parser.add_argument("--from", dest="offset", type=int, default=0)
+    parser.add_argument("--limit", type=int, default=100)
+    args = parser.parse_args()
+
+    log = EventLog(args.dir, readonly=True)
+    if args.command == "topics":
+        for name in log.topics():
+            t = log.topic(name)
+            print(f"{name:<32} offsets {t.start_offset}..{t.end_offset}  segments={len(t.segments)}")
+    else:
+        if not args.topic:
+            sys.exit("dump needs a topic")
+        for offset, timestamp, value in log.read(args.topic, args.offset, args.limit):
+            print(f"{offset}\t{timestamp}\t{json.dumps(decode_event(value))}")
+
+
+if __name__ == "__main__":
+    main()
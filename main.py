@@ -1,6 +1,8 @@
-from fastapi import FastAPI, Form, Request, BackgroundTasks, UploadFile, File
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Form, Request, BackgroundTasks, UploadFile, File, Depends
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 import traceback
+import json
 from fastapi.middleware.cors import CORSMiddleware
 from twilio.rest import Client
 import os
@@ -15,11 +17,14 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Link", "X-Next-Cursor"],
 )
 
 from config_db import init_db
 init_db()
 
+from llm_scheduler import require_llm_capacity, BACKGROUND
+
 import api_router
 import p1_marketplace
 import p2_finance
@@ -55,7 +60,7 @@ def analyze_and_alert_crash(url: str, error_trace: str):
         ]
         
         # Ollama generates the fix
-        ai_fix = generate_response(messages, model="phi3")
+        ai_fix = generate_response(messages, model="phi3", priority=BACKGROUND)
         
         # Alert Developer via Email
         dev_email = os.getenv("EMAIL_USER")
@@ -101,8 +106,114 @@ def trigger_crash():
 def home():
     return {"status": "Ready for Hackathon!"}
 
+@app.get("/ai/metrics")
+def ai_metrics():
+    """
+    Per-backend Ollama latency / queue-time and health, cache hit rates, coalescing counters,
+    scheduler queue depth / wait-time histograms and email intent routing paths.
+    """
+    from ai_service import get_metrics
+    from email_intent import get_intent_stats
+    return {"status": "success", "metrics": {**get_metrics(), "email_intent": get_intent_stats()}}
+
+@app.on_event("startup")
+def start_ollama_router():
+    # Health checks and model warm-up run in a background thread
+    from ollama_router import get_ollama_router
+    get_ollama_router().start()
+
+@app.on_event("shutdown")
+async def close_ollama_router():
+    from ollama_router import get_ollama_router
+    router = get_ollama_router()
+    router.stop()
+    await router.aclose()
+
+@app.on_event("startup")
+def start_outbox_relay():
+    from outbox_relay import get_outbox_relay
+    get_outbox_relay().start()
+
+@app.on_event("startup")
+def start_search_index():
+    # Snapshot load, database refresh and event-feed sync run in a background thread
+    from product_search import get_search_index
+    get_search_index().start()
+
+@app.on_event("shutdown")
+def stop_search_index():
+    from product_search import get_search_index
+    get_search_index().stop()
+
+@app.on_event("startup")
+async def start_realtime_hub():
+    # Publisher task must live on the server's event loop
+    from realtime_hub import get_realtime_hub
+    await get_realtime_hub().start()
+
+@app.on_event("shutdown")
+async def stop_realtime_hub():
+    from realtime_hub import get_realtime_hub
+    await get_realtime_hub().stop()
+
+@app.on_event("startup")
+def start_user_analytics():
+    # First /admin/analyze then finds a summary instead of building one
+    from database import supabase
+    from admin_analytics import get_user_analytics
+    get_user_analytics().start_rebuild(supabase)
+
+@app.on_event("startup")
+def start_credit_ledger():
+    from credit_ledger import get_credit_ledger
+    get_credit_ledger().start()
+
+@app.on_event("shutdown")
+def close_credit_ledger():
+    # Writes pending usage and hands unused leased credits back
+    from credit_ledger import get_credit_ledger
+    get_credit_ledger().close()
+
+@app.on_event("startup")
+def start_registration_sweeper():
+    # Resubmits steps a previous run (or another worker) left unfinished
+    from registration_pipeline import get_registration_pipeline
+    get_registration_pipeline().start_sweeper()
+
+@app.on_event("shutdown")
+def stop_registration_pipeline():
+    # Lets running steps finish; retries still waiting on their backoff are picked up by a later sweep
+    from registration_pipeline import get_registration_pipeline
+    get_registration_pipeline().shutdown()
+
+@app.on_event("shutdown")
+def close_smtp_sessions():
+    from smtp_transport import get_smtp_transport
+    get_smtp_transport().close()
+
+@app.on_event("shutdown")
+def flush_kafka_producer():
+    # Drain committed outbox rows, then deliver batched / retry-buffered events before the process exits
+    from outbox_relay import get_outbox_relay
+    from kafka_producer import close_kafka_producer
+    get_outbox_relay().stop()
+    close_kafka_producer()
+
+@app.get("/events/metrics")
+def events_metrics():
+    """Per-topic event bus throughput and latency (Kafka producer or local event log), outbox backlog and binary/JSON encoding counts."""
+    from kafka_producer import get_event_producer
+    from event_schemas import registry
+    from outbox_relay import get_outbox_relay
+    return {
+        "status": "success",
+        "metrics": get_event_producer().metrics(),
+        "outbox": get_outbox_relay().metrics(),
+        "encoding": {"counts": dict(registry.counts), "schemas": registry.describe()},
+    }
+
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 from database import process_framework_action, create_razorpay_order
 
 class User(BaseModel):
@@ -159,6 +270,18 @@ def get_user_endpoint(email: str):
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@app.get("/credits/stats")
+def credit_ledger_stats():
+    """Reservations, refunds, rejections, leases and batched ledger writes of this worker's credit ledger."""
+    from credit_ledger import get_credit_ledger
+    return {"status": "success", "stats": get_credit_ledger().stats()}
+
+@app.get("/user-cache/stats")
+def user_cache_stats():
+    """Hit rates (local / shared tier, negative hits), loads and invalidations of the user profile cache."""
+    from user_cache import get_user_cache
+    return {"status": "success", "stats": get_user_cache().stats()}
+
 @app.post("/create-order")
 def create_order(request: OrderRequest):
     try:
@@ -175,6 +298,7 @@ def register_user(user: User, background_tasks: BackgroundTasks):
         # Initialize credits based on status
         initial_credits = 100 if user.payment_id else 5
         
+        # Only the Supabase write happens here; invoice, email and WhatsApp are queued
         result = process_framework_action(user.name, user.email, user.phone, user.payment_id, initial_credits)
         
         # Trigger AI onboarding in the background
@@ -184,6 +308,27 @@ def register_user(user: User, background_tasks: BackgroundTasks):
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@app.get("/email/stats")
+def email_transport_stats():
+    """SMTP session reuse (connects vs messages sent), reconnects, health check failures and rate limiting."""
+    from smtp_transport import get_smtp_transport
+    return {"status": "success", "stats": get_smtp_transport().stats()}
+
+@app.get("/registrations/stats")
+def registration_pipeline_stats():
+    """Registrations started and step outcomes / retries in this worker's registration pipeline."""
+    from registration_pipeline import get_registration_pipeline
+    return {"status": "success", "stats": get_registration_pipeline().stats()}
+
+@app.get("/registrations/{registration_id}")
+def registration_status(registration_id: str):
+    """Status, attempts and last error of each side effect (invoice, email, WhatsApp) of a registration."""
+    from registration_pipeline import get_registration_pipeline
+    status = get_registration_pipeline().status(registration_id)
+    if status is None:
+        return {"status": "error", "message": "Registration not found"}
+    return {"status": "success", "registration": status}
+
 import hmac
 import hashlib
 
@@ -242,10 +387,7 @@ class ChatRequest(BaseModel):
     model: str = "phi3"
     email: Optional[str] = None
 
-@app.post("/chat")
-def chat_endpoint(request: ChatRequest):
-    from ai_service import generate_response
-    
+def build_chat_context(request: ChatRequest) -> list:
     context_msgs = request.messages
     if request.email:
         from database import get_user_by_email
@@ -256,19 +398,59 @@ def chat_endpoint(request: ChatRequest):
                 "content": f"You are a helpful assistant for this SaaS platform. The user you are talking to is named {user.get('name', 'User')}. Their subscription status is {user.get('status', 'Free')}. Keep your answers helpful and concise."
             }
             context_msgs = [system_prompt] + request.messages
-            
-    response = generate_response(context_msgs, request.model)
+    return context_msgs
+
+@app.post("/chat", dependencies=[Depends(require_llm_capacity())])
+def chat_endpoint(request: ChatRequest):
+    from ai_service import generate_response
+    
+    context_msgs = build_chat_context(request)
+    response = generate_response(context_msgs, request.model, use_cache=False)
     return {"response": response}
 
-@app.post("/whatsapp-webhook")
+async def sse_token_stream(http_request: Request, messages: list, model: str, on_complete=None):
+    """
+    Relays Ollama tokens as Server-Sent Events. Stops (and so cancels the
+    upstream generation) as soon as the client disconnects. `on_complete`
+    only runs after a full, successful generation.
+    """
+    from ai_service import astream_response, error_message
+    from ollama_client import OllamaError
+
+    parts = []
+    try:
+        async for token in astream_response(messages, model):
+            if await http_request.is_disconnected():
+                print("[STREAM] Client disconnected, cancelling generation.")
+                return
+            parts.append(token)
+            yield f"data: {json.dumps({'token': token})}\n\n"
+    except OllamaError as e:
+        yield f"data: {json.dumps({'error': error_message(e)})}\n\n"
+        return
+
+    final = {"done": True}
+    if on_complete:
+        final.update(await on_complete("".join(parts)))
+    yield f"data: {json.dumps(final)}\n\n"
+
+@app.post("/chat/stream", dependencies=[Depends(require_llm_capacity())])
+async def chat_stream_endpoint(request: ChatRequest, http_request: Request):
+    """
+    Streaming variant of /chat: tokens are pushed as SSE while Ollama generates them.
+    """
+    context_msgs = await run_in_threadpool(build_chat_context, request)
+    return StreamingResponse(sse_token_stream(http_request, context_msgs, request.model), media_type="text/event-stream")
+
+@app.post("/whatsapp-webhook", dependencies=[Depends(require_llm_capacity())])
 async def whatsapp_webhook(request: Request, From: str = Form(...), Body: str = Form(...)):
     """
     Receives incoming WhatsApp messages from Twilio, gets an AI response
     from Ollama, and sends it back to the user via WhatsApp.
     """
     try:
-        from ai_service import generate_response
-        from database import supabase
+        from ai_service import agenerate_response
+        from database import get_user_by_phone
         import os
         from twilio.rest import Client
         
@@ -278,10 +460,9 @@ async def whatsapp_webhook(request: Request, From: str = Form(...), Body: str =
         system_prompt = "You are a helpful and very concise AI assistant for a SaaS platform. Keep responses under 2 sentences."
         
         try:
-             # Try to find user by phone to give AI more context
-             db_response = supabase.table("hackathon_data").select("*").eq("phone", phone_number).execute()
-             if db_response.data and len(db_response.data) > 0:
-                 user = db_response.data[0]
+             # Try to find user by phone to give AI more context (cached, and off the event loop on a miss)
+             user = await run_in_threadpool(get_user_by_phone, phone_number)
+             if user:
                  system_prompt = f"You are a concise AI assistant for a SaaS platform. You are talking to a registered user named {user.get('name', 'User')} on the {user.get('status', 'Free')} plan. Keep it extremely brief."
         except Exception as e:
              pass # if DB query fails, just use default prompt
@@ -292,7 +473,7 @@ async def whatsapp_webhook(request: Request, From: str = Form(...), Body: str =
             {"role": "user", "content": Body}
         ]
         
-        ai_reply = generate_response(messages, model="phi3")
+        ai_reply = await agenerate_response(messages, model="phi3", use_cache=False)
         
         # 3. Send AI response back via Twilio
         account_sid = os.environ.get('TWILIO_SID')
@@ -319,7 +500,7 @@ class EmailWebhookRequest(BaseModel):
     subject: str
     body: str
 
-@app.post("/email-webhook")
+@app.post("/email-webhook", dependencies=[Depends(require_llm_capacity())])
 def email_webhook(request: EmailWebhookRequest):
     """
     Agentic Email Router: Uses AI to detect user intent (support vs schedule), 
@@ -328,37 +509,16 @@ def email_webhook(request: EmailWebhookRequest):
     try:
         from ai_service import generate_response
         from database import send_email_via_gmail
-        import json
+        from email_intent import classify_email
         
-        # 1. Ask AI to output strict JSON recognizing the Intent
-        intent_prompt = f"Analyze this email from {request.sender_email}: '{request.subject} - {request.body}'. " \
-                        f"If they are asking to schedule a meeting, output valid JSON: {{\"intent\": \"schedule\", \"date\": \"extracted_date\", \"time\": \"extracted_time\"}}. " \
-                        f"Otherwise, output: {{\"intent\": \"support\"}}. Output ONLY raw JSON, nothing else."
-        
-        messages = [
-            {"role": "system", "content": "You are a strict JSON-only API router. Return only valid python dictionary strings without markdown syntax, no backticks."},
-            {"role": "user", "content": intent_prompt}
-        ]
-        
-        ai_raw_json = generate_response(messages, model="phi3")
-        
-        try:
-            # Clean up the output in case the local LLM wraps it in markdown
-            if "```json" in ai_raw_json:
-                ai_raw_json = ai_raw_json.split("```json")[1].split("```")[0].strip()
-            elif "```" in ai_raw_json:
-                ai_raw_json = ai_raw_json.split("```")[1].split("```")[0].strip()
-                
-            parsed_data = json.loads(ai_raw_json)
-        except Exception as parse_e:
-            print(f"[WARN] JSON Parse Failed, falling back to Support Workflow. Raw AI: {ai_raw_json}")
-            parsed_data = {"intent": "support"}
+        # 1. Detect the intent: keyword/date rules first, Ollama JSON mode only when they are unsure
+        parsed_data = classify_email(request.sender_email, request.subject, request.body)
         
         # 2. Agentic Routing Logic
         if parsed_data.get("intent") == "schedule":
             # Workflow A: Auto-Scheduler
-            date = parsed_data.get("date", "soon")
-            time = parsed_data.get("time", "TBD")
+            date = parsed_data.get("date") or "soon"
+            time = parsed_data.get("time") or "TBD"
             
             # (In a real app, we would insert an event into Supabase Calendar here)
             print(f"[AGENT] Auto-scheduling meeting for {date} at {time} in Database...")
@@ -379,12 +539,13 @@ def email_webhook(request: EmailWebhookRequest):
         send_email_via_gmail(
             to_email=request.sender_email,
             subject=subject,
-            body_html=f"<p>{ai_reply.replace('\n', '<br>')}</p>"
+            body_html="<p>" + ai_reply.replace('\n', '<br>') + "</p>"
         )
         
         return {
             "status": "success", 
             "ai_intent": parsed_data.get("intent"),
+            "intent_path": parsed_data.get("path"),
             "ai_reply": ai_reply
         }
     except Exception as e:
@@ -400,12 +561,12 @@ def background_onboarding_task(email: str, name: str, status: str):
         {"role": "user", "content": prompt}
     ]
     
-    ai_email_body = generate_response(messages, model="phi3")
+    ai_email_body = generate_response(messages, model="phi3", use_cache=False, priority=BACKGROUND)
     
     send_email_via_gmail(
         to_email=email,
         subject="Checking in!",
-        body_html=f"<p>{ai_email_body.replace('\n', '<br>')}</p>"
+        body_html="<p>" + ai_email_body.replace('\n', '<br>') + "</p>"
     )
 
 class OnboardingRequest(BaseModel):
@@ -422,7 +583,7 @@ def trigger_onboarding(request: OnboardingRequest, background_tasks: BackgroundT
     return {"status": "success", "message": "Onboarding background task triggered! Email will arrive soon."}
 
 
-@app.post("/upload-audio")
+@app.post("/upload-audio", dependencies=[Depends(require_llm_capacity())])
 async def upload_audio(file: UploadFile = File(...)):
     """
     Accepts a .wav audio file, transcribes it using SpeechRecognition, 
@@ -434,7 +595,7 @@ async def upload_audio(file: UploadFile = File(...)):
     try:
         import speech_recognition as sr
         import shutil
-        from ai_service import generate_response
+        from ai_service import agenerate_response
         import tempfile
         import os
         
@@ -458,7 +619,7 @@ async def upload_audio(file: UploadFile = File(...)):
             {"role": "system", "content": "You are an executive assistant. Your job is to extract extremely concise summaries and action items from transcripts."},
             {"role": "user", "content": prompt}
         ]
-        summary = generate_response(messages, model="phi3")
+        summary = await agenerate_response(messages, model="phi3")
         
         return {
             "status": "success", 
@@ -482,33 +643,33 @@ def get_all_users():
 class AdminAnalyzeRequest(BaseModel):
     query: str
 
-@app.post("/admin/analyze")
+@app.post("/admin/analyze", dependencies=[Depends(require_llm_capacity())])
 def analyze_data(request: AdminAnalyzeRequest):
     """
-    Feeds the entire user JSON database into Ollama and asks a question about it.
+    Answers a question about the user base from a compact, incrementally
+    maintained summary (counts, distributions, top-N, sampled rows) instead
+    of the raw table, so the prompt stays the same size as users grow.
     """
     try:
         from database import supabase
         from ai_service import generate_response
-        import json
+        from admin_analytics import get_user_analytics, lookup_mentioned_users
         
-        # 1. Fetch raw data
-        db_response = supabase.table("hackathon_data").select("*").execute()
-        raw_data = db_response.data
+        # 1. Bring the cached summary up to date (only new rows are read)
+        analytics = get_user_analytics()
+        analytics.refresh(supabase)
         
-        # 2. Convert to string
-        json_data_str = json.dumps(raw_data)
+        # 2. Build a prompt from the summary plus any users the question names
+        prompt = analytics.build_prompt(request.query, lookup_mentioned_users(supabase, request.query))
         
         # 3. Ask Ollama!
-        prompt = f"You are a Data Analyst AI. Look at this raw user database JSON:\n\n{json_data_str}\n\nAnswer the CEO's question accurately based ONLY on this data: '{request.query}'"
-        
         messages = [
             {"role": "system", "content": "You are a concise, highly analytical Data Scientist. Provide answers in 2-4 sentences max based on the provided JSON data."},
             {"role": "user", "content": prompt}
         ]
         
         analysis = generate_response(messages, model="phi3")
-        return {"status": "success", "analysis": analysis}
+        return {"status": "success", "analysis": analysis, "users_analyzed": analytics.total}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
@@ -516,48 +677,71 @@ class TranslateRequest(BaseModel):
     text: str
     target_language: str
 
-@app.post("/translate")
+@app.post("/translate", dependencies=[Depends(require_llm_capacity())])
 def translate_text(request: TranslateRequest):
     """
     Translates UI text into a target language using Ollama.
+    Strings already in the translation memory never reach the model.
     """
     try:
-        from ai_service import generate_response
-        
-        prompt = f"Translate the following UI text into {request.target_language} accurately and concisely. Return ONLY the translated text, no quotes or conversational filler: '{request.text}'"
+        from ai_service import error_message
+        from ollama_client import OllamaError
+        from translation_memory import get_translation_memory
         
-        messages = [
-            {"role": "system", "content": f"You are a professional localization expert. Translate directly into {request.target_language} without any extra explanation."},
-            {"role": "user", "content": prompt}
-        ]
-        
-        translated_text = generate_response(messages, model="phi3").strip(' "\'\n`')
+        try:
+            translated_text = get_translation_memory().translate(request.text, request.target_language)
+        except OllamaError as e:
+            translated_text = error_message(e)
         return {"status": "success", "translated_text": translated_text}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+class TranslateBatchRequest(BaseModel):
+    texts: List[str]
+    target_language: str
+
+@app.post("/translate/batch", dependencies=[Depends(require_llm_capacity())])
+def translate_batch(request: TranslateBatchRequest):
+    """
+    Translates a whole bundle of UI strings in one call: memory hits come back at once,
+    misses go to Ollama packed into JSON groups and are remembered for next time.
+    """
+    try:
+        from translation_memory import get_translation_memory
+        
+        result = get_translation_memory().translate_batch(request.texts, request.target_language)
+        return {"status": "success", **result}
+    except Exception as e:
+        return {"status": "error", "message": str(e)}
+
+@app.get("/translate/stats")
+def translate_stats():
+    from translation_memory import get_translation_memory
+    return {"status": "success", "stats": get_translation_memory().stats()}
+
 class WriterRequest(BaseModel):
     email: str
     topic: str
     tone: str = "Professional"
 
-@app.post("/ai-writer")
+@app.post("/ai-writer", dependencies=[Depends(require_llm_capacity())])
 def ai_writer(request: WriterRequest):
     """
-    SaaS feature: deducts 1 credit to generate a blog post via Ollama.
+    SaaS feature: spends 1 credit to generate a blog post via Ollama.
+    The credit is reserved up front and refunded if generation fails.
     """
     try:
-        from ai_service import generate_response
-        from database import supabase
+        from ai_service import chat_completion, error_message
+        from credit_ledger import get_credit_ledger, InsufficientCredits, UnknownUser
+        from ollama_client import OllamaError
         
-        # 1. Check Credits
-        user_res = supabase.table("hackathon_data").select("id, credits").eq("email", request.email).execute()
-        if not user_res.data or len(user_res.data) == 0:
+        # 1. Reserve a credit
+        ledger = get_credit_ledger()
+        try:
+            reservation = ledger.reserve(request.email)
+        except UnknownUser:
             return {"status": "error", "message": "User not found."}
-            
-        current_credits = user_res.data[0].get("credits", 0)
-        
-        if current_credits <= 0:
+        except InsufficientCredits:
             return {"status": "error", "message": "Insufficient Credits. Please upgrade your subscription."}
             
         # 2. Generate Content
@@ -567,20 +751,65 @@ def ai_writer(request: WriterRequest):
             {"role": "user", "content": prompt}
         ]
         
-        article = generate_response(messages, model="phi3")
+        try:
+            # Articles should differ between requests, so skip the output cache
+            article = chat_completion(messages, model="phi3", use_cache=False)
+        except Exception as e:
+            ledger.refund(reservation)
+            return {"status": "error", "message": error_message(e) if isinstance(e, OllamaError) else str(e)}
         
-        # 3. Deduct Credit
-        new_credits = current_credits - 1
-        supabase.table("hackathon_data").update({"credits": new_credits}).eq("email", request.email).execute()
+        # 3. Spend the credit (written to the ledger in the next batch)
+        credits_remaining = ledger.commit(reservation, feature="ai-writer")
         
         # 4. Optional: Save to a user_content table (skipped here to keep Supabase schema simple for the hackathon, returning right to UI)
         
         return {
             "status": "success", 
             "article": article,
-            "credits_remaining": new_credits
+            "credits_remaining": credits_remaining
         }
         
     except Exception as e:
         print(f"[ERROR] AI Writer Failed: {e}")
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        return {"status": "error", "message": str(e)}
+
+@app.post("/ai-writer/stream", dependencies=[Depends(require_llm_capacity())])
+async def ai_writer_stream(request: WriterRequest, http_request: Request):
+    """
+    Streaming variant of /ai-writer. The credit is reserved up front and
+    spent only once the article has been generated completely; a disconnect
+    or AI error refunds it.
+    """
+    from credit_ledger import get_credit_ledger, InsufficientCredits, UnknownUser
+
+    ledger = get_credit_ledger()
+    try:
+        # May open the account or lease credits, both database round trips
+        reservation = await run_in_threadpool(ledger.reserve, request.email)
+    except UnknownUser:
+        return {"status": "error", "message": "User not found."}
+    except InsufficientCredits:
+        return {"status": "error", "message": "Insufficient Credits. Please upgrade your subscription."}
+
+    prompt = f"Write a structured, engaging ~300 word blog post about '{request.topic}'. Tone: {request.tone}."
+    messages = [
+        {"role": "system", "content": "You are an expert AI copywriter for a SaaS platform. Use markdown headings."},
+        {"role": "user", "content": prompt}
+    ]
+    spent = False
+
+    async def spend_credit(article: str):
+        nonlocal spent
+        spent = True
+        return {"credits_remaining": ledger.commit(reservation, feature="ai-writer")}
+
+    async def metered_stream():
+        try:
+            async for event in sse_token_stream(http_request, messages, "phi3", on_complete=spend_credit):
+                yield event
+        finally:
+            # Disconnects, AI errors and cancellation all end up here
+            if not spent:
+                ledger.refund(reservation)
+
+    return StreamingResponse(metered_stream(), media_type="text/event-stream")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Text, Enum
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, Date, DateTime, Text, Enum, Index, LargeBinary
 from sqlalchemy.orm import relationship, declarative_base
 import datetime
 import enum
@@ -74,6 +74,13 @@ class Product(Base):
     meesho_url = Column(String, nullable=True)
     is_active = Column(Boolean, default=True)
 
+    # Catalog keyset pages: filter on is_active (+ vendor), walk in (price,) id order
+    __table_args__ = (
+        Index("ix_products_active_id", "is_active", "id"),
+        Index("ix_products_active_vendor_id", "is_active", "vendor_id", "id"),
+        Index("ix_products_active_price_id", "is_active", "price", "id"),
+    )
+
     # Relationships
     vendor = relationship("Vendor", back_populates="products")
 
@@ -119,3 +126,65 @@ class ReturnRequest(Base):
     # Relationships
     order = relationship("Order", back_populates="return_requests")
     customer = relationship("User")
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    topic = Column(String, nullable=False)
+    event_key = Column(String, unique=True, nullable=False) # dedup key, also sent as event_id
+    payload = Column(Text, nullable=False) # JSON
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    published_at = Column(DateTime, nullable=True, index=True)
+    attempts = Column(Integer, default=0)
+    last_error = Column(Text, nullable=True)
+    next_attempt_at = Column(DateTime, nullable=True) # set after a failed attempt; the relay skips the row until then
+    parked_at = Column(DateTime, nullable=True) # gave up after OUTBOX_MAX_ATTEMPTS; clear to retry
+
+class VendorDailySales(Base):
+    __tablename__ = "vendor_daily_sales"
+
+    # Maintained by checkout and vendor_analytics.rebuild(); the primary key doubles as the range index
+    vendor_id = Column(Integer, ForeignKey("vendors.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    revenue = Column(Float, nullable=False, default=0.0)
+    units = Column(Integer, nullable=False, default=0)
+    orders = Column(Integer, nullable=False, default=0)
+    commission = Column(Float, nullable=False, default=0.0)
+
+class CreditAccount(Base):
+    __tablename__ = "credit_accounts"
+
+    # SaaS users live in Supabase (hackathon_data) and are keyed by email; see credit_ledger.py
+    email = Column(String, primary_key=True)
+    balance = Column(Integer, nullable=False, default=0) # always the sum of the user's ledger amounts
+    leased = Column(Integer, nullable=False, default=0) # part of balance held in workers' in-memory buckets
+    leased_at = Column(DateTime, nullable=True) # last lease or heartbeat, for recovering a dead worker's lease
+
+class CreditLedgerEntry(Base):
+    __tablename__ = "credit_ledger"
+
+    # Append-only audit trail: rows are never updated or deleted
+    id = Column(Integer, primary_key=True, index=True)
+    email = Column(String, nullable=False, index=True)
+    kind = Column(String, nullable=False) # grant | usage
+    amount = Column(Integer, nullable=False) # +credits granted, -1 per metered generation
+    reservation_id = Column(String, unique=True, nullable=True) # usage rows: one per reservation
+    feature = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class RegistrationStep(Base):
+    __tablename__ = "registration_steps"
+
+    # One row per side effect of a /register call; see registration_pipeline.py
+    registration_id = Column(String, primary_key=True)
+    step = Column(String, primary_key=True) # invoice | email | whatsapp
+    status = Column(String, nullable=False, default="pending") # pending | queued | running | retrying | succeeded | failed | skipped
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    result = Column(Text, nullable=True)
+    output = Column(LargeBinary, nullable=True) # invoice PDF, kept until the email step is done with it
+    payload = Column(Text, nullable=True) # JSON of the user the steps run for, so a sweep can resubmit them
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
@@ -0,0 +1,282 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # async calls fall back to the sync session in a worker thread
+    httpx = None
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://127.0.0.1:11434")
+OLLAMA_POOL_SIZE = int(os.getenv("OLLAMA_POOL_SIZE", "8"))
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "60"))
+
+# Keep this many recent samples per metric for percentile reporting
+METRICS_WINDOW = 1024
+
+
+class OllamaError(Exception):
+    """Raised when Ollama cannot be reached or returns an unusable response."""
+
+
+class OllamaTimeout(OllamaError):
+    pass
+
+
+class OllamaUnavailable(OllamaError):
+    pass
+
+
+def _percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+class ClientMetrics:
+    """
+    Rolling latency / queue-time statistics for Ollama calls.
+    `queue_ms` is time spent waiting for a free pooled connection,
+    `latency_ms` is the HTTP round-trip once a connection was obtained.
+    `in_flight` counts requests from the moment they queue for a connection,
+    so it can exceed the pool size; `waiting` is the queued part of it.
+    """
+
+    def __init__(self, window: int = METRICS_WINDOW):
+        self._lock = threading.Lock()
+        self._latency = deque(maxlen=window)
+        self._queue = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.waiting = 0
+
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+            self.waiting += 1
+
+    def admitted(self):
+        with self._lock:
+            self.waiting -= 1
+
+    def abandon(self):
+        # Gave up while still queued (e.g. cancelled)
+        with self._lock:
+            self.in_flight -= 1
+            self.waiting -= 1
+
+    def record(self, queue_s: float, latency_s: float, ok: bool):
+        with self._lock:
+            self.in_flight -= 1
+            self.calls += 1
+            if not ok:
+                self.errors += 1
+            self._queue.append(queue_s * 1000.0)
+            self._latency.append(latency_s * 1000.0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            latency = list(self._latency)
+            queue = list(self._queue)
+            stats = {"calls": self.calls, "errors": self.errors, "in_flight": self.in_flight, "waiting": self.waiting}
+        for name, samples in (("latency_ms", latency), ("queue_ms", queue)):
+            stats[name] = {
+                "avg": round(sum(samples) / len(samples), 2) if samples else 0.0,
+                "p50": round(_percentile(samples, 50), 2),
+                "p95": round(_percentile(samples, 95), 2),
+                "p99": round(_percentile(samples, 99), 2),
+            }
+        return stats
+
+
+class OllamaClient:
+    """
+    Shared Ollama HTTP client.
+
+    Sync calls go through one keep-alive `requests.Session`, async calls through
+    one `httpx.AsyncClient` per event loop. Both are capped at `pool_size`
+    concurrent requests so a burst queues here instead of opening new sockets.
+    """
+
+    def __init__(self, base_url: str = OLLAMA_BASE_URL, pool_size: int = OLLAMA_POOL_SIZE, timeout: float = OLLAMA_TIMEOUT):
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.metrics = ClientMetrics()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._slots = threading.BoundedSemaphore(pool_size)
+
+        self._async_client = None
+        self._async_slots = None
+        self._async_loop = None
+
+    # ---------- helpers ----------
+
+    def _payload(self, messages, model, options=None, stream=False, **extra):
+        payload = {"model": model, "messages": messages, "stream": stream}
+        if options:
+            payload["options"] = options
+        payload.update({k: v for k, v in extra.items() if v is not None})
+        return payload
+
+    def _ensure_async(self):
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            # Clients and semaphores are bound to the loop they were created on
+            self._async_loop = loop
+            self._async_slots = asyncio.Semaphore(self.pool_size)
+            if httpx is not None:
+                limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+                self._async_client = httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=self.timeout)
+
+    # ---------- sync ----------
+
+    def post(self, path: str, payload: dict, timeout: float = None) -> dict:
+        queued_at = time.perf_counter()
+        self.metrics.begin()
+        self._slots.acquire()
+        started = time.perf_counter()
+        self.metrics.admitted()
+        ok = False
+        try:
+            response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=timeout or self.timeout)
+            response.raise_for_status()
+            data = response.json()
+            ok = True
+            return data
+        except requests.exceptions.ConnectionError as e:
+            raise OllamaUnavailable(str(e)) from e
+        except requests.exceptions.Timeout as e:
+            raise OllamaTimeout(str(e)) from e
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise OllamaError(str(e)) from e
+        finally:
+            self._slots.release()
+            self.metrics.record(started - queued_at, time.perf_counter() - started, ok)
+
+    def chat(self, messages: list, model: str = "phi3", options: dict = None, **extra) -> dict:
+        return self.post("/api/chat", self._payload(messages, model, options, **extra))
+
+    def get(self, path: str, timeout: float = 5.0) -> dict:
+        """
+        Lightweight GET for health / status endpoints. Uses its own connection
+        so a saturated pool cannot make a busy backend look dead.
+        """
+        try:
+            response = requests.get(f"{self.base_url}{path}", timeout=timeout)
+            response.raise_for_status()
+            return response.json()
+        except requests.exceptions.ConnectionError as e:
+            raise OllamaUnavailable(str(e)) from e
+        except (requests.exceptions.RequestException, ValueError) as e:
+            raise OllamaError(str(e)) from e
+
+    # ---------- async ----------
+
+    async def apost(self, path: str, payload: dict, timeout: float = None) -> dict:
+        if httpx is None:
+            return await asyncio.to_thread(self.post, path, payload, timeout)
+
+        self._ensure_async()
+        queued_at = time.perf_counter()
+        self.metrics.begin()
+        try:
+            await self._async_slots.acquire()
+        except BaseException:
+            self.metrics.abandon()
+            raise
+        started = time.perf_counter()
+        self.metrics.admitted()
+        ok = False
+        try:
+            response = await self._async_client.post(path, json=payload, timeout=timeout or self.timeout)
+            response.raise_for_status()
+            data = response.json()
+            ok = True
+            return data
+        except httpx.ConnectError as e:
+            raise OllamaUnavailable(str(e)) from e
+        except httpx.TimeoutException as e:
+            raise OllamaTimeout(str(e)) from e
+        except (httpx.HTTPError, ValueError) as e:
+            raise OllamaError(str(e)) from e
+        finally:
+            self._async_slots.release()
+            self.metrics.record(started - queued_at, time.perf_counter() - started, ok)
+
+    async def achat(self, messages: list, model: str = "phi3", options: dict = None, **extra) -> dict:
+        return await self.apost("/api/chat", self._payload(messages, model, options, **extra))
+
+    async def astream_chat(self, messages: list, model: str = "phi3", options: dict = None, **extra):
+        """
+        Yields Ollama's incremental chat chunks as they arrive. Closing the
+        generator early (e.g. the HTTP client went away) closes the upstream
+        connection, which makes Ollama abort the generation.
+        """
+        payload = self._payload(messages, model, options, stream=True, **extra)
+        if httpx is None:
+            data = await asyncio.to_thread(self.post, "/api/chat", dict(payload, stream=False))
+            yield data
+            return
+
+        self._ensure_async()
+        queued_at = time.perf_counter()
+        self.metrics.begin()
+        try:
+            await self._async_slots.acquire()
+        except BaseException:
+            self.metrics.abandon()
+            raise
+        started = time.perf_counter()
+        self.metrics.admitted()
+        ok = False
+        try:
+            async with self._async_client.stream("POST", "/api/chat", json=payload, timeout=self.timeout) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if chunk.get("error"):
+                        raise OllamaError(chunk["error"])
+                    yield chunk
+                    if chunk.get("done"):
+                        break
+            ok = True
+        except (GeneratorExit, asyncio.CancelledError):
+            # Consumer stopped reading; not an upstream failure
+            ok = True
+            raise
+        except httpx.ConnectError as e:
+            raise OllamaUnavailable(str(e)) from e
+        except httpx.TimeoutException as e:
+            raise OllamaTimeout(str(e)) from e
+        except (httpx.HTTPError, ValueError) as e:
+            raise OllamaError(str(e)) from e
+        finally:
+            self._async_slots.release()
+            self.metrics.record(started - queued_at, time.perf_counter() - started, ok)
+
+    # ---------- lifecycle ----------
+
+    def close(self):
+        self.session.close()
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+            self._async_loop = None
@@ -0,0 +1,217 @@
+import os
+import time
+import threading
+
+from ollama_client import OllamaClient, OllamaError, OllamaUnavailable, OLLAMA_BASE_URL, OLLAMA_POOL_SIZE, OLLAMA_TIMEOUT
+
+# Comma separated list of Ollama instances, e.g. "http://gpu1:11434,http://gpu2:11434"
+OLLAMA_URLS = [u.strip() for u in os.getenv("OLLAMA_URLS", OLLAMA_BASE_URL).split(",") if u.strip()]
+OLLAMA_WARM_MODELS = [m.strip() for m in os.getenv("OLLAMA_WARM_MODELS", "phi3").split(",") if m.strip()]
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10"))
+
+
+def _model_tag(model: str) -> str:
+    # Ollama reports loaded models with an explicit tag ("phi3:latest")
+    return model if ":" in model else f"{model}:latest"
+
+
+class Backend:
+    def __init__(self, url: str, pool_size: int = OLLAMA_POOL_SIZE, timeout: float = OLLAMA_TIMEOUT):
+        self.url = url
+        self.client = OllamaClient(url, pool_size=pool_size, timeout=timeout)
+        self.healthy = True
+        self.failures = 0
+        self.loaded_models = set()
+        self.last_checked = 0.0
+
+    @property
+    def load(self) -> float:
+        # Includes requests queued for a pooled connection, so a backend with
+        # a backlog reads above 1.0 and saturated nodes still rank by depth
+        return self.client.metrics.in_flight / self.client.pool_size
+
+    def snapshot(self) -> dict:
+        stats = self.client.metrics.snapshot()
+        stats.update({
+            "url": self.url,
+            "healthy": self.healthy,
+            "failures": self.failures,
+            "loaded_models": sorted(self.loaded_models),
+        })
+        return stats
+
+
+class OllamaRouter:
+    """
+    Spreads generations over a pool of Ollama instances.
+
+    Each request goes to the least-loaded healthy backend, preferring ones that
+    already have the model in memory until all of those are saturated; ties
+    are broken round-robin so a burst does not pile onto the first node. A
+    backend that refuses connections is ejected immediately and the request
+    fails over to the next one; the health loop re-admits it once /api/ps
+    answers again and refreshes which models each node has loaded.
+    """
+
+    def __init__(self, urls: list = None, pool_size: int = OLLAMA_POOL_SIZE, timeout: float = OLLAMA_TIMEOUT):
+        self.backends = [Backend(url, pool_size, timeout) for url in (urls or OLLAMA_URLS)]
+        self._lock = threading.Lock()
+        self._next = 0
+        self._health_thread = None
+        self._stop = threading.Event()
+
+    # ---------- routing ----------
+
+    def pick(self, model: str, exclude=()) -> Backend:
+        tag = _model_tag(model)
+        with self._lock:
+            candidates = [b for b in self.backends if b.healthy and b not in exclude]
+            if not candidates:
+                # Everything looks down: still try the rest rather than fail outright
+                candidates = [b for b in self.backends if b not in exclude]
+            if not candidates:
+                raise OllamaUnavailable("No Ollama backend available.")
+            # Stay on nodes that have the model loaded until they are saturated
+            warm = [b for b in candidates if tag in b.loaded_models and b.load < 1.0]
+            pool = warm or candidates
+            lowest = min(b.load for b in pool)
+            tied = [b for b in pool if b.load == lowest]
+            self._next += 1
+            return tied[self._next % len(tied)]
+
+    def _mark_ok(self, backend: Backend, model: str):
+        with self._lock:
+            backend.failures = 0
+            backend.healthy = True
+            backend.loaded_models.add(_model_tag(model))
+
+    def _mark_down(self, backend: Backend, error: Exception):
+        with self._lock:
+            backend.failures += 1
+            if backend.healthy:
+                print(f"[OLLAMA ROUTER] Ejecting {backend.url}: {error}")
+            backend.healthy = False
+
+    def chat(self, messages: list, model: str = "phi3", options: dict = None, **extra) -> dict:
+        tried = []
+        while True:
+            backend = self.pick(model, exclude=tried)
+            try:
+                data = backend.client.chat(messages, model=model, options=options, **extra)
+            except OllamaUnavailable as e:
+                self._mark_down(backend, e)
+                tried.append(backend)
+                if len(tried) >= len(self.backends):
+                    raise
+                continue
+            self._mark_ok(backend, model)
+            return data
+
+    async def achat(self, messages: list, model: str = "phi3", options: dict = None, **extra) -> dict:
+        tried = []
+        while True:
+            backend = self.pick(model, exclude=tried)
+            try:
+                data = await backend.client.achat(messages, model=model, options=options, **extra)
+            except OllamaUnavailable as e:
+                self._mark_down(backend, e)
+                tried.append(backend)
+                if len(tried) >= len(self.backends):
+                    raise
+                continue
+            self._mark_ok(backend, model)
+            return data
+
+    async def astream_chat(self, messages: list, model: str = "phi3", options: dict = None, **extra):
+        # Failover is only possible before the first chunk has been relayed
+        tried = []
+        while True:
+            backend = self.pick(model, exclude=tried)
+            started = False
+            try:
+                async for chunk in backend.client.astream_chat(messages, model=model, options=options, **extra):
+                    started = True
+                    yield chunk
+            except OllamaUnavailable as e:
+                self._mark_down(backend, e)
+                tried.append(backend)
+                if started or len(tried) >= len(self.backends):
+                    raise
+                continue
+            self._mark_ok(backend, model)
+            return
+
+    # ---------- health & warm-up ----------
+
+    def check_health(self):
+        for backend in self.backends:
+            try:
+                data = backend.client.get("/api/ps")
+            except OllamaError as e:
+                self._mark_down(backend, e)
+                continue
+            with self._lock:
+                if not backend.healthy:
+                    print(f"[OLLAMA ROUTER] Re-admitting {backend.url}")
+                backend.healthy = True
+                backend.failures = 0
+                backend.loaded_models = {m.get("name") for m in data.get("models", []) if m.get("name")}
+                backend.last_checked = time.time()
+
+    def warm_up(self, models: list = None):
+        """Loads models on every healthy backend and pins them with keep_alive."""
+        for model in models or OLLAMA_WARM_MODELS:
+            for backend in self.backends:
+                if not backend.healthy:
+                    continue
+                try:
+                    backend.client.post("/api/generate", {"model": model, "keep_alive": OLLAMA_KEEP_ALIVE}, timeout=300)
+                    self._mark_ok(backend, model)
+                    print(f"[OLLAMA ROUTER] Warmed {model} on {backend.url}")
+                except OllamaError as e:
+                    print(f"[OLLAMA ROUTER] Warm-up of {model} on {backend.url} failed: {e}")
+
+    def _health_loop(self):
+        self.check_health()
+        self.warm_up()
+        while not self._stop.wait(OLLAMA_HEALTH_INTERVAL):
+            self.check_health()
+
+    def start(self):
+        if self._health_thread is None:
+            self._health_thread = threading.Thread(target=self._health_loop, name="ollama-health", daemon=True)
+            self._health_thread.start()
+
+    def stop(self):
+        self._stop.set()
+        for backend in self.backends:
+            backend.client.close()
+
+    async def aclose(self):
+        for backend in self.backends:
+            await backend.client.aclose()
+
+    def snapshot(self) -> dict:
+        backends = [b.snapshot() for b in self.backends]
+        return {
+            "calls": sum(b["calls"] for b in backends),
+            "errors": sum(b["errors"] for b in backends),
+            "in_flight": sum(b["in_flight"] for b in backends),
+            "healthy_backends": sum(1 for b in backends if b["healthy"]),
+            "backends": backends,
+        }
+
+
+# Global router instance shared by every caller
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_ollama_router() -> OllamaRouter:
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = OllamaRouter()
+    return _router
@@ -0,0 +1,234 @@
+import os
+import json
+import time
+import datetime
+import threading
+
+from sqlalchemy import or_
+
+from models import OutboxEvent
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "200"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0"))
+OUTBOX_DELIVERY = os.getenv("OUTBOX_DELIVERY", "all")
+OUTBOX_RETENTION_HOURS = float(os.getenv("OUTBOX_RETENTION_HOURS", "24"))
+OUTBOX_PURGE_INTERVAL = 600
+# A row that fails is retried after OUTBOX_RETRY_BACKOFF * 2^(attempts-1) seconds,
+# capped at OUTBOX_RETRY_BACKOFF_MAX, and parked after OUTBOX_MAX_ATTEMPTS
+OUTBOX_RETRY_BACKOFF = float(os.getenv("OUTBOX_RETRY_BACKOFF", "2"))
+OUTBOX_RETRY_BACKOFF_MAX = float(os.getenv("OUTBOX_RETRY_BACKOFF_MAX", "300"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "20"))
+
+
+def add_outbox_event(db, topic: str, event: dict, key: str) -> OutboxEvent:
+    """
+    Stages `event` in the caller's transaction. It becomes visible to the
+    relay only if that transaction commits. `key` is the dedup key consumers
+    see as `event_id`.
+    """
+    row = OutboxEvent(topic=topic, event_key=key, payload=json.dumps({**event, "event_id": key}))
+    db.add(row)
+    return row
+
+
+class OutboxRelay:
+    """
+    Drains committed outbox rows to the event bus in id order.
+
+    Rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED, so several app
+    processes can run a relay. A row is marked published only after the bus
+    has acknowledged it. A crash between publish and commit re-sends the
+    batch, which makes delivery at-least-once; consumers dedupe on event_id.
+
+    A row the bus rejects is not claimed again until its backoff has passed,
+    so failing rows don't hold up the ones behind them. A row that has
+    failed max_attempts times while the bus accepted other events is parked
+    (parked_at set, last_error kept); requeue_parked() puts it back.
+    """
+
+    def __init__(self, session_factory=None, batch_size: int = OUTBOX_BATCH_SIZE,
+                 interval: float = OUTBOX_POLL_INTERVAL, delivery: str = OUTBOX_DELIVERY,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        if session_factory is None:
+            from config_db import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.interval = interval
+        self.delivery = delivery
+        self.max_attempts = max_attempts
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_purge = 0.0
+        self.published = 0
+        self.failed = 0
+        self.parked = 0
+        self.batches = 0
+        self.last_batch_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    def notify(self):
+        """Called after a commit that added outbox rows, so they go out without waiting for the next poll."""
+        self._wake.set()
+
+    def drain_once(self) -> int:
+        """Publishes one batch; returns how many rows the bus acknowledged."""
+        from kafka_producer import get_event_producer
+
+        db = self.session_factory()
+        try:
+            rows = (
+                db.query(OutboxEvent)
+                .filter(OutboxEvent.published_at.is_(None), OutboxEvent.parked_at.is_(None),
+                        or_(OutboxEvent.next_attempt_at.is_(None),
+                            OutboxEvent.next_attempt_at <= datetime.datetime.utcnow()))
+                .order_by(OutboxEvent.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            if not rows:
+                db.rollback()
+                return 0
+
+            started = time.perf_counter()
+            errors = get_event_producer().publish_batch(
+                [(row.topic, json.loads(row.payload)) for row in rows], delivery=self.delivery
+            )
+            now = datetime.datetime.utcnow()
+            delivered = sum(error is None for error in errors)
+            parked = []
+            for row, error in zip(rows, errors):
+                if error is None:
+                    row.published_at = now
+                    self.max_lag_ms = max(self.max_lag_ms, (now - row.created_at).total_seconds() * 1000)
+                    continue
+                row.attempts = (row.attempts or 0) + 1
+                row.last_error = str(error)[:500]
+                # Only park when the bus took other events in this batch: then the row is the
+                # problem, not an outage, which would otherwise park everything pending
+                if row.attempts >= self.max_attempts and delivered:
+                    row.parked_at = now
+                    parked.append(row)
+                else:
+                    delay = min(OUTBOX_RETRY_BACKOFF_MAX, OUTBOX_RETRY_BACKOFF * 2 ** (row.attempts - 1))
+                    row.next_attempt_at = now + datetime.timedelta(seconds=delay)
+            db.commit()
+            if parked:
+                self.parked += len(parked)
+                print(f"[OUTBOX] Parked {len(parked)} events after {self.max_attempts}+ attempts, "
+                      f"e.g. {parked[0].event_key}: {parked[0].last_error}")
+
+            self.batches += 1
+            self.published += delivered
+            self.failed += len(rows) - delivered
+            self.last_batch_ms = (time.perf_counter() - started) * 1000
+            if delivered < len(rows):
+                print(f"[OUTBOX] {len(rows) - delivered} of {len(rows)} events not acknowledged, will retry")
+            return delivered
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def requeue_parked(self) -> int:
+        """Makes parked rows eligible again, with a fresh attempt count."""
+        db = self.session_factory()
+        try:
+            requeued = (
+                db.query(OutboxEvent)
+                .filter(OutboxEvent.parked_at.isnot(None))
+                .update({OutboxEvent.parked_at: None, OutboxEvent.next_attempt_at: None, OutboxEvent.attempts: 0},
+                        synchronize_session=False)
+            )
+            db.commit()
+        finally:
+            db.close()
+        self.notify()
+        return requeued
+
+    def purge(self):
+        """Deletes rows published more than OUTBOX_RETENTION_HOURS ago."""
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(hours=OUTBOX_RETENTION_HOURS)
+        db = self.session_factory()
+        try:
+            deleted = (
+                db.query(OutboxEvent)
+                .filter(OutboxEvent.published_at.isnot(None), OutboxEvent.published_at < cutoff)
+                .delete(synchronize_session=False)
+            )
+            db.commit()
+            if deleted:
+                print(f"[OUTBOX] Purged {deleted} published events")
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                delivered = self.drain_once()
+                if time.monotonic() - self._last_purge > OUTBOX_PURGE_INTERVAL:
+                    self._last_purge = time.monotonic()
+                    self.purge()
+            except Exception as e:
+                print(f"[OUTBOX] Relay error: {e}")
+                delivered = 0
+            # A full batch that all went out means there is probably more waiting;
+            # after any failure, wait rather than hammer the bus and the database
+            if delivered < self.batch_size:
+                self._wake.wait(self.interval)
+                self._wake.clear()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="outbox-relay", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        """Stops the loop and makes a final pass so committed events are not left behind."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        deadline = time.monotonic() + timeout
+        try:
+            while time.monotonic() < deadline and self.drain_once() == self.batch_size:
+                pass
+        except Exception as e:
+            print(f"[OUTBOX] Final drain failed: {e}")
+
+    def metrics(self) -> dict:
+        db = self.session_factory()
+        try:
+            pending = db.query(OutboxEvent).filter(OutboxEvent.published_at.is_(None), OutboxEvent.parked_at.is_(None)).count()
+            parked = db.query(OutboxEvent).filter(OutboxEvent.parked_at.isnot(None)).count()
+        except Exception:
+            pending = parked = None
+        finally:
+            db.close()
+        return {
+            "pending": pending,
+            "parked": parked,
+            "published": self.published,
+            "failed_attempts": self.failed,
+            "parked_by_this_relay": self.parked,
+            "batches": self.batches,
+            "last_batch_ms": round(self.last_batch_ms, 2),
+            "max_lag_ms": round(self.max_lag_ms, 2),
+        }
+
+
+_relay = None
+_relay_lock = threading.Lock()
+
+
+def get_outbox_relay() -> OutboxRelay:
+    global _relay
+    if _relay is None:
+        with _relay_lock:
+            if _relay is None:
+                _relay = OutboxRelay()
+    return _relay
@@ -1,16 +1,35 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
+from starlette.requests import ClientDisconnect
 from pydantic import BaseModel
+from sqlalchemy import case, insert, select, tuple_, update
 from sqlalchemy.orm import Session
 from typing import List, Optional
+import base64
 import datetime
+import hashlib
+import json
+import asyncio
+import os
 import uuid
 
 from kafka_producer import publish_event
-from config_db import get_db
-from models import Product as DBProduct, Order as DBOrder, OrderItem as DBOrderItem, OrderStatus, PaymentMethod
+from config_db import get_db, SessionLocal
+from outbox_relay import add_outbox_event, get_outbox_relay
+from catalog_cache import get_catalog_version, bump_catalog_version, page_cache
+from product_search import get_search_index, update_search_stock
+from realtime_hub import get_realtime_hub
+from vendor_analytics import get_vendor_sales, record_checkout
+from product_import import QueueStream, get_import, start_import
+from invoice_renderer import get_invoice_renderer, order_invoices
+from models import Product as DBProduct, Order as DBOrder, OrderItem as DBOrderItem, OrderStatus, PaymentMethod, User as DBUser, Vendor as DBVendor
 
 router = APIRouter(prefix="/api/p1/marketplace")
 
+CATALOG_PAGE_SIZE = int(os.getenv("CATALOG_PAGE_SIZE", "200"))
+CATALOG_MAX_PAGE_SIZE = int(os.getenv("CATALOG_MAX_PAGE_SIZE", "500"))
+
 class ProductResponse(BaseModel):
     id: int
     name: str
@@ -24,10 +43,164 @@ class ProductResponse(BaseModel):
     class Config:
         orm_mode = True
 
+# Only the columns ProductResponse needs, fetched as plain rows (no ORM identity map)
+_CATALOG_COLUMNS = (
+    DBProduct.id, DBProduct.name, DBProduct.slug, DBProduct.description,
+    DBProduct.price, DBProduct.stock_qty, DBProduct.images, DBProduct.vendor_id,
+)
+# sort -> keyset columns; each ordering is served by an index in models.Product
+_CATALOG_SORTS = {
+    "id": ((DBProduct.id,), False),
+    "price": ((DBProduct.price, DBProduct.id), False),
+    "-price": ((DBProduct.price, DBProduct.id), True),
+}
+
+def _encode_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+def _decode_cursor(cursor: str, width: int) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        values = None
+    if (not isinstance(values, list) or len(values) != width
+            or not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values)):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    return values
+
+def _token_claims(token: str) -> Optional[dict]:
+    from jose import JWTError, jwt
+    from auth import SECRET_KEY, ALGORITHM
+
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+
+def _vendor_id_for_claims(claims: dict) -> Optional[int]:
+    if claims.get("role") != "vendor":
+        return None
+    with SessionLocal() as db:
+        return db.execute(
+            select(DBVendor.id).join(DBUser, DBVendor.user_id == DBUser.id).where(DBUser.email == claims.get("sub"))
+        ).scalar()
+
+def _vendor_id_for_token(token: str) -> Optional[int]:
+    claims = _token_claims(token)
+    return None if claims is None else _vendor_id_for_claims(claims)
+
+def _bearer_claims(authorization: Optional[str] = Header(None)) -> dict:
+    """Claims of a valid `Authorization: Bearer <token>` header; 401 otherwise."""
+    scheme, _, token = (authorization or "").partition(" ")
+    claims = _token_claims(token) if scheme.lower() == "bearer" and token else None
+    if claims is None:
+        raise HTTPException(status_code=401, detail="Missing or invalid bearer token.",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return claims
+
+def _require_vendor(claims: dict = Depends(_bearer_claims)) -> int:
+    """The vendor behind the bearer token; 403 for a non-vendor token."""
+    vendor_id = _vendor_id_for_claims(claims)
+    if vendor_id is None:
+        raise HTTPException(status_code=403, detail="A vendor token is required.")
+    return vendor_id
+
 @router.get("/products", response_model=List[ProductResponse])
-def get_products(db: Session = Depends(get_db)):
-    products = db.query(DBProduct).filter(DBProduct.is_active == True).all()
-    return products
+def get_products(
+    request: Request,
+    vendor_id: Optional[int] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    sort: str = "id",
+    limit: int = Query(CATALOG_PAGE_SIZE, ge=1, le=CATALOG_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    One page of active products, ordered by `sort` (id, price or -price).
+    Pass the X-Next-Cursor response header back as `cursor` for the next
+    page; it is absent on the last one. The ETag changes whenever a product
+    write bumps the catalog version, so If-None-Match revalidation and the
+    in-process page cache never touch the database for an unchanged catalog.
+    Without the shared Redis version, pages and ETags are only trusted for
+    CATALOG_PAGE_CACHE_TTL seconds.
+    """
+    if sort not in _CATALOG_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(_CATALOG_SORTS)}.")
+    keys, descending = _CATALOG_SORTS[sort]
+
+    query_key = json.dumps([vendor_id, min_price, max_price, sort, limit, cursor])
+    etag = f'W/"{get_catalog_version().tag()}-{hashlib.sha1(query_key.encode()).hexdigest()[:16]}"'
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    cached = page_cache.get(etag)
+    if cached is None:
+        stmt = select(*_CATALOG_COLUMNS).where(DBProduct.is_active == True)
+        if vendor_id is not None:
+            stmt = stmt.where(DBProduct.vendor_id == vendor_id)
+        if min_price is not None:
+            stmt = stmt.where(DBProduct.price >= min_price)
+        if max_price is not None:
+            stmt = stmt.where(DBProduct.price <= max_price)
+        if cursor:
+            after = _decode_cursor(cursor, len(keys))
+            position = tuple_(*keys) if len(keys) > 1 else keys[0]
+            bound = tuple_(*after) if len(keys) > 1 else after[0]
+            stmt = stmt.where(position < bound if descending else position > bound)
+        stmt = stmt.order_by(*(k.desc() if descending else k for k in keys)).limit(limit + 1)
+
+        rows = db.execute(stmt).mappings().all()
+        next_cursor = ""
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor([rows[-1][k.key] for k in keys])
+        # Stored as "<cursor>\n<body>" so a hit is served without re-serializing
+        cached = next_cursor + "\n" + json.dumps([dict(row) for row in rows])
+        page_cache.set(etag, cached)
+
+    next_cursor, body = cached.split("\n", 1)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{request.url.include_query_params(cursor=next_cursor)}>; rel="next"'
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@router.get("/search")
+def search_products(
+    q: str = Query(..., min_length=1, max_length=200),
+    vendor_id: Optional[int] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    in_stock: bool = False,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0, le=1000),
+    db: Session = Depends(get_db),
+):
+    """
+    BM25-ranked full-text search over product names and descriptions from
+    the in-process index; the last word also matches as a prefix and
+    misspelt words match their nearest vocabulary terms.
+    """
+    index = get_search_index()
+    if not index.ready:
+        raise HTTPException(status_code=503, detail="Search index is still loading.")
+    result = index.search(q, vendor_id=vendor_id, min_price=min_price, max_price=max_price,
+                          in_stock=in_stock, limit=offset + limit)
+    hits = list(zip(result.ids, result.scores))[offset:]
+    rows = db.execute(select(*_CATALOG_COLUMNS).where(DBProduct.id.in_([pid for pid, _ in hits]))).mappings().all() if hits else []
+    by_id = {row["id"]: dict(row) for row in rows}
+    return {
+        "query": q,
+        "total": result.total,
+        "total_exact": result.exact,
+        "took_ms": round(result.took_ms, 3),
+        "results": [{**by_id[pid], "score": round(score, 4)} for pid, score in hits if pid in by_id],
+    }
+
+@router.get("/search/stats")
+def search_stats():
+    return {"status": "success", "index": get_search_index().stats()}
 
 class CartItem(BaseModel):
     product_id: int
@@ -41,25 +214,51 @@ class CheckoutRequest(BaseModel):
 
 @router.post("/checkout")
 def checkout(request: CheckoutRequest, db: Session = Depends(get_db)):
-    total_amount = 0.0
-    db_items = []
-
+    """
+    One transaction: lock the cart's products in a single SELECT ... FOR UPDATE,
+    decrement all stock in one conditional UPDATE (so concurrent checkouts can
+    never oversell), insert the order, bulk-insert its items and stage the
+    outbox event, then commit once.
+    """
+    quantities = {}
     for item in request.items:
-        prod = db.query(DBProduct).filter(DBProduct.id == item.product_id).first()
-        if not prod or prod.stock_qty < item.quantity:
-            raise HTTPException(status_code=400, detail=f"Product {item.product_id} is out of stock or does not exist.")
+        if item.quantity <= 0:
+            raise HTTPException(status_code=400, detail=f"Invalid quantity for product {item.product_id}.")
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+    if not quantities:
+        raise HTTPException(status_code=400, detail="Cart is empty.")
 
-        line_total = prod.price * item.quantity
-        total_amount += line_total
+    # Locks are taken in id order so two carts sharing products can't deadlock
+    products = (
+        db.query(DBProduct)
+        .filter(DBProduct.id.in_(quantities))
+        .order_by(DBProduct.id)
+        .with_for_update()
+        .all()
+    )
+    by_id = {p.id: p for p in products}
+    for product_id, quantity in quantities.items():
+        prod = by_id.get(product_id)
+        if not prod or prod.stock_qty < quantity:
+            db.rollback()
+            raise HTTPException(status_code=400, detail=f"Product {product_id} is out of stock or does not exist.")
 
-        prod.stock_qty -= item.quantity
+    qty_case = case(quantities, value=DBProduct.id)
+    updated = db.execute(
+        update(DBProduct)
+        .where(DBProduct.id.in_(quantities), DBProduct.stock_qty >= qty_case)
+        .values(stock_qty=DBProduct.stock_qty - qty_case)
+        .returning(DBProduct.id, DBProduct.stock_qty)
+        .execution_options(synchronize_session=False)
+    ).all()
+    remaining_stock = dict(updated)
+    if len(remaining_stock) != len(quantities):
+        # Only reachable where FOR UPDATE is a no-op (SQLite): someone else took the stock first
+        db.rollback()
+        short = sorted(set(quantities) - set(remaining_stock))
+        raise HTTPException(status_code=400, detail=f"Product {short[0]} is out of stock or does not exist.")
 
-        db_item = DBOrderItem(
-            product_id=prod.id,
-            quantity=item.quantity,
-            unit_price=prod.price
-        )
-        db_items.append(db_item)
+    total_amount = sum(by_id[pid].price * qty for pid, qty in quantities.items())
 
     try:
         pm_enum = PaymentMethod(request.payment_method.lower())
@@ -76,14 +275,12 @@ def checkout(request: CheckoutRequest, db: Session = Depends(get_db)):
     )
 
     db.add(new_order)
-    db.commit()
-    db.refresh(new_order)
-
-    for db_item in db_items:
-        db_item.order_id = new_order.id
-        db.add(db_item)
+    db.flush()  # assigns new_order.id inside the same transaction
 
-    db.commit()
+    db.execute(insert(DBOrderItem), [
+        {"order_id": new_order.id, "product_id": pid, "quantity": qty, "unit_price": by_id[pid].price}
+        for pid, qty in quantities.items()
+    ])
 
     event = {
         "event_type": "checkout_completed",
@@ -91,7 +288,32 @@ def checkout(request: CheckoutRequest, db: Session = Depends(get_db)):
         "amount": total_amount,
         "timestamp": datetime.datetime.utcnow().isoformat()
     }
-    publish_event("marketplace.orders", event)
+    # Committed atomically with the order; the outbox relay publishes it after commit
+    add_outbox_event(db, "marketplace.orders", event, key=f"checkout_completed:{new_order.id}")
+
+    # Per-vendor notifications, built before commit expires the loaded products
+    vendor_orders = {}
+    for pid, qty in quantities.items():
+        prod = by_id[pid]
+        vendor_order = vendor_orders.setdefault(prod.vendor_id, {
+            "order_id": new_order.id, "status": new_order.status.value, "created_at": event["timestamp"],
+            "items": [], "amount": 0.0,
+        })
+        vendor_order["items"].append({"product_id": pid, "name": prod.name, "quantity": qty, "unit_price": prod.price})
+        vendor_order["amount"] += prod.price * qty
+    record_checkout(db, new_order.created_at.date(), {
+        vendor_id: (vendor_order["amount"], sum(item["quantity"] for item in vendor_order["items"]))
+        for vendor_id, vendor_order in vendor_orders.items()
+    })
+
+    db.commit()
+    get_outbox_relay().notify()
+    bump_catalog_version()  # stock changed
+    update_search_stock(remaining_stock)
+    hub = get_realtime_hub()
+    hub.publish_stock(remaining_stock)
+    for vendor_id, vendor_order in vendor_orders.items():
+        hub.publish_order(vendor_id, vendor_order)
 
     return {"status": "success", "order_id": new_order.id, "total_amount": total_amount}
 
@@ -119,6 +341,47 @@ def create_product(product: Product):
     publish_event("marketplace.products", event)
     return {"status": "success"}
 
+@router.post("/products/import")
+async def import_products(
+    request: Request,
+    vendor_id: int = Depends(_require_vendor),
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    import_id: Optional[str] = Query(None, pattern="^[A-Za-z0-9_-]{1,64}$"),
+):
+    """
+    Bulk create/update of a vendor's products from the raw request body, CSV
+    (header row with at least name and price) or NDJSON, matched on slug.
+    The vendor is the one in the bearer token. The body is streamed, never
+    held in memory. Poll GET /products/import/{import_id} from another
+    request to follow progress.
+    """
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "ndjson" if "json" in content_type else "csv"
+    try:
+        job = start_import(vendor_id, format, import_id)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    source = QueueStream()
+    worker = asyncio.ensure_future(run_in_threadpool(job.run, source))
+    try:
+        async for chunk in request.stream():
+            if chunk and not await source.put(chunk):
+                break  # the import stopped early; don't read the rest
+        await source.finish()
+    except ClientDisconnect as e:
+        await source.finish(e)
+    await worker
+    return JSONResponse(job.to_dict(), status_code=400 if job.status == "failed" and not job.chunks else 200)
+
+@router.get("/products/import/{import_id}")
+def import_progress(import_id: str, vendor_id: int = Depends(_require_vendor)):
+    job = get_import(import_id)
+    if job is None or job.vendor_id != vendor_id:
+        raise HTTPException(status_code=404, detail="No such import on this server.")
+    return job.to_dict()
+
 @router.post("/orders")
 def place_order(order: Order):
     event = {
@@ -127,4 +390,102 @@ def place_order(order: Order):
         "timestamp": datetime.datetime.utcnow().isoformat()
     }
     publish_event("marketplace.orders", event)
+    get_realtime_hub().publish_order(order.vendor_id, {**order.dict(), "created_at": event["timestamp"]})
     return {"status": "success"}
+
+@router.get("/orders/{order_id}/invoice")
+def order_invoice(order_id: int, db: Session = Depends(get_db), claims: dict = Depends(_bearer_claims)):
+    """The order's invoice as a PDF, rendered in memory. For the customer, or a vendor with a product in it."""
+    order = db.get(DBOrder, order_id)
+    if order is None:
+        raise HTTPException(status_code=404, detail="Order not found.")
+    customer_id = db.execute(select(DBUser.id).where(DBUser.email == claims.get("sub"))).scalar()
+    if customer_id != order.customer_id:
+        vendor_id = _vendor_id_for_claims(claims)
+        if vendor_id is None or db.execute(
+            select(DBOrderItem.id).join(DBProduct, DBProduct.id == DBOrderItem.product_id)
+            .where(DBOrderItem.order_id == order_id, DBProduct.vendor_id == vendor_id).limit(1)
+        ).scalar() is None:
+            raise HTTPException(status_code=403, detail="Only the customer or a vendor on the order can see its invoice.")
+    invoice = order_invoices(db, [order])[0]
+    try:
+        pdf = get_invoice_renderer().render(invoice)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return Response(
+        content=pdf,
+        media_type="application/pdf",
+        headers={"Content-Disposition": f'inline; filename="Invoice-{invoice["number"]}.pdf"'},
+    )
+
+def _current_stock(product_ids: list) -> dict:
+    with SessionLocal() as db:
+        rows = db.execute(select(DBProduct.id, DBProduct.stock_qty).where(DBProduct.id.in_(product_ids))).all()
+    return dict(rows)
+
+@router.websocket("/ws")
+async def realtime_updates(websocket: WebSocket, token: Optional[str] = None):
+    """
+    Live stock and order push. Client messages:
+      {"subscribe": {"products": [ids]}}      current stock now, then every change
+      {"unsubscribe": {"products": [ids]}}
+      {"subscribe": {"vendor_orders": true}}  new orders for the vendor in ?token=
+    Server frames: {"type": "stock", "items": [{"product_id", "stock_qty"}]},
+    {"type": "order", "vendor_id", "order"}, {"type": "subscribed", ...} and
+    {"type": "error", "detail"}.
+    """
+    hub = get_realtime_hub()
+    await websocket.accept()
+    await hub.start()
+    subscriber = hub.connect(websocket)
+    vendor_id = await run_in_threadpool(_vendor_id_for_token, token) if token else None
+    try:
+        while not subscriber.closed:
+            try:
+                message = await websocket.receive_json()
+                subscribe = message.get("subscribe") or {}
+                unsubscribe = message.get("unsubscribe") or {}
+                product_ids = [int(p) for p in subscribe.get("products", [])]
+                dropped_ids = [int(p) for p in unsubscribe.get("products", [])]
+            except (ValueError, TypeError, AttributeError):
+                await websocket.send_json({"type": "error", "detail": "Expected {\"subscribe\"|\"unsubscribe\": {...}}."})
+                continue
+            hub.unsubscribe_products(subscriber, dropped_ids)
+            added = hub.subscribe_products(subscriber, product_ids)
+            if added:
+                subscriber.push_snapshot(added, await run_in_threadpool(_current_stock, added))
+            if subscribe.get("vendor_orders"):
+                if vendor_id is None:
+                    await websocket.send_json({"type": "error", "detail": "vendor_orders needs a vendor ?token=."})
+                    continue
+                hub.subscribe_vendor(subscriber, vendor_id)
+            if unsubscribe.get("vendor_orders"):
+                hub.unsubscribe_vendor(subscriber)
+            await websocket.send_json({"type": "subscribed", "products": len(subscriber.products),
+                                       "vendor_id": subscriber.vendor_id})
+    except (WebSocketDisconnect, RuntimeError):
+        pass  # client left, or the writer closed a slow connection
+    finally:
+        hub.disconnect(subscriber)
+
+@router.get("/vendors/{vendor_id}/sales")
+def vendor_sales(
+    vendor_id: int,
+    start: Optional[datetime.date] = None,
+    end: Optional[datetime.date] = None,
+    db: Session = Depends(get_db),
+    caller_vendor_id: int = Depends(_require_vendor),
+):
+    """Sales totals for [start, end] in UTC days, inclusive; defaults to the last 30 days. Vendor's own token only."""
+    if caller_vendor_id != vendor_id:
+        raise HTTPException(status_code=403, detail="Sales are only visible to the vendor.")
+    end = end or datetime.datetime.utcnow().date()
+    start = start or end - datetime.timedelta(days=29)
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end.")
+    totals = get_vendor_sales().totals(db, vendor_id, start, end)
+    return {"status": "success", "vendor_id": vendor_id, "start": start, "end": end, **totals}
+
+@router.get("/realtime/stats")
+def realtime_stats():
+    return {"status": "success", "hub": get_realtime_hub().stats()}
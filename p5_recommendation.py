@@ -22,7 +22,8 @@ def track_behavior(behavior: UserBehavior):
         "product_id": behavior.product_id,
         "timestamp": datetime.datetime.utcnow().isoformat()
     }
-    publish_event("user.behavior", event)
+    # Highest-volume topic: losing the odd click is fine, waiting on the broker is not
+    publish_event("user.behavior", event, delivery="fire_and_forget")
     return {"status": "success"}
 
 @router.get("/{user_id}")
@@ -1,43 +1,96 @@
-from fastapi import APIRouter, BackgroundTasks
+from fastapi import APIRouter
 from pydantic import BaseModel
-from ai_service import generate_response
+from concurrent.futures import ThreadPoolExecutor
+from ai_service import chat_completion
+from ollama_client import OllamaError
+from llm_scheduler import BACKGROUND
 from kafka_producer import publish_event
+from sentiment import get_sentiment_classifier, MicroBatcher, LABELS, SENTIMENT_CONFIDENCE_THRESHOLD
 import datetime
+import os
+import re
+import threading
 
 router = APIRouter(prefix="/api/p6/feedback")
 
+# Low-confidence reviews escalated to Ollama are handled by a few workers so
+# they never hold up the lexicon batches. At most SENTIMENT_LLM_QUEUE are
+# waiting or running; past that a review keeps its lexicon label.
+_llm_escalations = ThreadPoolExecutor(max_workers=int(os.getenv("SENTIMENT_LLM_WORKERS", "2")))
+_llm_slots = threading.BoundedSemaphore(int(os.getenv("SENTIMENT_LLM_QUEUE", "200")))
+
+# Whole-word labels; a negated one ("not positive") does not count as an answer
+_LABEL_RE = re.compile(r"\b(not\s+)?(" + "|".join(LABELS) + r")\b", re.IGNORECASE)
+
 class Review(BaseModel):
     product_id: int
     user_id: int
     review_text: str
 
-def analyze_review_background(review_text: str, product_id: int):
-    """
-    Ollama zero-shot classification (Positive/Negative/Neutral)
-    Processed via Celery or BackgroundTasks so it NEVER blocks the API response per requirements.
-    """
-    prompt = f"Analyze this product product review. Output ONLY ONE WORD (Positive, Negative, or Neutral): '{review_text}'"
-    messages = [
-        {"role": "system", "content": "You are a zero-shot sentiment classification API."},
-        {"role": "user", "content": prompt}
-    ]
-    sentiment = generate_response(messages, model="phi3").strip()
-    
+def publish_review_analysis(review_text: str, product_id: int, sentiment: str, method: str, confidence: float = None):
     event = {
         "event_type": "review_analyzed",
         "product_id": product_id,
         "sentiment": sentiment,
+        "method": method,
+        "confidence": confidence,
         "text": review_text
     }
     # Stream the final analysis to Kafka for real-time Grafana/Redis dashboard gauges
     publish_event("reviews.analyzed", event)
-    print(f"[P6 FEEDBACK] Analysis complete: {sentiment} -> published to Kafka")
+    print(f"[P6 FEEDBACK] Analysis complete ({method}): {sentiment} -> published to Kafka")
+
+def parse_llm_label(raw: str):
+    """Returns the one label the model answered with, or None if it is unclear."""
+    found = {m.group(2).capitalize() for m in _LABEL_RE.finditer(raw) if not m.group(1)}
+    return found.pop() if len(found) == 1 else None
+
+def analyze_review_background(review_text: str, product_id: int, lexicon_label: str, lexicon_confidence: float):
+    """
+    Ollama zero-shot classification (Positive/Negative/Neutral)
+    Used for reviews the local classifier is not confident about. If Ollama
+    fails, is shedding load or gives no clear label, the lexicon label is kept.
+    """
+    prompt = f"Analyze this product product review. Output ONLY ONE WORD (Positive, Negative, or Neutral): '{review_text}'"
+    messages = [
+        {"role": "system", "content": "You are a zero-shot sentiment classification API."},
+        {"role": "user", "content": prompt}
+    ]
+    try:
+        raw = chat_completion(messages, model="phi3", priority=BACKGROUND)
+    except OllamaError as e:
+        print(f"[P6 FEEDBACK] LLM classification failed, keeping lexicon label: {e}")
+        raw = ""
+    # Small models like to add punctuation or a sentence around the label
+    sentiment = parse_llm_label(raw)
+    if sentiment is None:
+        publish_review_analysis(review_text, product_id, lexicon_label, "lexicon_fallback", lexicon_confidence)
+        return
+    publish_review_analysis(review_text, product_id, sentiment, "llm")
+
+def analyze_review_batch(batch: list):
+    """
+    Scores a micro-batch of (review_text, product_id) with the in-process
+    classifier and escalates only the low-confidence ones to Ollama.
+    """
+    results = get_sentiment_classifier().classify_batch([text for text, _ in batch])
+    for (text, product_id), (label, confidence) in zip(batch, results):
+        if confidence >= SENTIMENT_CONFIDENCE_THRESHOLD:
+            publish_review_analysis(text, product_id, label, "lexicon", confidence)
+        elif _llm_slots.acquire(blocking=False):
+            future = _llm_escalations.submit(analyze_review_background, text, product_id, label, confidence)
+            future.add_done_callback(lambda _: _llm_slots.release())
+        else:
+            # Ollama is backed up: a low-confidence label beats an unbounded backlog
+            publish_review_analysis(text, product_id, label, "lexicon_overloaded", confidence)
+
+_review_batcher = MicroBatcher(analyze_review_batch)
 
 @router.post("/submit")
-def submit_review(review: Review, background_tasks: BackgroundTasks):
+def submit_review(review: Review):
     """
     Customer review ingestion API -> Kafka topic: reviews.submitted
-    Immediately accepts the review and offloads Ollama inference to the background.
+    Immediately accepts the review and offloads sentiment analysis to the background.
     """
     
     event = {
@@ -47,7 +100,9 @@ def submit_review(review: Review, background_tasks: BackgroundTasks):
     }
     publish_event("reviews.submitted", event)
     
-    # Offload AI to background worker
-    background_tasks.add_task(analyze_review_background, review.review_text, review.product_id)
+    # Classified in micro-batches off the request path; if the batcher is
+    # full, classify here so the review is still analyzed
+    if not _review_batcher.submit((review.review_text, review.product_id)):
+        analyze_review_batch([(review.review_text, review.product_id)])
     
     return {"status": "success", "message": "Review accepted for asynchronous processing."}
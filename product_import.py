@@ -0,0 +1,465 @@
+"""
+Streaming bulk product import for vendors (CSV or NDJSON).
+
+The upload is read as it arrives: the endpoint feeds request body chunks
+through a small bounded queue to a worker thread, which parses, validates
+and writes IMPORT_CHUNK_ROWS rows at a time. Memory stays at a few chunks
+whatever the file size, and a slow database slows the upload down instead
+of piling it up in memory.
+
+Each chunk is one transaction:
+  * rows are upserted on `slug` (missing slugs are derived from name and
+    vendor), with COPY into a staging table on PostgreSQL and executemany
+    elsewhere. Empty optional cells keep the stored value. A slug owned by
+    another vendor is reported, never taken over, including one another
+    import creates between the ownership check and the insert: inserts skip
+    conflicting slugs and only the rows that actually went in are counted.
+  * the imported products go out as products_imported events of up to
+    IMPORT_EVENT_BATCH products each, staged in the outbox with the rows.
+After the commit the catalog version is bumped and the new stock levels are
+pushed to realtime subscribers. Progress and the first IMPORT_MAX_ERRORS
+row errors are kept per import and can be polled while it runs.
+"""
+import io
+import os
+import re
+import csv
+import json
+import math
+import time
+import uuid
+import queue
+import asyncio
+import datetime
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import bindparam, func, insert, select, text, update
+
+from models import Product
+from outbox_relay import add_outbox_event, get_outbox_relay
+from catalog_cache import bump_catalog_version
+from realtime_hub import get_realtime_hub
+
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "2000"))
+IMPORT_EVENT_BATCH = int(os.getenv("IMPORT_EVENT_BATCH", "500"))
+IMPORT_MAX_ROWS = int(os.getenv("IMPORT_MAX_ROWS", "1000000"))
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "1000"))
+IMPORT_QUEUE_CHUNKS = int(os.getenv("IMPORT_QUEUE_CHUNKS", "16"))  # request body chunks buffered ahead of the parser
+IMPORT_HISTORY = 100
+IMPORT_TOPIC = "marketplace.products"
+
+FORMATS = ("csv", "ndjson")
+# Written columns, in COPY / staging table order
+COLUMNS = ("slug", "vendor_id", "name", "description", "price", "stock_qty", "images", "meesho_url", "is_active")
+EVENT_FIELDS = ("id", "name", "description", "vendor_id", "price", "stock_qty", "is_active")
+# Empty or missing in the upload: defaults for a new product, current value kept on update
+_OPTIONAL = ("description", "stock_qty", "images", "meesho_url", "is_active")
+_DEFAULTS = {"stock_qty": 0, "is_active": True}
+_SLUG = re.compile(r"^[a-z0-9]+(?:-[a-z0-9]+)*$")
+_TRUE = {"1", "true", "t", "yes", "y"}
+_FALSE = {"0", "false", "f", "no", "n"}
+
+_STAGE_DDL = (
+    "CREATE TEMP TABLE IF NOT EXISTS product_import_stage ("
+    "slug text, vendor_id integer, name text, description text, price double precision, "
+    "stock_qty integer, images text, meesho_url text, is_active boolean) ON COMMIT DELETE ROWS"
+)
+_STAGE_UPDATE = (
+    "UPDATE products p SET name = s.name, price = s.price, "
+    + ", ".join(f"{c} = COALESCE(s.{c}, p.{c})" for c in _OPTIONAL)
+    + " FROM product_import_stage s WHERE p.slug = s.slug AND p.vendor_id = s.vendor_id"
+)
+_STAGE_INSERT = (
+    f"INSERT INTO products ({', '.join(COLUMNS)}) SELECT "
+    + ", ".join(f"COALESCE({c}, {str(_DEFAULTS[c]).lower()})" if c in _DEFAULTS else c for c in COLUMNS)
+    + " FROM product_import_stage ON CONFLICT (slug) DO NOTHING RETURNING slug"
+)
+
+
+def slugify(value: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", value.lower()).strip("-")
+
+
+def _text(value, field: str, required: bool = False, limit: int = None):
+    if value is None or (isinstance(value, str) and not value.strip()):
+        if required:
+            raise ValueError(f"{field} is required")
+        return None
+    if not isinstance(value, (str, int, float)):
+        raise ValueError(f"{field} must be text")
+    value = str(value).strip()
+    if limit and len(value) > limit:
+        raise ValueError(f"{field} is longer than {limit} characters")
+    return value
+
+
+def validate_row(raw: dict, vendor_id: int) -> dict:
+    """One import row as a products row; raises ValueError naming the first bad field."""
+    name = _text(raw.get("name"), "name", required=True, limit=300)
+
+    price = raw.get("price")
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        raise ValueError(f"price {price!r} is not a number")
+    if not math.isfinite(price) or price <= 0:
+        raise ValueError("price must be greater than 0")
+
+    stock = raw.get("stock_qty")
+    if stock is None or stock == "":
+        stock = None
+    else:
+        try:
+            number = float(stock)
+        except (TypeError, ValueError):
+            number = -1.0
+        if isinstance(stock, bool) or not number.is_integer() or number < 0:
+            raise ValueError(f"stock_qty {stock!r} is not a whole number >= 0")
+        stock = int(number)
+
+    slug = _text(raw.get("slug"), "slug", limit=200)
+    if slug is None:
+        slug = f"{slugify(name)}-{vendor_id}"
+    elif not _SLUG.match(slug):
+        raise ValueError(f"slug {slug!r} may only contain lowercase letters, digits and single hyphens")
+
+    active = raw.get("is_active")
+    if active is None or active == "":
+        active = None
+    elif not isinstance(active, bool):
+        flag = str(active).strip().lower()
+        if flag not in _TRUE | _FALSE:
+            raise ValueError(f"is_active {active!r} is not true/false")
+        active = flag in _TRUE
+
+    return {
+        "slug": slug, "vendor_id": vendor_id, "name": name,
+        "description": _text(raw.get("description"), "description"),
+        "price": round(price, 2), "stock_qty": stock,
+        "images": _text(raw.get("images"), "images"),
+        "meesho_url": _text(raw.get("meesho_url"), "meesho_url", limit=500),
+        "is_active": active,
+    }
+
+
+class QueueStream(io.RawIOBase):
+    """
+    Binary stream the import thread reads while the event loop writes request
+    body chunks into it. put() waits while IMPORT_QUEUE_CHUNKS chunks are unread.
+    """
+
+    def __init__(self, max_chunks: int = IMPORT_QUEUE_CHUNKS):
+        self._queue = queue.Queue(max_chunks)
+        self._buffer = b""
+        self.closed_by_reader = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while not self._buffer:
+            chunk = self._queue.get()
+            if chunk is None:
+                return 0
+            if isinstance(chunk, BaseException):
+                raise chunk
+            self._buffer = chunk
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    async def put(self, chunk):
+        """Returns False once the reader has given up, so the caller can stop sending."""
+        while not self.closed_by_reader:
+            try:
+                self._queue.put_nowait(chunk)
+                return True
+            except queue.Full:
+                await asyncio.sleep(0.005)
+        return False
+
+    async def finish(self, error: BaseException = None):
+        """End of upload, or the error that cut it short."""
+        await self.put(error)
+
+
+class ProductImport:
+    """One vendor upload: parses, validates and writes it chunk by chunk, tracking progress."""
+
+    def __init__(self, vendor_id: int, fmt: str = "csv", import_id: str = None, session_factory=None,
+                 chunk_rows: int = IMPORT_CHUNK_ROWS):
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        if session_factory is None:
+            from config_db import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+        self.import_id = import_id or uuid.uuid4().hex
+        self.vendor_id = vendor_id
+        self.format = fmt
+        self.chunk_rows = chunk_rows
+        self.status = "pending"
+        self.detail = None
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.failed = 0
+        self.chunks = 0
+        self.events = 0
+        self.ignored_columns = []
+        self._errors = []
+        self._lock = threading.Lock()
+        self.started_at = None
+        self.finished_at = None
+
+    # ---------- reading ----------
+
+    def _records(self, stream):
+        """Yields (row number, raw dict) from a binary stream; row numbers count data rows from 1."""
+        text_stream = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+        if self.format == "csv":
+            reader = csv.reader(text_stream)
+            header = [h.strip().lower() for h in next(reader, [])]
+            missing = {"name", "price"} - set(header)
+            if missing:
+                raise ValueError(f"CSV header is missing {', '.join(sorted(missing))}")
+            self.ignored_columns = [h for h in header if h not in COLUMNS or h == "vendor_id"]
+            for number, values in enumerate(reader, 1):
+                if not values:
+                    continue
+                if len(values) != len(header):
+                    yield number, ValueError(f"expected {len(header)} fields, got {len(values)}")
+                else:
+                    yield number, dict(zip(header, values))
+        else:
+            for number, line in enumerate(text_stream, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as e:
+                    yield number, ValueError(f"invalid JSON: {e}")
+                    continue
+                yield number, record if isinstance(record, dict) else ValueError("expected a JSON object")
+
+    def _error(self, row: int, message: str):
+        self.failed += 1
+        if len(self._errors) < IMPORT_MAX_ERRORS:
+            with self._lock:
+                self._errors.append({"row": row, "error": message})
+
+    def run(self, stream):
+        """Imports everything `stream` (a binary file-like object) contains. Never raises."""
+        self.status = "running"
+        self.started_at = time.time()
+        chunk = []
+        try:
+            with self.session_factory() as db:
+                for number, raw in self._records(stream):
+                    if self.rows >= IMPORT_MAX_ROWS:
+                        raise ValueError(f"more than IMPORT_MAX_ROWS ({IMPORT_MAX_ROWS}) rows")
+                    self.rows += 1
+                    try:
+                        if isinstance(raw, Exception):
+                            raise raw
+                        chunk.append((number, validate_row(raw, self.vendor_id)))
+                    except ValueError as e:
+                        self._error(number, str(e))
+                    if len(chunk) >= self.chunk_rows:
+                        self._write_chunk(db, chunk)
+                        chunk = []
+                if chunk:
+                    self._write_chunk(db, chunk)
+            self.status = "completed"
+        except Exception as e:
+            self.status = "failed"
+            self.detail = str(e)
+            print(f"[IMPORT] {self.import_id} for vendor {self.vendor_id} failed after {self.rows} rows: {e}")
+        finally:
+            if isinstance(stream, QueueStream):
+                stream.closed_by_reader = True
+            self.finished_at = time.time()
+        return self
+
+    # ---------- writing ----------
+
+    def _write_chunk(self, db, chunk: list):
+        """Upserts one validated chunk and stages its events, in one transaction."""
+        # Last occurrence of a slug in the chunk wins; one statement can't upsert a row twice
+        by_slug = {}
+        for number, row in chunk:
+            if row["slug"] in by_slug:
+                self._error(by_slug[row["slug"]][0], f"slug {row['slug']!r} appears again in row {number}, which replaces this row")
+            by_slug[row["slug"]] = (number, row)
+
+        owners = dict(db.execute(select(Product.slug, Product.vendor_id).where(Product.slug.in_(by_slug))).all())
+        new, existing = [], []
+        for slug, (number, row) in by_slug.items():
+            if slug not in owners:
+                new.append(row)
+            elif owners[slug] == self.vendor_id:
+                existing.append(row)
+            else:
+                self._error(number, f"slug {slug!r} belongs to another vendor's product")
+        rows = new + existing
+        if not rows:
+            return
+
+        try:
+            if db.get_bind().dialect.name == "postgresql":
+                inserted = self._copy_upsert(db, rows)
+                raced = self._lost_race(db, [row for row in new if row["slug"] not in inserted], by_slug)
+                if raced:
+                    # Created by this vendor's own concurrent import: update it like the rest
+                    db.execute(text(_STAGE_UPDATE + " AND p.slug = ANY(:slugs)"), {"slugs": [row["slug"] for row in raced]})
+                existing += raced
+            else:
+                inserted = self._insert_new(db, new) if new else set()
+                raced = self._lost_race(db, [row for row in new if row["slug"] not in inserted], by_slug)
+                existing += raced
+                if existing:
+                    table = Product.__table__
+                    db.execute(
+                        update(table).where(table.c.slug == bindparam("b_slug"))
+                        .values(name=bindparam("b_name"), price=bindparam("b_price"),
+                                **{c: func.coalesce(bindparam(f"b_{c}"), table.c[c]) for c in _OPTIONAL}),
+                        [{f"b_{c}": row[c] for c in ("slug", "name", "price", *_OPTIONAL)} for row in existing],
+                    )
+            written = db.execute(
+                select(*(getattr(Product, c) for c in EVENT_FIELDS))
+                .where(Product.slug.in_([row["slug"] for row in rows]), Product.vendor_id == self.vendor_id)
+            ).mappings().all()
+            products = [dict(p) for p in written]
+            batches = range(0, len(products), IMPORT_EVENT_BATCH)
+            for start in batches:
+                add_outbox_event(db, IMPORT_TOPIC, {
+                    "event_type": "products_imported",
+                    "import_id": self.import_id,
+                    "vendor_id": self.vendor_id,
+                    "products": products[start:start + IMPORT_EVENT_BATCH],
+                    "timestamp": datetime.datetime.utcnow().isoformat(),
+                }, key=f"products_imported:{self.import_id}:{self.chunks}:{start}")
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        self.chunks += 1
+        self.events += len(batches)
+        self.inserted += len(inserted)
+        self.updated += len(existing)
+        get_outbox_relay().notify()
+        bump_catalog_version()
+        get_realtime_hub().publish_stock({p["id"]: p["stock_qty"] for p in products})
+
+    def _insert_new(self, db, new: list) -> set:
+        """Inserts rows whose slug looked free, skipping any taken since; returns the slugs inserted."""
+        table = Product.__table__
+        dialect = db.get_bind().dialect
+        if dialect.name == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            stmt = dialect_insert(table).on_conflict_do_nothing(index_elements=["slug"])
+        elif dialect.name in ("mysql", "mariadb"):
+            from sqlalchemy.dialects.mysql import insert as dialect_insert
+            stmt = dialect_insert(table).prefix_with("IGNORE")
+        else:
+            stmt = insert(table)
+        values = [{**row, **{c: v for c, v in _DEFAULTS.items() if row[c] is None}} for row in new]
+        if dialect.insert_executemany_returning:
+            return set(db.execute(stmt.returning(table.c.slug), values).scalars())
+        # No RETURNING with executemany (MySQL): row by row, rowcount says whether it went in
+        return {row["slug"] for row in values if db.execute(stmt, row).rowcount}
+
+    def _lost_race(self, db, skipped: list, by_slug: dict) -> list:
+        """
+        Rows whose slug was created after the ownership check. Those now owned
+        by this vendor are returned to be updated; the rest are reported.
+        """
+        if not skipped:
+            return []
+        owners = dict(db.execute(
+            select(Product.slug, Product.vendor_id).where(Product.slug.in_([row["slug"] for row in skipped]))
+        ).all())
+        mine = []
+        for row in skipped:
+            if owners.get(row["slug"]) == self.vendor_id:
+                mine.append(row)
+            else:
+                self._error(by_slug[row["slug"]][0], f"slug {row['slug']!r} belongs to another vendor's product")
+        return mine
+
+    def _copy_upsert(self, db, rows: list) -> set:
+        """
+        COPY the chunk into a per-connection staging table, then update and
+        insert from it. Returns the slugs actually inserted.
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            # None becomes an unquoted empty field, which COPY reads as NULL
+            writer.writerow([("t" if row[c] else "f") if c == "is_active" and row[c] is not None else row[c] for c in COLUMNS])
+        buffer.seek(0)
+
+        db.execute(text(_STAGE_DDL))
+        copy_sql = f"COPY product_import_stage ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+        cursor = db.connection().connection.cursor()
+        try:
+            if hasattr(cursor, "copy_expert"):  # psycopg2
+                cursor.copy_expert(copy_sql, buffer)
+            else:  # psycopg 3
+                with cursor.copy(copy_sql) as copy:
+                    copy.write(buffer.getvalue())
+        finally:
+            cursor.close()
+        db.execute(text(_STAGE_UPDATE))
+        return set(db.execute(text(_STAGE_INSERT)).scalars())
+
+    # ---------- reporting ----------
+
+    def to_dict(self) -> dict:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        with self._lock:
+            errors = sorted(self._errors, key=lambda e: e["row"])
+        return {
+            "import_id": self.import_id,
+            "vendor_id": self.vendor_id,
+            "format": self.format,
+            "status": self.status,
+            "detail": self.detail,
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "failed": self.failed,
+            "chunks": self.chunks,
+            "events": self.events,
+            "elapsed_s": round(elapsed, 3),
+            "rows_per_s": round(self.rows / elapsed) if elapsed else 0,
+            "ignored_columns": self.ignored_columns,
+            "errors": errors,
+            "errors_truncated": self.failed > len(errors),
+        }
+
+
+_imports = OrderedDict()  # import id -> ProductImport, most recent last
+_imports_lock = threading.Lock()
+
+
+def start_import(vendor_id: int, fmt: str, import_id: str = None) -> ProductImport:
+    job = ProductImport(vendor_id, fmt, import_id)
+    with _imports_lock:
+        if job.import_id in _imports and _imports[job.import_id].status in ("pending", "running"):
+            raise ValueError(f"import {job.import_id} is already running")
+        _imports[job.import_id] = job
+        _imports.move_to_end(job.import_id)
+        while len(_imports) > IMPORT_HISTORY:
+            _imports.popitem(last=False)
+    return job
+
+
+def get_import(import_id: str):
+    """Progress of an import started by this process, or None."""
+    with _imports_lock:
+        return _imports.get(import_id)
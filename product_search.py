@@ -0,0 +1,769 @@
+"""
+In-process full-text search over the product catalog.
+
+Products are tokenized (name terms count SEARCH_NAME_WEIGHT times) into an
+inverted index held as numpy CSR postings: term i's documents are
+docs[offsets[i]:offsets[i+1]], ascending, and order[] lists the same
+postings by BM25 impact, highest first. A query gathers candidates from the
+head of each term's impact order and fully scores them by binary search in
+the doc-ordered lists. It stops as soon as the k-th best score beats the
+best score any unseen document could still reach (Fagin's threshold
+algorithm). A query for a term in most of the catalog therefore touches a
+few thousand postings, not the whole list. Vendor-filtered queries score
+that vendor's products directly. The last query term also matches as a
+prefix, and terms missing from the vocabulary match their edit-distance-1
+neighbours.
+
+Updates never rewrite the big arrays in place. An upserted product gets a
+new document number; its old one is tombstoned in the `alive` mask. Its
+postings go to a small pending layer that every query scores in full. Once
+the layer is big enough it is merged into a fresh base in the background.
+Stock/price/vendor changes update the attribute arrays in place.
+
+The index is snapshotted to SEARCH_INDEX_PATH (tombstones dropped), with
+the event-feed offsets it had applied. Startup loads the snapshot, replays
+marketplace.products from those offsets, and refreshes stock/price and new
+products from the database instead of re-tokenizing the whole catalog.
+"""
+import os
+import re
+import json
+import math
+import time
+import bisect
+import threading
+from collections import Counter
+
+import numpy as np
+
+SEARCH_INDEX_PATH = os.getenv("SEARCH_INDEX_PATH", "search_index.npz")
+SEARCH_TOPIC = os.getenv("SEARCH_TOPIC", "marketplace.products")
+SEARCH_NAME_WEIGHT = int(os.getenv("SEARCH_NAME_WEIGHT", "3"))
+SEARCH_MERGE_THRESHOLD = int(os.getenv("SEARCH_MERGE_THRESHOLD", "50000"))  # pending postings
+SEARCH_SAVE_INTERVAL = float(os.getenv("SEARCH_SAVE_INTERVAL", "300"))
+SEARCH_REFRESH_INTERVAL = float(os.getenv("SEARCH_REFRESH_INTERVAL", "300"))
+SEARCH_MAX_EXPANSIONS = int(os.getenv("SEARCH_MAX_EXPANSIONS", "20"))
+SEARCH_TYPO_MIN_LEN = int(os.getenv("SEARCH_TYPO_MIN_LEN", "4"))
+# Candidates scored per query before settling for the best found; 0 = no cap
+SEARCH_MAX_CANDIDATES = int(os.getenv("SEARCH_MAX_CANDIDATES", "40000"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+PREFIX_WEIGHT = 0.6
+TYPO_WEIGHT = 0.5
+_PREFIX_SCAN = 5000
+_ALPHABET = "abcdefghijklmnopqrstuvwxyz0123456789"
+_TOKEN = re.compile(r"[^\W_]+")
+# Function words present in most descriptions: no ranking value, huge postings
+STOPWORDS = frozenset(
+    "a an and are as at be by for from in into is it its of on or our the this to with your".split()
+)
+
+
+def tokenize(text: str) -> list:
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS] if text else []
+
+
+def _edits1(word: str) -> set:
+    splits = [(word[:i], word[i:]) for i in range(len(word) + 1)]
+    deletes = [a + b[1:] for a, b in splits if b]
+    transposes = [a + b[1] + b[0] + b[2:] for a, b in splits if len(b) > 1]
+    replaces = [a + c + b[1:] for a, b in splits if b for c in _ALPHABET]
+    inserts = [a + c + b for a, b in splits for c in _ALPHABET]
+    return set(deletes + transposes + replaces + inserts) - {word}
+
+
+def _impacts(tfs, lengths, avgdl: float):
+    """BM25 term-frequency component of postings (everything but idf)."""
+    tfs = tfs.astype(np.float32)
+    return tfs * (BM25_K1 + 1) / (tfs + BM25_K1 * (1 - BM25_B + BM25_B * lengths / avgdl))
+
+
+class _Postings:
+    """
+    Immutable CSR postings over a sorted vocabulary. Impacts (and so order[])
+    use the average document length frozen when the postings were built.
+    """
+
+    def __init__(self, terms: list, offsets, docs, tfs, order, avgdl: float):
+        self.terms = terms
+        self.lookup = {t: i for i, t in enumerate(terms)}
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.order = order
+        self.avgdl = avgdl
+
+    def slice(self, term: str):
+        """(docs, tfs, order) of `term`, or None."""
+        i = self.lookup.get(term)
+        if i is None:
+            return None
+        a, b = self.offsets[i], self.offsets[i + 1]
+        return self.docs[a:b], self.tfs[a:b], self.order[a:b]
+
+    def df(self, term: str) -> int:
+        i = self.lookup.get(term)
+        return 0 if i is None else int(self.offsets[i + 1] - self.offsets[i])
+
+    def __len__(self):
+        return len(self.docs)
+
+
+_EMPTY = _Postings([], np.zeros(1, np.int64), np.zeros(0, np.int32), np.zeros(0, np.uint16), np.zeros(0, np.int32), 1.0)
+
+
+def _impact_order(offsets, docs, tfs, lengths, avgdl: float):
+    """Per term, the local positions of its postings by descending impact."""
+    term_of = np.repeat(np.arange(len(offsets) - 1, dtype=np.int64), np.diff(offsets))
+    order = np.lexsort((-_impacts(tfs, lengths[docs], avgdl), term_of))
+    return (order - offsets[term_of]).astype(np.int32)
+
+
+def _merge_postings(base: _Postings, layer: dict, lengths, avgdl: float) -> _Postings:
+    """New base = base + layer ({term: ([docs], [tfs])}); layer docs are all newer than base docs."""
+    terms = sorted(set(base.terms).union(layer))
+    offsets = np.zeros(len(terms) + 1, np.int64)
+    doc_parts, tf_parts = [], []
+    for n, term in enumerate(terms):
+        size = 0
+        i = base.lookup.get(term)
+        if i is not None:
+            a, b = base.offsets[i], base.offsets[i + 1]
+            doc_parts.append(base.docs[a:b])
+            tf_parts.append(base.tfs[a:b])
+            size += b - a
+        extra = layer.get(term)
+        if extra:
+            doc_parts.append(np.asarray(extra[0], np.int32))
+            tf_parts.append(np.asarray(extra[1], np.uint16))
+            size += len(extra[0])
+        offsets[n + 1] = offsets[n] + size
+    docs = np.concatenate(doc_parts) if doc_parts else np.zeros(0, np.int32)
+    tfs = np.concatenate(tf_parts) if tf_parts else np.zeros(0, np.uint16)
+    return _Postings(terms, offsets, docs, tfs, _impact_order(offsets, docs, tfs, lengths, avgdl), avgdl)
+
+
+class _QueryTerm:
+    """An expanded query term: idf-weighted, with its base postings and pending ones."""
+
+    def __init__(self, idf: float, base, layer_docs, layer_tfs):
+        self.idf = idf
+        self.docs, self.tfs, self.order = base if base is not None else (None, None, None)
+        self.layer_docs = layer_docs
+        self.layer_tfs = layer_tfs
+        self.depth = 0
+
+    def exhausted(self) -> bool:
+        return self.docs is None or self.depth >= len(self.docs)
+
+
+class SearchResult:
+    def __init__(self, ids: list, scores: list, total: int, exact: bool, took_ms: float):
+        self.ids = ids
+        self.scores = scores
+        self.total = total  # estimated when the search stopped early (exact=False)
+        self.exact = exact
+        self.took_ms = took_ms
+
+
+class ProductSearchIndex:
+    _ATTRS = (("pid", np.int64), ("vendor", np.int64), ("price", np.float64),
+              ("stock", np.int64), ("length", np.float32), ("alive", np.bool_))
+
+    def __init__(self, path: str = SEARCH_INDEX_PATH, session_factory=None):
+        self.path = path
+        self._session_factory = session_factory
+        self._lock = threading.RLock()
+        self._merge_lock = threading.Lock()
+        self._base = _EMPTY
+        self._frozen = {}  # layer being merged into the next base
+        self._pending = {}  # term -> ([docs], [tfs])
+        self._pending_postings = 0
+        self._n = 0
+        self._doc_of = {}  # product id -> live document number
+        self._live = 0
+        self._total_len = 0.0
+        for name, dtype in self._ATTRS:
+            setattr(self, "_" + name, np.zeros(0, dtype))
+        self.max_id = 0
+        self.positions = {}  # event feed offsets applied so far
+        self.ready = False
+        self.dirty = False
+        self._catch_up = False
+        self._stop = threading.Event()
+        self._thread = None
+        self.queries = 0
+        self.query_ms_total = 0.0
+        self.query_ms_max = 0.0
+        self.merges = 0
+        self.last_merge_ms = 0.0
+
+    # ---------- writes ----------
+
+    def _grow(self):
+        capacity = max(1024, 2 * len(self._pid))
+        for name, dtype in self._ATTRS:
+            old = getattr(self, "_" + name)
+            new = np.zeros(capacity, dtype)
+            new[:self._n] = old[:self._n]
+            setattr(self, "_" + name, new)
+
+    def _remove(self, product_id: int):
+        doc = self._doc_of.pop(product_id, None)
+        if doc is not None and self._alive[doc]:
+            self._alive[doc] = False
+            self._live -= 1
+            self._total_len -= float(self._length[doc])
+
+    def _add(self, product: dict):
+        terms = Counter(tokenize(product.get("name")))
+        for term in terms:
+            terms[term] *= SEARCH_NAME_WEIGHT
+        terms.update(tokenize(product.get("description")))
+        if self._n == len(self._pid):
+            self._grow()
+        doc = self._n
+        product_id = int(product["id"])
+        length = float(sum(terms.values()))
+        self._pid[doc] = product_id
+        self._vendor[doc] = product.get("vendor_id") or 0
+        self._price[doc] = product.get("price") or 0.0
+        self._stock[doc] = product.get("stock_qty") or 0
+        self._length[doc] = length
+        self._alive[doc] = True
+        self._n += 1
+        self._doc_of[product_id] = doc
+        self._live += 1
+        self._total_len += length
+        for term, tf in terms.items():
+            docs, tfs = self._pending.setdefault(term, ([], []))
+            docs.append(doc)
+            tfs.append(tf)
+        self._pending_postings += len(terms)
+        self.max_id = max(self.max_id, product_id)
+
+    def upsert_many(self, products):
+        """Indexes (or re-indexes) product dicts with id, name, description, vendor_id, price, stock_qty[, is_active]."""
+        with self._lock:
+            for product in products:
+                self._remove(int(product["id"]))
+                if product.get("is_active", True):
+                    self._add(product)
+            self.dirty = True
+
+    def upsert(self, product: dict):
+        self.upsert_many([product])
+
+    def remove(self, product_id: int):
+        with self._lock:
+            self._remove(product_id)
+            self.dirty = True
+
+    def update_attributes(self, rows):
+        """In-place vendor/price/stock updates from (id, vendor_id, price, stock_qty) rows; None leaves a value as is."""
+        with self._lock:
+            for product_id, vendor_id, price, stock_qty in rows:
+                doc = self._doc_of.get(product_id)
+                if doc is None:
+                    continue
+                if vendor_id is not None:
+                    self._vendor[doc] = vendor_id
+                if price is not None:
+                    self._price[doc] = price
+                if stock_qty is not None:
+                    self._stock[doc] = stock_qty
+            self.dirty = True
+
+    def merge(self) -> bool:
+        """Folds the pending layer into a new base. Queries keep running on the old one meanwhile."""
+        with self._merge_lock:
+            with self._lock:
+                if not self._pending:
+                    return False
+                self._frozen, self._pending = self._pending, {}
+                self._pending_postings = 0
+                base, layer, lengths = self._base, self._frozen, self._length
+                avgdl = self._total_len / self._live if self._live else 1.0
+            started = time.perf_counter()
+            merged = _merge_postings(base, layer, lengths, avgdl)
+            with self._lock:
+                self._base = merged
+                self._frozen = {}
+            self.merges += 1
+            self.last_merge_ms = (time.perf_counter() - started) * 1000
+            return True
+
+    def apply_event(self, event: dict):
+        if event.get("event_type") == "products_imported":
+            self.upsert_many(event.get("products") or [])
+            return
+        if event.get("event_type") != "product_created":
+            return
+        data = event.get("data") or {}
+        product_id = data.get("id") or data.get("product_id")
+        if product_id:
+            self.upsert({**data, "id": product_id})
+        else:
+            # Payload without an id: pick the row up from the database once it lands
+            self._catch_up = True
+
+    # ---------- queries ----------
+
+    def _has(self, term: str) -> bool:
+        return term in self._base.lookup or term in self._pending or term in self._frozen
+
+    def _df(self, term: str) -> int:
+        return self._base.df(term) + sum(len(layer[term][0]) for layer in (self._frozen, self._pending) if term in layer)
+
+    def _prefixed(self, prefix: str) -> list:
+        terms = self._base.terms
+        start = bisect.bisect_left(terms, prefix)
+        found = []
+        for term in terms[start:start + _PREFIX_SCAN]:
+            if not term.startswith(prefix):
+                break
+            found.append(term)
+        for layer in (self._frozen, self._pending):
+            found.extend(t for t in layer if t.startswith(prefix) and t not in self._base.lookup)
+        found = [t for t in set(found) if t != prefix]
+        return sorted(found, key=self._df, reverse=True)[:SEARCH_MAX_EXPANSIONS]
+
+    def _expand(self, tokens: list) -> list:
+        """(term, weight) pairs for the query tokens."""
+        expanded = []
+        for pos, token in enumerate(tokens):
+            if self._has(token):
+                expanded.append((token, 1.0))
+            elif len(token) >= SEARCH_TYPO_MIN_LEN:
+                near = sorted((t for t in _edits1(token) if self._has(t)), key=self._df, reverse=True)
+                expanded.extend((t, TYPO_WEIGHT) for t in near[:SEARCH_MAX_EXPANSIONS])
+            if pos == len(tokens) - 1 and len(token) >= 2:
+                expanded.extend((t, PREFIX_WEIGHT) for t in self._prefixed(token))
+        return expanded
+
+    def _layer_postings(self, term: str):
+        docs, tfs = [], []
+        for layer in (self._frozen, self._pending):
+            if term in layer:
+                docs.extend(layer[term][0])
+                tfs.extend(layer[term][1])
+        return np.array(docs, np.int32), np.array(tfs, np.uint16)
+
+    def search(self, query: str, vendor_id: int = None, min_price: float = None, max_price: float = None,
+               in_stock: bool = False, limit: int = 20) -> SearchResult:
+        """
+        Top `limit` products by BM25. Exact unless SEARCH_MAX_CANDIDATES ran
+        out first (queries made only of very common terms), in which case the
+        best of the candidates scored so far are returned; `total` is then an
+        estimate either way.
+        """
+        started = time.perf_counter()
+        tokens = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            n, live = self._n, self._live
+            base = self._base
+            avgdl = base.avgdl if len(base) else (self._total_len / live if live else 1.0)
+            lengths, alive = self._length, self._alive
+            vendors, prices, stocks, pids = self._vendor, self._price, self._stock, self._pid
+            weights = {}
+            for term, weight in self._expand(tokens):
+                weights[term] = weights.get(term, 0.0) + weight
+            terms = []
+            for term, weight in weights.items():
+                layer_docs, layer_tfs = self._layer_postings(term)
+                df = base.df(term) + len(layer_docs)
+                idf = weight * math.log(1 + (live - df + 0.5) / (df + 0.5))
+                terms.append(_QueryTerm(idf, base.slice(term), layer_docs, layer_tfs))
+
+        def keep(cand):
+            mask = alive[cand]
+            if min_price is not None:
+                mask &= prices[cand] >= min_price
+            if max_price is not None:
+                mask &= prices[cand] <= max_price
+            if in_stock:
+                mask &= stocks[cand] > 0
+            return cand[mask]
+
+        def score(cand):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[cand] / avgdl)
+            total = np.zeros(len(cand), np.float32)
+            for t in terms:
+                for docs, tfs in ((t.docs, t.tfs), (t.layer_docs, t.layer_tfs)):
+                    if docs is None or not len(docs):
+                        continue
+                    pos = np.minimum(np.searchsorted(docs, cand), len(docs) - 1)
+                    tf = np.where(docs[pos] == cand, tfs[pos], 0).astype(np.float32)
+                    total += t.idf * tf * (BM25_K1 + 1) / (tf + norm)
+            return total
+
+        top_docs, top_scores = np.zeros(0, np.int32), np.zeros(0, np.float32)
+        total, exact = 0, True
+        if terms and live and vendor_id is not None:
+            # A vendor's products are few: score them all
+            cand = keep(np.flatnonzero(vendors[:n] == vendor_id))
+            cand_scores = score(cand)
+            matched = cand_scores > 0
+            top_docs, top_scores = cand[matched], cand_scores[matched]
+            total = len(top_docs)
+        elif terms and live:
+            visited = np.zeros(n, np.bool_)
+            slot = np.empty(n, np.int32)
+            block = max(1024, 4 * limit)
+            seen = 0
+            parts = [t.layer_docs for t in terms]
+            while True:
+                for t in terms:
+                    if not t.exhausted():
+                        parts.append(t.docs[t.order[t.depth:t.depth + block]])
+                        t.depth += block
+                cand = np.concatenate(parts)
+                cand = cand[~visited[cand]]
+                # Dedupe without hashing: only the last write of each doc to its slot survives
+                slot[cand] = np.arange(len(cand), dtype=np.int32)
+                cand = np.sort(cand[slot[cand] == np.arange(len(cand), dtype=np.int32)])
+                visited[cand] = True
+                seen += len(cand)
+                cand = keep(cand)
+                if len(cand):
+                    total += len(cand)
+                    top_docs = np.concatenate([top_docs, cand])
+                    top_scores = np.concatenate([top_scores, score(cand)])
+                    if len(top_docs) > limit:
+                        best = np.argpartition(-top_scores, limit)[:limit]
+                        top_docs, top_scores = top_docs[best], top_scores[best]
+                # Highest score a document not yet seen could still have
+                bound = 0.0
+                for t in terms:
+                    if not t.exhausted():
+                        p = t.order[t.depth]
+                        bound += t.idf * float(_impacts(t.tfs[p:p + 1], lengths[t.docs[p:p + 1]], avgdl)[0])
+                if all(t.exhausted() for t in terms):
+                    break
+                if len(top_scores) >= limit and top_scores.min() >= bound:
+                    exact = False
+                    break
+                if SEARCH_MAX_CANDIDATES and seen >= SEARCH_MAX_CANDIDATES and len(top_scores) >= limit:
+                    exact = False
+                    break
+                parts = []
+                block *= 2
+            if not exact:
+                # Union size under independence, scaled by the filter pass rate seen so far
+                miss = 1.0
+                for t in terms:
+                    miss *= 1 - min(1.0, (0 if t.docs is None else len(t.docs)) / live)
+                total = max(total, int(live * (1 - miss) * total / max(seen, 1)))
+
+        order = np.argsort(-top_scores, kind="stable")[:limit]
+        ids = pids[top_docs[order]].tolist()
+        scores = top_scores[order].tolist()
+        took_ms = (time.perf_counter() - started) * 1000
+        self.queries += 1
+        self.query_ms_total += took_ms
+        self.query_ms_max = max(self.query_ms_max, took_ms)
+        return SearchResult(ids, scores, total, exact, took_ms)
+
+    # ---------- persistence ----------
+
+    def save(self, path: str = None):
+        """Writes a compacted snapshot (no tombstones) atomically."""
+        path = path or self.path
+        started = time.perf_counter()
+        with self._lock:
+            base, n = self._base, self._n
+            layers = [{t: (list(d), list(f)) for t, (d, f) in layer.items()} for layer in (self._frozen, self._pending)]
+            attrs = {name: getattr(self, "_" + name)[:n].copy() for name, _ in self._ATTRS}
+            meta = {"positions": dict(self.positions), "max_id": self.max_id, "saved_at": time.time()}
+            self.dirty = False
+        layer = layers[0]
+        for term, (docs, tfs) in layers[1].items():
+            d, f = layer.setdefault(term, ([], []))
+            d.extend(docs)
+            f.extend(tfs)
+        alive = attrs.pop("alive")
+        postings = _merge_postings(base, layer, attrs["length"], base.avgdl) if layer else base
+
+        renumber = np.cumsum(alive, dtype=np.int64) - 1
+        term_of = np.repeat(np.arange(len(postings.terms)), np.diff(postings.offsets))
+        keep = alive[postings.docs]
+        counts = np.bincount(term_of[keep], minlength=len(postings.terms))
+        used = counts > 0
+        terms = [t for t, u in zip(postings.terms, used) if u]
+        offsets = np.concatenate([[0], np.cumsum(counts[used])]).astype(np.int64)
+        docs = renumber[postings.docs[keep]].astype(np.int32)
+        tfs = postings.tfs[keep]
+        lengths = attrs["length"][alive]
+        avgdl = float(lengths.mean()) if len(lengths) else 1.0
+        meta["avgdl"] = avgdl
+
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                terms=np.frombuffer("\n".join(terms).encode("utf-8"), np.uint8),
+                offsets=offsets,
+                docs=docs,
+                tfs=tfs,
+                order=_impact_order(offsets, docs, tfs, lengths, avgdl),
+                meta=np.frombuffer(json.dumps(meta).encode("utf-8"), np.uint8),
+                **{name: values[alive] for name, values in attrs.items()},
+            )
+        os.replace(tmp, path)
+        print(f"[SEARCH] Saved {int(alive.sum())} products, {len(terms)} terms to {path} "
+              f"in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    def load(self, path: str = None) -> bool:
+        path = path or self.path
+        if not os.path.exists(path):
+            return False
+        started = time.perf_counter()
+        with np.load(path) as z:
+            blob = z["terms"].tobytes().decode("utf-8")
+            meta = json.loads(z["meta"].tobytes())
+            base = _Postings(blob.split("\n") if blob else [], z["offsets"], z["docs"], z["tfs"], z["order"], meta["avgdl"])
+            attrs = {name: z[name] for name, _ in self._ATTRS if name != "alive"}
+        n = len(attrs["pid"])
+        with self._lock:
+            self._base, self._frozen, self._pending, self._pending_postings = base, {}, {}, 0
+            for name, values in attrs.items():
+                setattr(self, "_" + name, values)
+            self._alive = np.ones(n, np.bool_)
+            self._n = self._live = n
+            self._doc_of = dict(zip(self._pid.tolist(), range(n)))
+            self._total_len = float(self._length.sum())
+            self.max_id = meta.get("max_id", 0)
+            self.positions = meta.get("positions", {})
+            self.dirty = False
+        print(f"[SEARCH] Loaded {n} products, {len(base.terms)} terms from {path} "
+              f"in {(time.perf_counter() - started) * 1000:.0f}ms")
+        return True
+
+    # ---------- database sync ----------
+
+    def _sessions(self):
+        if self._session_factory is None:
+            from config_db import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory
+
+    def _scan(self, columns, after_id: int = 0, batch: int = 5000):
+        """Keyset scan of products by id yielding row mappings of `columns`."""
+        from sqlalchemy import select
+        from models import Product
+
+        while True:
+            with self._sessions()() as db:
+                rows = db.execute(
+                    select(*[getattr(Product, c) for c in columns])
+                    .where(Product.id > after_id).order_by(Product.id).limit(batch)
+                ).mappings().all()
+            if not rows:
+                return
+            yield rows
+            after_id = rows[-1]["id"]
+
+    def sync_new_products(self) -> int:
+        """Indexes products with an id above the highest one seen."""
+        added = 0
+        for rows in self._scan(("id", "name", "description", "vendor_id", "price", "stock_qty", "is_active"), self.max_id):
+            self.upsert_many(dict(r) for r in rows)
+            added += len(rows)
+        return added
+
+    def refresh_from_db(self):
+        """
+        Cheap reconciliation with the products table: attributes and
+        activation for known products (no re-tokenizing), full indexing of
+        unknown ones, and removal of rows that no longer exist.
+        """
+        from sqlalchemy import select
+        from models import Product
+
+        started = time.perf_counter()
+        seen, added = [], 0
+        # Text columns are only read for the (few) products the index doesn't have yet
+        for rows in self._scan(("id", "vendor_id", "price", "stock_qty", "is_active")):
+            known, new, inactive = [], [], []
+            with self._lock:
+                for r in rows:
+                    if not r["is_active"]:
+                        inactive.append(r["id"])
+                    elif r["id"] in self._doc_of:
+                        known.append((r["id"], r["vendor_id"], r["price"], r["stock_qty"]))
+                    else:
+                        new.append(r["id"])
+            seen.extend(r["id"] for r in rows)
+            self.update_attributes(known)
+            if new:
+                with self._sessions()() as db:
+                    new = db.execute(
+                        select(Product.id, Product.name, Product.description, Product.vendor_id, Product.price,
+                               Product.stock_qty).where(Product.id.in_(new), Product.is_active.is_(True))
+                    ).mappings().all()
+                self.upsert_many(dict(r) for r in new)
+                added += len(new)
+            with self._lock:
+                for product_id in inactive:
+                    self._remove(product_id)
+        with self._lock:
+            live = self._pid[:self._n][self._alive[:self._n]]
+            gone = live[~np.isin(live, np.array(seen, np.int64))].tolist()
+            for product_id in gone:
+                self._remove(product_id)
+        self.merge()
+        print(f"[SEARCH] Refreshed from database: {self._live} products, {added} newly indexed, "
+              f"{len(gone)} removed in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+    # ---------- background sync ----------
+
+    def _open_feed(self):
+        from kafka_producer import EVENT_BUS_BACKEND, KAFKA_BROKER_URL, get_event_producer
+
+        try:
+            if EVENT_BUS_BACKEND == "local":
+                return _LocalFeed(get_event_producer().log, SEARCH_TOPIC, self.positions)
+            return _KafkaFeed(KAFKA_BROKER_URL, SEARCH_TOPIC, self.positions)
+        except Exception as e:
+            print(f"[SEARCH] Event feed unavailable, relying on periodic database refresh: {e}")
+            return None
+
+    def _run(self):
+        try:
+            loaded = self.load()
+        except Exception as e:
+            loaded = False
+            print(f"[SEARCH] Could not load snapshot {self.path}: {e}")
+        # Serve a loaded snapshot while the database pass runs; with neither, /search stays 503
+        self.ready = loaded
+        # Open the feed first so events committed during the database pass are replayed, not missed
+        feed = self._open_feed()
+        last_save = last_refresh = time.monotonic()
+        try:
+            self.refresh_from_db()
+            self.ready = True
+        except Exception as e:
+            print(f"[SEARCH] Initial database refresh failed: {e}")
+
+        while not self._stop.is_set():
+            try:
+                if feed is not None:
+                    for position_key, next_offset, event in feed.poll(timeout=1.0):
+                        self.apply_event(event)
+                        self.positions[position_key] = next_offset
+                else:
+                    self._stop.wait(1.0)
+                if self._catch_up:
+                    self._catch_up = False
+                    self.sync_new_products()
+                if self._pending_postings >= SEARCH_MERGE_THRESHOLD:
+                    self.merge()
+                now = time.monotonic()
+                # Until a snapshot or refresh succeeds there is nothing to serve: retry sooner
+                if now - last_refresh > (SEARCH_REFRESH_INTERVAL if self.ready else 10):
+                    last_refresh = now
+                    self.refresh_from_db()
+                    self.ready = True
+                if self.dirty and now - last_save > SEARCH_SAVE_INTERVAL:
+                    last_save = now
+                    self.save()
+            except Exception as e:
+                print(f"[SEARCH] Sync error: {e}")
+                self._stop.wait(1.0)
+        if feed is not None:
+            feed.close()
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="search-index", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self.ready and self.dirty:
+            try:
+                self.save()
+            except Exception as e:
+                print(f"[SEARCH] Snapshot on shutdown failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "products": self._live,
+            "tombstones": self._n - self._live,
+            "terms": len(self._base.terms),
+            "postings": len(self._base),
+            "pending_postings": self._pending_postings,
+            "merges": self.merges,
+            "last_merge_ms": round(self.last_merge_ms, 2),
+            "queries": self.queries,
+            "query_ms_avg": round(self.query_ms_total / self.queries, 3) if self.queries else 0.0,
+            "query_ms_max": round(self.query_ms_max, 3),
+            "positions": dict(self.positions),
+        }
+
+
+class _LocalFeed:
+    def __init__(self, log, topic: str, positions: dict):
+        from local_event_log import EventLogConsumer
+
+        self.topic = topic
+        self.consumer = EventLogConsumer(log, "search-index", [topic])
+        self.consumer.seek(topic, positions.get(topic, log.topic(topic).end_offset))
+
+    def poll(self, timeout: float) -> list:
+        return [(topic, offset + 1, event) for topic, offset, event in self.consumer.poll(500, timeout)]
+
+    def close(self):
+        pass
+
+
+class _KafkaFeed:
+    """Reads every partition without a consumer group: each process keeps its own full index."""
+
+    def __init__(self, broker_url: str, topic: str, positions: dict):
+        from kafka import KafkaConsumer, TopicPartition
+        from event_schemas import decode_event
+
+        self.consumer = KafkaConsumer(bootstrap_servers=broker_url, enable_auto_commit=False, value_deserializer=decode_event)
+        partitions = [TopicPartition(topic, p) for p in sorted(self.consumer.partitions_for_topic(topic) or ())]
+        self.consumer.assign(partitions)
+        for tp in partitions:
+            key = f"{topic}:{tp.partition}"
+            if key in positions:
+                self.consumer.seek(tp, positions[key])
+            else:
+                self.consumer.seek_to_end(tp)
+
+    def poll(self, timeout: float) -> list:
+        out = []
+        for tp, records in self.consumer.poll(timeout_ms=int(timeout * 1000)).items():
+            out.extend((f"{tp.topic}:{tp.partition}", r.offset + 1, r.value) for r in records)
+        return out
+
+    def close(self):
+        self.consumer.close()
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_search_index() -> ProductSearchIndex:
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ProductSearchIndex()
+    return _index
+
+
+def update_search_stock(stock_by_id: dict):
+    """Called after a committed stock change; a no-op until the index exists."""
+    if _index is not None:
+        _index.update_attributes((pid, None, None, qty) for pid, qty in stock_by_id.items())
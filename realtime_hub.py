@@ -0,0 +1,362 @@
+"""
+WebSocket fan-out for live stock levels and vendor order notifications.
+
+Producers (checkout, order endpoints; any thread) call publish_stock() and
+publish_order(). These only update a lock-protected buffer. Stock is
+coalesced per product, last value wins. Once per tick the single publisher
+task on the event loop drains that buffer. With the memory backend it fans
+out straight to this process's subscribers. With redis it publishes one
+message per tick, which every worker's listener receives and fans out
+locally.
+
+Fan-out serializes each changed product once and hands the fragment to each
+of its subscribers' pending maps, yielding to the event loop every
+REALTIME_FANOUT_SLICE deliveries so a big tick never stalls other
+connections; each connection's writer task then sends one frame with
+everything pending for it. A slow client therefore only ever
+holds the latest stock per product, never a backlog. Order notifications
+are not conflated. A client that lets REALTIME_MAX_QUEUED_ORDERS pile up is
+disconnected (1013, try again later) and should resync over REST.
+"""
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import defaultdict, deque
+
+from cache_backends import REDIS_URL
+
+REALTIME_BACKEND = os.getenv("REALTIME_BACKEND", "memory")  # memory | redis
+REALTIME_CHANNEL = os.getenv("REALTIME_CHANNEL", "realtime:marketplace")
+REALTIME_TICK_MS = int(os.getenv("REALTIME_TICK_MS", "100"))
+REALTIME_MAX_PRODUCT_SUBSCRIPTIONS = int(os.getenv("REALTIME_MAX_PRODUCT_SUBSCRIPTIONS", "1000"))
+REALTIME_MAX_QUEUED_ORDERS = int(os.getenv("REALTIME_MAX_QUEUED_ORDERS", "500"))
+# Deliveries (subscriber x change) handled before fan-out yields to the event loop
+REALTIME_FANOUT_SLICE = int(os.getenv("REALTIME_FANOUT_SLICE", "2000"))
+
+
+class Subscriber:
+    """One WebSocket connection: its subscriptions and what is waiting to be sent to it."""
+
+    __slots__ = ("hub", "websocket", "products", "vendor_id", "stock", "awaiting_snapshot", "orders", "wake", "overflow",
+                 "closed", "frames")
+
+    def __init__(self, hub, websocket):
+        self.hub = hub
+        self.websocket = websocket
+        self.products = set()
+        self.vendor_id = None
+        self.stock = {}  # product id -> serialized {"product_id", "stock_qty"}
+        self.awaiting_snapshot = set()  # subscribed ids with no change fanned out yet
+        self.orders = deque()  # serialized order frames
+        self.wake = asyncio.Event()
+        self.overflow = False
+        self.closed = False
+        self.frames = 0
+
+    def push_snapshot(self, product_ids, stock_by_id: dict):
+        """
+        Current stock of `product_ids`, read after subscribing. Ids that have
+        had a change fanned out since are skipped: that value is at least as fresh.
+        """
+        for product_id, qty in stock_by_id.items():
+            if product_id in self.awaiting_snapshot:
+                self.stock[product_id] = f'{{"product_id":{product_id},"stock_qty":{qty}}}'
+        self.awaiting_snapshot.difference_update(product_ids)
+        self.wake.set()
+
+    def push_order(self, frame: str):
+        """Queues without waking the writer; the caller wakes it once per tick."""
+        if len(self.orders) >= REALTIME_MAX_QUEUED_ORDERS:
+            self.overflow = True
+        else:
+            self.orders.append(frame)
+
+    async def run(self):
+        """Writer loop: one send per wake-up for all pending stock, then queued orders."""
+        try:
+            while not self.closed:
+                await self.wake.wait()
+                self.wake.clear()
+                if self.overflow:
+                    self.hub.slow_disconnects += 1
+                    await self.websocket.close(code=1013)
+                    break
+                if self.stock:
+                    pending, self.stock = self.stock, {}
+                    await self.websocket.send_text('{"type":"stock","items":[' + ",".join(pending.values()) + "]}")
+                    self.frames += 1
+                while self.orders:
+                    await self.websocket.send_text(self.orders.popleft())
+                    self.frames += 1
+        except Exception:
+            pass  # client went away mid-send; the receive side cleans up
+        finally:
+            self.hub.disconnect(self)
+
+
+class RealtimeHub:
+    def __init__(self, backend: str = REALTIME_BACKEND, tick_ms: int = REALTIME_TICK_MS):
+        self.backend = backend
+        self.tick = tick_ms / 1000
+        self._lock = threading.Lock()
+        self._out_stock = {}  # product id -> stock_qty, from producers
+        self._out_orders = []  # (vendor_id, order)
+        self._in_stock = {}  # received from the backend, touched only on the event loop
+        self._in_orders = []
+        self._product_subs = defaultdict(set)
+        self._vendor_subs = defaultdict(set)
+        self._subscribers = set()
+        self._loop = None
+        self._task = None
+        self._listener = None
+        self._redis = None
+        self.ticks = 0
+        self.published_stock = 0
+        self.published_orders = 0
+        self.dropped = 0
+        self.fanned_out = 0
+        self.slow_disconnects = 0
+        self.last_fanout_ms = 0.0
+        self.max_fanout_ms = 0.0
+        self.max_slice_ms = 0.0  # longest stretch fan-out held the event loop
+
+    # ---------- producers (any thread) ----------
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def publish_stock(self, stock_by_id: dict):
+        if not self.running:
+            self.dropped += len(stock_by_id)
+            return
+        with self._lock:
+            self._out_stock.update(stock_by_id)
+            self.published_stock += len(stock_by_id)
+
+    def publish_order(self, vendor_id: int, order: dict):
+        if not self.running:
+            self.dropped += 1
+            return
+        with self._lock:
+            self._out_orders.append((vendor_id, order))
+            self.published_orders += 1
+
+    # ---------- subscribers (event loop) ----------
+
+    def connect(self, websocket) -> Subscriber:
+        subscriber = Subscriber(self, websocket)
+        self._subscribers.add(subscriber)
+        asyncio.get_running_loop().create_task(subscriber.run())
+        return subscriber
+
+    def subscribe_products(self, subscriber: Subscriber, product_ids) -> list:
+        """Adds subscriptions up to REALTIME_MAX_PRODUCT_SUBSCRIPTIONS; returns the ids actually added."""
+        added = []
+        for product_id in product_ids:
+            if len(subscriber.products) >= REALTIME_MAX_PRODUCT_SUBSCRIPTIONS:
+                break
+            if product_id not in subscriber.products:
+                subscriber.products.add(product_id)
+                subscriber.awaiting_snapshot.add(product_id)
+                self._product_subs[product_id].add(subscriber)
+                added.append(product_id)
+        return added
+
+    def unsubscribe_products(self, subscriber: Subscriber, product_ids):
+        for product_id in product_ids:
+            subscriber.products.discard(product_id)
+            subscriber.awaiting_snapshot.discard(product_id)
+            subs = self._product_subs.get(product_id)
+            if subs is not None:
+                subs.discard(subscriber)
+                if not subs:
+                    del self._product_subs[product_id]
+
+    def subscribe_vendor(self, subscriber: Subscriber, vendor_id: int):
+        self.unsubscribe_vendor(subscriber)
+        subscriber.vendor_id = vendor_id
+        self._vendor_subs[vendor_id].add(subscriber)
+
+    def unsubscribe_vendor(self, subscriber: Subscriber):
+        if subscriber.vendor_id is not None:
+            subs = self._vendor_subs.get(subscriber.vendor_id)
+            if subs is not None:
+                subs.discard(subscriber)
+                if not subs:
+                    del self._vendor_subs[subscriber.vendor_id]
+            subscriber.vendor_id = None
+
+    def disconnect(self, subscriber: Subscriber):
+        if subscriber.closed:
+            return
+        subscriber.closed = True
+        subscriber.wake.set()
+        self.unsubscribe_products(subscriber, list(subscriber.products))
+        self.unsubscribe_vendor(subscriber)
+        self._subscribers.discard(subscriber)
+
+    # ---------- publisher ----------
+
+    def _ingest(self, stock: dict, orders: list):
+        self._in_stock.update(stock)
+        self._in_orders.extend(orders)
+
+    async def _yield(self, slice_started: float) -> float:
+        """Lets other tasks run between fan-out slices; returns when the next slice starts."""
+        self.max_slice_ms = max(self.max_slice_ms, (time.perf_counter() - slice_started) * 1000)
+        await asyncio.sleep(0)
+        return time.perf_counter()
+
+    async def _fan_out(self):
+        stock, orders = self._in_stock, self._in_orders
+        if not stock and not orders:
+            return
+        self._in_stock, self._in_orders = {}, []
+        started = slice_started = time.perf_counter()
+        budget = REALTIME_FANOUT_SLICE
+        # Each writer is woken once per tick however many of its channels changed
+        dirty = set()
+        for product_id, qty in stock.items():
+            subs = self._product_subs.get(product_id)
+            if subs:
+                fragment = f'{{"product_id":{product_id},"stock_qty":{qty}}}'
+                for subscriber in subs:
+                    subscriber.stock[product_id] = fragment
+                    if subscriber.awaiting_snapshot:
+                        subscriber.awaiting_snapshot.discard(product_id)
+                dirty.update(subs)
+                self.fanned_out += len(subs)
+                budget -= len(subs)
+                if budget <= 0:
+                    budget = REALTIME_FANOUT_SLICE
+                    slice_started = await self._yield(slice_started)
+        for vendor_id, order in orders:
+            subs = self._vendor_subs.get(vendor_id)
+            if subs:
+                frame = json.dumps({"type": "order", "vendor_id": vendor_id, "order": order}, default=str)
+                for subscriber in subs:
+                    subscriber.push_order(frame)
+                dirty.update(subs)
+                self.fanned_out += len(subs)
+                budget -= len(subs)
+                if budget <= 0:
+                    budget = REALTIME_FANOUT_SLICE
+                    slice_started = await self._yield(slice_started)
+        # A woken writer runs its send before the loop next polls timers and sockets,
+        # and a send costs about ten deliveries: wake-ups are spread that much thinner
+        wake_slice = max(1, REALTIME_FANOUT_SLICE // 10)
+        for i, subscriber in enumerate(dirty, 1):
+            subscriber.wake.set()
+            if i % wake_slice == 0:
+                slice_started = await self._yield(slice_started)
+        self.max_slice_ms = max(self.max_slice_ms, (time.perf_counter() - slice_started) * 1000)
+        self.last_fanout_ms = (time.perf_counter() - started) * 1000
+        self.max_fanout_ms = max(self.max_fanout_ms, self.last_fanout_ms)
+
+    async def _flush_outbound(self):
+        with self._lock:
+            stock, orders = self._out_stock, self._out_orders
+            if not stock and not orders:
+                return
+            self._out_stock, self._out_orders = {}, []
+        if self._redis is not None:
+            payload = json.dumps({"stock": stock, "orders": orders}, default=str)
+            try:
+                await self._redis.publish(REALTIME_CHANNEL, payload)
+                return
+            except Exception as e:
+                print(f"[REALTIME] Redis publish failed, delivering to local subscribers only: {e}")
+        self._ingest(stock, orders)
+
+    async def _listen(self):
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(REALTIME_CHANNEL)
+        while True:
+            try:
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    data = json.loads(message["data"])
+                    # JSON object keys are strings
+                    self._ingest({int(k): v for k, v in data.get("stock", {}).items()},
+                                 [tuple(o) for o in data.get("orders", [])])
+            except asyncio.CancelledError:
+                await pubsub.close()
+                raise
+            except Exception as e:
+                print(f"[REALTIME] Redis subscription error, resubscribing: {e}")
+                await asyncio.sleep(1)
+                pubsub = self._redis.pubsub()
+                await pubsub.subscribe(REALTIME_CHANNEL)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            self.ticks += 1
+            try:
+                await self._flush_outbound()
+                await self._fan_out()
+            except Exception as e:
+                print(f"[REALTIME] Tick failed: {e}")
+
+    async def start(self):
+        """Starts the publisher (and Redis listener) on the running loop; idempotent."""
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        if self.backend == "redis" and self._redis is None:
+            try:
+                import redis.asyncio as aioredis
+
+                self._redis = aioredis.Redis.from_url(REDIS_URL, decode_responses=True)
+                await self._redis.ping()
+                self._listener = self._loop.create_task(self._listen())
+            except Exception as e:
+                print(f"[REALTIME] Redis unavailable, fanning out in this process only: {e}")
+                self._redis = None
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        for task in (self._task, self._listener):
+            if task is not None:
+                task.cancel()
+        self._task = self._listener = None
+        for subscriber in list(self._subscribers):
+            self.disconnect(subscriber)
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+    def stats(self) -> dict:
+        return {
+            "backend": "redis" if self._redis is not None else "memory",
+            "running": self.running,
+            "subscribers": len(self._subscribers),
+            "product_channels": len(self._product_subs),
+            "vendor_channels": len(self._vendor_subs),
+            "ticks": self.ticks,
+            "published_stock": self.published_stock,
+            "published_orders": self.published_orders,
+            "dropped_not_running": self.dropped,
+            "fanned_out": self.fanned_out,
+            "slow_disconnects": self.slow_disconnects,
+            "last_fanout_ms": round(self.last_fanout_ms, 3),
+            "max_fanout_ms": round(self.max_fanout_ms, 3),
+            "max_slice_ms": round(self.max_slice_ms, 3),
+        }
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_realtime_hub() -> RealtimeHub:
+    global _hub
+    if _hub is None:
+        with _hub_lock:
+            if _hub is None:
+                _hub = RealtimeHub()
+    return _hub
@@ -0,0 +1,398 @@
+"""
+Side effects of a registration (PDF invoice, confirmation email, WhatsApp
+message), run off the /register request path.
+
+/register only waits for the Supabase insert and one insert of the step
+rows below, then returns a registration id. The invoice and the WhatsApp
+message start at once and run concurrently. The email starts when the
+invoice is done, so it can attach it; if the invoice gave up, the email
+goes out without it.
+
+Each step's status, attempts and last error live in registration_steps,
+so GET /registrations/{id} answers from any worker. A failed step is
+retried with exponential backoff up to REGISTRATION_STEP_ATTEMPTS times.
+A step that can't apply (credentials not configured) is marked skipped
+and not retried.
+
+Retry timers and the local queue die with the process, and so does a step
+that was running. A sweeper thread resubmits steps left unfinished for
+REGISTRATION_STEP_TIMEOUT seconds, using the user saved with the rows.
+
+REGISTRATION_PIPELINE_MODE=local runs steps on an in-process thread
+pool. With celery, each step is a `registration.step` task on the
+`registration` queue (see celery_worker.py). Either way the invoice PDF
+reaches the email step through its step row (`output`), not a file.
+"""
+import os
+import json
+import uuid
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import insert, select, update
+
+from models import RegistrationStep
+
+REGISTRATION_PIPELINE_MODE = os.getenv("REGISTRATION_PIPELINE_MODE", "local")  # local | celery
+REGISTRATION_PIPELINE_WORKERS = int(os.getenv("REGISTRATION_PIPELINE_WORKERS", "8"))
+REGISTRATION_STEP_ATTEMPTS = int(os.getenv("REGISTRATION_STEP_ATTEMPTS", "4"))
+# Retry n waits REGISTRATION_RETRY_BACKOFF * 2^(n-1) seconds
+REGISTRATION_RETRY_BACKOFF = float(os.getenv("REGISTRATION_RETRY_BACKOFF", "2"))
+# A step untouched this long is taken to be lost with a worker and is resubmitted
+REGISTRATION_STEP_TIMEOUT = float(os.getenv("REGISTRATION_STEP_TIMEOUT", "600"))
+REGISTRATION_SWEEP_INTERVAL = float(os.getenv("REGISTRATION_SWEEP_INTERVAL", "60"))
+
+# Steps that must have finished (succeeded or given up) before a step starts
+AFTER = {"email": ("invoice",)}
+TERMINAL = ("succeeded", "failed", "skipped")
+
+
+class SkipStep(Exception):
+    """The step does not apply (e.g. credentials not configured); it is not retried."""
+
+
+def step_invoice(registration_id: str, user: dict) -> bytes:
+    from database import generate_invoice_pdf
+
+    # Returned bytes are stored in the step's `output` for the email step
+    try:
+        return generate_invoice_pdf(user["name"], user.get("payment_id"))
+    except ValueError as e:
+        # Text the PDF fonts can't show fails the same way every time; the email goes without it
+        raise SkipStep(str(e))
+
+
+def step_email(registration_id: str, user: dict, invoice: bytes = None) -> str:
+    from database import send_email_via_gmail
+
+    status = send_email_via_gmail(
+        user["email"],
+        "Action Confirmed & Your Invoice! 🚀",
+        f"<strong>Hi {user['name']}, your action was successful! Payment ID: {user.get('payment_id')}</strong><p>Please find your official invoice attached to this email.</p><p>Welcome to the framework.</p>",
+        attachment_data=invoice,
+        attachment_name="Invoice.pdf" if invoice else None,
+    )
+    if status == "credentials_missing":
+        raise SkipStep(status)
+    if status != "success":
+        raise RuntimeError(status)
+    return "sent with invoice" if invoice else "sent without invoice"
+
+
+def step_whatsapp(registration_id: str, user: dict) -> str:
+    from database import send_whatsapp_message
+
+    sid = send_whatsapp_message(
+        user["phone"],
+        f"Hello {user['name']}! Your transaction was successful. Welcome to the SaaS Starter Kit! 🚀",
+    )
+    if sid is None:
+        raise SkipStep("credentials_missing")
+    return sid
+
+
+STEPS = {"invoice": step_invoice, "email": step_email, "whatsapp": step_whatsapp}
+
+
+class RegistrationPipeline:
+    """
+    Runs STEPS for each registration. A step is called with the registration
+    id and the user, plus the output of each step it waits on (AFTER) as a
+    keyword argument, e.g. step_email(..., invoice=<PDF bytes or None>).
+    """
+
+    def __init__(self, session_factory=None, steps: dict = None, mode: str = REGISTRATION_PIPELINE_MODE,
+                 workers: int = REGISTRATION_PIPELINE_WORKERS, attempts: int = REGISTRATION_STEP_ATTEMPTS,
+                 backoff: float = REGISTRATION_RETRY_BACKOFF, timeout: float = REGISTRATION_STEP_TIMEOUT):
+        if session_factory is None:
+            from config_db import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+        self.steps = steps or STEPS
+        self.mode = mode
+        self.workers = workers
+        self.attempts = attempts
+        self.backoff = backoff
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._stop = threading.Event()
+        self.started = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.skipped = 0
+        self.retries = 0
+        self.resumed = 0
+
+    def _count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def start(self, user: dict, registration_id: str = None) -> str:
+        """
+        Records the steps of a new registration and starts those that don't
+        wait on another step. `user` needs name, email, phone and payment_id.
+        """
+        registration_id = registration_id or uuid.uuid4().hex
+        now = datetime.datetime.utcnow()
+        payload = json.dumps(user, default=str)
+        with self.session_factory() as db:
+            db.execute(insert(RegistrationStep), [
+                {"registration_id": registration_id, "step": step, "created_at": now, "updated_at": now,
+                 "status": "pending" if AFTER.get(step) else "queued", "attempts": 0, "payload": payload}
+                for step in self.steps
+            ])
+            db.commit()
+        self._count("started")
+        for step in self.steps:
+            if not AFTER.get(step):
+                self._submit(registration_id, step, user)
+        return registration_id
+
+    # ---------- execution ----------
+
+    def _submit(self, registration_id: str, step: str, user: dict, delay: float = 0.0):
+        if self.mode == "celery":
+            from celery_worker import celery_app
+            celery_app.send_task("registration.step", args=[registration_id, step, user], queue="registration",
+                                 countdown=delay or None)
+            return
+        if delay:
+            timer = threading.Timer(delay, self._submit, args=(registration_id, step, user))
+            timer.daemon = True
+            timer.start()
+            return
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="registration")
+        self._executor.submit(self.run_step, registration_id, step, user)
+
+    def run_step(self, registration_id: str, step: str, user: dict):
+        """One attempt at a step. Schedules the retry, or on a final outcome starts the steps waiting on it."""
+        attempt = self._begin(registration_id, step)
+        try:
+            inputs = self._outputs(registration_id, AFTER.get(step, ()))
+            result = self.steps[step](registration_id, user, **inputs)
+        except SkipStep as e:
+            self._finish(registration_id, step, user, "skipped", error=str(e))
+        except Exception as e:
+            if attempt < self.attempts:
+                delay = self.backoff * 2 ** (attempt - 1)
+                print(f"[REGISTRATION] {step} for {registration_id} failed (attempt {attempt}), retrying in {delay:.0f}s: {e}")
+                self._update(registration_id, step, status="retrying", last_error=str(e)[:500])
+                self._count("retries")
+                self._submit(registration_id, step, user, delay)
+            else:
+                print(f"[REGISTRATION] {step} for {registration_id} failed after {attempt} attempts: {e}")
+                self._finish(registration_id, step, user, "failed", error=str(e))
+        else:
+            self._finish(registration_id, step, user, "succeeded", result=result)
+
+    def _update(self, registration_id: str, step: str, **values):
+        values["updated_at"] = datetime.datetime.utcnow()
+        with self.session_factory() as db:
+            db.execute(
+                update(RegistrationStep)
+                .where(RegistrationStep.registration_id == registration_id, RegistrationStep.step == step)
+                .values(**values)
+            )
+            db.commit()
+
+    def _outputs(self, registration_id: str, steps) -> dict:
+        if not steps:
+            return {}
+        with self.session_factory() as db:
+            return dict(db.execute(
+                select(RegistrationStep.step, RegistrationStep.output)
+                .where(RegistrationStep.registration_id == registration_id, RegistrationStep.step.in_(steps))
+            ).all())
+
+    def _begin(self, registration_id: str, step: str) -> int:
+        with self.session_factory() as db:
+            db.execute(
+                update(RegistrationStep)
+                .where(RegistrationStep.registration_id == registration_id, RegistrationStep.step == step)
+                .values(status="running", attempts=RegistrationStep.attempts + 1, updated_at=datetime.datetime.utcnow())
+            )
+            attempt = db.execute(
+                select(RegistrationStep.attempts)
+                .where(RegistrationStep.registration_id == registration_id, RegistrationStep.step == step)
+            ).scalar()
+            db.commit()
+        return attempt
+
+    def _finish(self, registration_id: str, step: str, user: dict, status: str, result=None, error: str = None):
+        now = datetime.datetime.utcnow()
+        output = None
+        if isinstance(result, bytes):
+            output, result = result, f"{len(result)} bytes"
+        self._update(registration_id, step, status=status, finished_at=now, output=output,
+                     result=None if result is None else str(result)[:500],
+                     last_error=None if error is None else error[:500])
+        self._count(status)
+        if AFTER.get(step):
+            # The outputs it was given (the invoice PDF) are not needed any more
+            try:
+                with self.session_factory() as db:
+                    db.execute(
+                        update(RegistrationStep)
+                        .where(RegistrationStep.registration_id == registration_id, RegistrationStep.step.in_(AFTER[step]))
+                        .values(output=None)
+                    )
+                    db.commit()
+            except Exception as e:
+                print(f"[REGISTRATION] Cleanup after {step} for {registration_id} failed: {e}")
+
+        for dependent, after in AFTER.items():
+            if step not in after or dependent not in self.steps:
+                continue
+            with self.session_factory() as db:
+                statuses = dict(db.execute(
+                    select(RegistrationStep.step, RegistrationStep.status)
+                    .where(RegistrationStep.registration_id == registration_id, RegistrationStep.step.in_(after))
+                ).all())
+                if not all(statuses.get(s) in TERMINAL for s in after):
+                    continue
+                # Only one finishing step may release the dependent
+                claimed = db.execute(
+                    update(RegistrationStep)
+                    .where(RegistrationStep.registration_id == registration_id, RegistrationStep.step == dependent,
+                           RegistrationStep.status == "pending")
+                    .values(status="queued", updated_at=now)
+                ).rowcount
+                db.commit()
+            if claimed:
+                self._submit(registration_id, dependent, user)
+
+    # ---------- recovery ----------
+
+    def resume_stale(self) -> int:
+        """
+        Resubmits steps left unfinished for `timeout` seconds: a retry timer or
+        queued attempt that died with its worker, a step whose worker died
+        mid-run, or a waiting step whose release was lost. With celery the
+        broker keeps queued tasks, so only running steps are taken. Each row
+        is claimed with a conditional update, so concurrent sweeps don't run
+        a step twice. Returns the number of steps resubmitted.
+        """
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.timeout)
+        statuses = ("running",) if self.mode == "celery" else ("pending", "queued", "running", "retrying")
+        with self.session_factory() as db:
+            rows = db.execute(
+                select(RegistrationStep.registration_id, RegistrationStep.step, RegistrationStep.status,
+                       RegistrationStep.updated_at, RegistrationStep.payload)
+                .where(RegistrationStep.status.in_(statuses), RegistrationStep.updated_at < cutoff,
+                       RegistrationStep.payload.isnot(None))
+            ).all()
+        resumed = 0
+        for registration_id, step, status, updated_at, payload in rows:
+            if step not in self.steps:
+                continue
+            with self.session_factory() as db:
+                if status == "pending":
+                    after = AFTER.get(step, ())
+                    finished = db.execute(
+                        select(RegistrationStep.step)
+                        .where(RegistrationStep.registration_id == registration_id, RegistrationStep.step.in_(after),
+                               RegistrationStep.status.in_(TERMINAL))
+                    ).scalars().all()
+                    if len(finished) < len(after):
+                        continue  # still waiting on a step that will release it
+                claimed = db.execute(
+                    update(RegistrationStep)
+                    .where(RegistrationStep.registration_id == registration_id, RegistrationStep.step == step,
+                           RegistrationStep.status == status, RegistrationStep.updated_at == updated_at)
+                    .values(status="queued", updated_at=datetime.datetime.utcnow())
+                ).rowcount
+                db.commit()
+            if claimed:
+                self._submit(registration_id, step, json.loads(payload))
+                resumed += 1
+        if resumed:
+            self.resumed += resumed
+            print(f"[REGISTRATION] Resubmitted {resumed} steps left unfinished for over {self.timeout:g}s")
+        return resumed
+
+    def _sweep(self, interval: float):
+        while not self._stop.is_set():
+            try:
+                self.resume_stale()
+            except Exception as e:
+                print(f"[REGISTRATION] Sweep for unfinished steps failed: {e}")
+            self._stop.wait(interval)
+
+    def start_sweeper(self, interval: float = REGISTRATION_SWEEP_INTERVAL):
+        """Sweeps now (picking up what the last run of this app left behind) and every `interval` seconds."""
+        if self._sweeper is None:
+            self._stop.clear()
+            self._sweeper = threading.Thread(target=self._sweep, args=(interval,), name="registration-sweeper",
+                                             daemon=True)
+            self._sweeper.start()
+
+    # ---------- reporting ----------
+
+    def status(self, registration_id: str):
+        """Per-step status of a registration, or None if it is unknown."""
+        with self.session_factory() as db:
+            rows = db.execute(
+                select(RegistrationStep).where(RegistrationStep.registration_id == registration_id)
+            ).scalars().all()
+        if not rows:
+            return None
+        steps = {
+            row.step: {
+                "status": row.status,
+                "attempts": row.attempts,
+                "result": row.result,
+                "last_error": row.last_error,
+                "updated_at": row.updated_at.isoformat() if row.updated_at else None,
+                "finished_at": row.finished_at.isoformat() if row.finished_at else None,
+            }
+            for row in rows
+        }
+        statuses = {s["status"] for s in steps.values()}
+        if not statuses <= set(TERMINAL):
+            overall = "in_progress"
+        elif "failed" in statuses:
+            overall = "completed_with_errors"
+        else:
+            overall = "completed"
+        return {"registration_id": registration_id, "status": overall, "steps": steps}
+
+    def stats(self) -> dict:
+        executor = self._executor
+        return {
+            "mode": self.mode,
+            "registrations": self.started,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "retries": self.retries,
+            "resumed": self.resumed,
+            "queued_locally": executor._work_queue.qsize() if executor is not None else 0,
+        }
+
+    def shutdown(self, wait: bool = True):
+        self._stop.set()
+        if self._sweeper is not None:
+            self._sweeper.join(5)
+            self._sweeper = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_registration_pipeline() -> RegistrationPipeline:
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = RegistrationPipeline()
+    return _pipeline
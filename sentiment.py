@@ -0,0 +1,198 @@
+import os
+import re
+import time
+import zlib
+import queue
+import threading
+
+import numpy as np
+
+SENTIMENT_CONFIDENCE_THRESHOLD = float(os.getenv("SENTIMENT_CONFIDENCE_THRESHOLD", "0.6"))
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "64"))
+SENTIMENT_BATCH_WAIT_MS = float(os.getenv("SENTIMENT_BATCH_WAIT_MS", "50"))
+# Items waiting for a batch; submit() refuses more rather than queueing without bound
+SENTIMENT_QUEUE_SIZE = int(os.getenv("SENTIMENT_QUEUE_SIZE", "10000"))
+
+N_FEATURES = 2 ** 18
+LABELS = ("Negative", "Neutral", "Positive")
+# |polarity| below this is Neutral
+POLARITY_MARGIN = 0.15
+
+LEXICON = {
+    # positive
+    "good": 1.0, "great": 2.0, "excellent": 2.5, "amazing": 2.5, "awesome": 2.5, "love": 2.0, "loved": 2.0,
+    "loves": 2.0, "perfect": 2.5, "fantastic": 2.5, "wonderful": 2.5, "best": 2.0, "nice": 1.0, "happy": 1.5,
+    "satisfied": 1.5, "recommend": 1.5, "recommended": 1.5, "worth": 1.0, "fast": 1.0, "quick": 1.0,
+    "comfortable": 1.5, "beautiful": 2.0, "reliable": 1.5, "sturdy": 1.5, "durable": 1.5, "impressed": 2.0,
+    "pleased": 1.5, "superb": 2.5, "brilliant": 2.5, "smooth": 1.0, "easy": 1.0, "helpful": 1.5,
+    "quality": 0.5, "value": 0.5, "fits": 0.5, "works": 0.75, "working": 0.5, "glad": 1.5, "exceeded": 2.0,
+    "flawless": 2.5, "delighted": 2.5, "enjoy": 1.5, "enjoyed": 1.5, "favorite": 2.0, "solid": 1.0,
+    "affordable": 1.0, "cheap": -0.25, "thanks": 1.0, "fresh": 1.0, "premium": 1.0, "fine": 0.5, "ok": 0.25,
+    "okay": 0.25,
+    # negative
+    "bad": -1.5, "terrible": -2.5, "awful": -2.5, "horrible": -2.5, "worst": -2.5, "poor": -1.5, "broken": -2.0,
+    "broke": -2.0, "defective": -2.5, "damaged": -2.0, "hate": -2.0, "hated": -2.0, "disappointed": -2.0,
+    "disappointing": -2.0, "useless": -2.5, "waste": -2.0, "refund": -1.5, "return": -1.0, "returned": -1.5,
+    "slow": -1.0, "late": -1.0, "delayed": -1.0, "cheaply": -1.5, "flimsy": -1.5, "fake": -2.0, "scam": -2.5,
+    "missing": -1.5, "wrong": -1.5, "rude": -2.0, "dirty": -1.5, "smell": -1.0, "smells": -1.0, "stopped": -1.5,
+    "fault": -1.5, "faulty": -2.0, "leaks": -1.5, "leaking": -1.5, "overpriced": -1.5, "expensive": -0.75,
+    "uncomfortable": -1.5, "problem": -1.0, "problems": -1.0, "issue": -1.0, "issues": -1.0,
+    "unhappy": -2.0, "annoying": -1.5, "fell": -0.75, "cracked": -2.0, "scratched": -1.5, "unusable": -2.5,
+    "avoid": -2.0, "regret": -2.0, "garbage": -2.5, "junk": -2.5, "mediocre": -1.0, "meh": -0.75,
+}
+NEGATORS = {"not", "no", "never", "dont", "don't", "didnt", "didn't", "isnt", "isn't", "wasnt", "wasn't",
+            "doesnt", "doesn't", "cant", "can't", "wont", "won't", "hardly", "without"}
+# Negation flips (and damps) the polarity of the following words
+NEGATION_WEIGHT = -0.75
+
+_TOKEN = re.compile(r"[a-z']+|[.!?;,]")
+_CLAUSE_END = {".", "!", "?", ";", ","}
+
+
+def _bucket(feature: str) -> int:
+    # crc32 instead of hash(): stable across processes, so weights need no persisting
+    return zlib.crc32(feature.encode("utf-8")) % N_FEATURES
+
+
+def tokenize(text: str) -> list:
+    """Lower-cased word features; words in a negation scope get a NOT_ prefix."""
+    features = []
+    negated = False
+    for tok in _TOKEN.findall(text.lower()):
+        if tok in _CLAUSE_END:
+            negated = False
+            continue
+        if tok in NEGATORS:
+            negated = True
+            continue
+        features.append("NOT_" + tok if negated else tok)
+    return features
+
+
+class SentimentClassifier:
+    """
+    Lexicon-weighted linear model over hashed word features.
+
+    A batch is turned into flat (doc, feature) index arrays once and scored
+    with a single gather + bincount, so cost is linear in total tokens with
+    no Python work per feature beyond hashing. Confidence reflects how much
+    sentiment evidence a review has and how one-sided it is; callers send
+    anything under their threshold to the LLM.
+    """
+
+    def __init__(self, lexicon: dict = None):
+        self.weights = np.zeros(N_FEATURES, dtype=np.float32)
+        self._bucket_cache = {}
+        for word, score in (lexicon or LEXICON).items():
+            self.weights[_bucket(word)] += score
+            self.weights[_bucket("NOT_" + word)] += score * NEGATION_WEIGHT
+
+    def _features(self, text: str) -> list:
+        cache = self._bucket_cache
+        out = []
+        for feature in tokenize(text):
+            idx = cache.get(feature)
+            if idx is None:
+                idx = _bucket(feature)
+                if len(cache) < 200000:
+                    cache[feature] = idx
+            out.append(idx)
+        return out
+
+    def score_batch(self, texts: list):
+        """Returns (polarity, evidence) arrays: polarity in (-1, 1), evidence = sentiment-bearing tokens."""
+        doc_ids, feat_ids = [], []
+        for i, text in enumerate(texts):
+            feats = self._features(text)
+            feat_ids.extend(feats)
+            doc_ids.extend([i] * len(feats))
+        n = len(texts)
+        if not feat_ids:
+            return np.zeros(n), np.zeros(n)
+
+        doc_ids = np.asarray(doc_ids, dtype=np.int64)
+        w = self.weights[np.asarray(feat_ids, dtype=np.int64)]
+        score = np.bincount(doc_ids, weights=w, minlength=n)
+        magnitude = np.bincount(doc_ids, weights=np.abs(w), minlength=n)
+        evidence = np.bincount(doc_ids, weights=(w != 0), minlength=n)
+        polarity = score / (magnitude + 1.0)
+        return polarity, evidence
+
+    def classify_batch(self, texts: list) -> list:
+        """[(label, confidence), ...] for each text."""
+        polarity, evidence = self.score_batch(texts)
+        strength = np.minimum(1.0, np.abs(polarity)) * np.minimum(1.0, evidence / 2.0)
+        labels = np.where(polarity > POLARITY_MARGIN, 2, np.where(polarity < -POLARITY_MARGIN, 0, 1))
+        confidence = np.where(
+            labels == 1,
+            # Neutral: no evidence is a weak neutral, conflicting evidence is weaker still
+            np.where(evidence == 0, 0.55, 0.4),
+            0.5 + 0.5 * strength,
+        )
+        return [(LABELS[l], round(float(c), 3)) for l, c in zip(labels, confidence)]
+
+    def classify(self, text: str):
+        return self.classify_batch([text])[0]
+
+
+class MicroBatcher:
+    """
+    Collects submitted items on a background thread and hands them to
+    `handler(batch)` once `max_batch` items are waiting or `max_wait_ms`
+    has passed since the first one, whichever comes first.
+    """
+
+    def __init__(self, handler, max_batch: int = SENTIMENT_BATCH_SIZE, max_wait_ms: float = SENTIMENT_BATCH_WAIT_MS,
+                 max_queue: int = SENTIMENT_QUEUE_SIZE):
+        self.handler = handler
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue(max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.rejected = 0
+
+    def submit(self, item) -> bool:
+        """Queues `item`; False if the queue is full and the caller must handle it itself."""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.rejected += 1
+            return False
+        return True
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                self.handler(batch)
+            except Exception as e:
+                print(f"[BATCHER] Batch handler failed: {e}")
+
+
+_classifier = None
+
+
+def get_sentiment_classifier() -> SentimentClassifier:
+    global _classifier
+    if _classifier is None:
+        _classifier = SentimentClassifier()
+    return _classifier
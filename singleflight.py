@@ -0,0 +1,119 @@
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.async_waiters = []  # (loop, future) pairs to wake on completion
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.done.set()
+        for loop, future in self.async_waiters:
+            try:
+                loop.call_soon_threadsafe(self._resolve, future)
+            except RuntimeError:
+                pass  # waiter's loop already closed
+
+    def _resolve(self, future):
+        if future.done():
+            return
+        if self.error is not None:
+            future.set_exception(self.error)
+        else:
+            future.set_result(self.result)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller (leader)
+    runs the work, everyone arriving while it is in flight waits for and
+    receives the same result or exception. Works for threads (`do`) and
+    asyncio tasks (`ado`), and a thread and a task can share one flight.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _join(self, key):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            self.leaders += 1
+            return call, True
+
+    def _join_async(self, key, loop):
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                future = loop.create_future()
+                call.async_waiters.append((loop, future))
+                return call, future
+            call = _Call()
+            self._calls[key] = call
+            self.leaders += 1
+            return call, None
+
+    def _complete(self, key, call, result=None, error=None):
+        with self._lock:
+            self._calls.pop(key, None)
+            call.finish(result, error)
+
+    def do(self, key, fn, *args, **kwargs):
+        call, leader = self._join(key)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            self._complete(key, call, error=e)
+            raise
+        self._complete(key, call, result=result)
+        return result
+
+    async def ado(self, key, coro_fn, *args, **kwargs):
+        call, future = self._join_async(key, asyncio.get_running_loop())
+        if future is not None:
+            return await future
+
+        # Run the work as its own task so that cancelling the leader (e.g. its
+        # client disconnected) does not take the result away from followers
+        task = asyncio.ensure_future(coro_fn(*args, **kwargs))
+
+        def _on_done(t):
+            if t.cancelled():
+                self._complete(key, call, error=RuntimeError("coalesced call was cancelled"))
+            elif t.exception() is not None:
+                self._complete(key, call, error=t.exception())
+            else:
+                self._complete(key, call, result=t.result())
+
+        task.add_done_callback(_on_done)
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = len(self._calls)
+        total = self.leaders + self.coalesced
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": in_flight,
+            "coalesce_rate": round(self.coalesced / total, 4) if total else 0.0,
+        }
@@ -0,0 +1,362 @@
+"""
+Pooled SMTP sender: long-lived authenticated sessions instead of a new
+connection, STARTTLS handshake and login for every email.
+
+Up to SMTP_POOL_SIZE sessions are kept open and shared by all threads.
+A session idle for more than SMTP_HEALTH_CHECK_AFTER seconds gets a NOOP
+before it is reused. Sessions are retired after SMTP_SESSION_MESSAGES
+messages or SMTP_SESSION_MAX_AGE seconds, which keeps them under provider
+per-connection limits and away from their idle timeouts. If a connection
+drops mid-send, the session is discarded and the message retried on a
+fresh one. A message the server rejects is reported, not retried.
+
+send_many() sends a batch over one session. When the server advertises
+PIPELINING (RFC 2920), as Gmail does, each message's MAIL FROM, RCPT TO
+and DATA commands go out in one write. That is one round trip where
+there would otherwise be 2 + recipients.
+
+All transports to the same host share a token bucket (SMTP_RATE messages
+per second, bursts of SMTP_BURST), so onboarding bursts stay under the
+provider's throttling threshold.
+
+Local testing: point SMTP_HOST/SMTP_PORT at an aiosmtpd server with
+SMTP_STARTTLS=0 (see benchmarks/bench_smtp_transport.py).
+"""
+import io
+import os
+import re
+import ssl
+import copy
+import time
+import smtplib
+import threading
+from collections import deque
+from email.generator import BytesGenerator
+from email.utils import getaddresses
+
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "1") == "1"
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "3"))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "15"))
+SMTP_HEALTH_CHECK_AFTER = float(os.getenv("SMTP_HEALTH_CHECK_AFTER", "30"))
+SMTP_SESSION_MESSAGES = int(os.getenv("SMTP_SESSION_MESSAGES", "100"))
+SMTP_SESSION_MAX_AGE = float(os.getenv("SMTP_SESSION_MAX_AGE", "240"))
+SMTP_RATE = float(os.getenv("SMTP_RATE", "5"))
+SMTP_BURST = int(os.getenv("SMTP_BURST", "20"))
+SMTP_RETRIES = int(os.getenv("SMTP_RETRIES", "2"))  # fresh-session retries per message after a dropped connection
+SMTP_PIPELINING = os.getenv("SMTP_PIPELINING", "1") == "1"
+
+
+class RateLimiter:
+    """Token bucket: `rate` tokens per second, at most `burst` saved up."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.waited = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+                self.waited += wait
+            time.sleep(wait)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(host: str, rate: float = SMTP_RATE, burst: int = SMTP_BURST) -> RateLimiter:
+    """One bucket per provider host, shared by every transport in the process."""
+    with _limiters_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            limiter = _limiters[host] = RateLimiter(rate, burst)
+        return limiter
+
+
+def _is_connection_error(e: Exception) -> bool:
+    """True if the session is unusable (retry on a fresh one), False if the server rejected this message."""
+    if isinstance(e, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(e, smtplib.SMTPResponseException):
+        return e.smtp_code == 421  # service closing transmission channel
+    return isinstance(e, OSError) and not isinstance(e, smtplib.SMTPException)
+
+
+def _envelope(msg):
+    """Sender, recipients and wire bytes of a message, as SMTP.send_message derives them."""
+    from_addr = getaddresses([msg["Sender"] or msg["From"]])[0][1]
+    to_addrs = [addr for _, addr in getaddresses(msg.get_all("To", []) + msg.get_all("Cc", []) + msg.get_all("Bcc", []))]
+    msg_copy = copy.copy(msg)
+    del msg_copy["Bcc"]
+    del msg_copy["Resent-Bcc"]
+    buffer = io.BytesIO()
+    BytesGenerator(buffer).flatten(msg_copy, linesep="\r\n")
+    return from_addr, to_addrs, buffer.getvalue()
+
+
+def _send_pipelined(server: smtplib.SMTP, msg) -> dict:
+    """
+    MAIL FROM, RCPT TO... and DATA in one write, then the replies in order
+    (RFC 2920). Returns the refused recipients, like SMTP.sendmail.
+    """
+    from_addr, to_addrs, data = _envelope(msg)
+    if not data.isascii() or not (from_addr + "".join(to_addrs)).isascii():
+        # Needs SMTPUTF8 / 8BITMIME negotiation; leave that to smtplib
+        return server.send_message(msg)
+    server.send(f"MAIL FROM:<{from_addr}>\r\n" + "".join(f"RCPT TO:<{a}>\r\n" for a in to_addrs) + "DATA\r\n")
+    mail = server.getreply()
+    rcpts = [server.getreply() for _ in to_addrs]
+    data_reply = server.getreply()
+    refused = {a: reply for a, reply in zip(to_addrs, rcpts) if reply[0] not in (250, 251)}
+
+    if data_reply[0] != 354:
+        server.rset()
+        if mail[0] != 250:
+            raise smtplib.SMTPSenderRefused(mail[0], mail[1], from_addr)
+        if len(refused) == len(to_addrs):
+            raise smtplib.SMTPRecipientsRefused(refused)
+        raise smtplib.SMTPDataError(*data_reply)
+    if mail[0] != 250 or len(refused) == len(to_addrs):
+        # DATA was accepted regardless; end it empty and give up on the message
+        server.send(".\r\n")
+        server.getreply()
+        server.rset()
+        if mail[0] != 250:
+            raise smtplib.SMTPSenderRefused(mail[0], mail[1], from_addr)
+        raise smtplib.SMTPRecipientsRefused(refused)
+
+    data = re.sub(rb"(?:\r\n|\n|\r(?!\n))", b"\r\n", data)
+    data = re.sub(rb"(?m)^\.", b"..", data)
+    if not data.endswith(b"\r\n"):
+        data += b"\r\n"
+    server.send(data + b".\r\n")
+    code, response = server.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, response)
+    return refused
+
+
+class _Session:
+    __slots__ = ("server", "created", "last_used", "sent", "pipelining")
+
+    def __init__(self, server: smtplib.SMTP, pipelining: bool):
+        self.server = server
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.sent = 0
+        self.pipelining = pipelining
+
+
+class SMTPTransport:
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, username: str = None, password: str = None,
+                 starttls: bool = SMTP_STARTTLS, pool_size: int = SMTP_POOL_SIZE, timeout: float = SMTP_TIMEOUT,
+                 rate: float = SMTP_RATE, burst: int = SMTP_BURST, pipelining: bool = SMTP_PIPELINING,
+                 health_check_after: float = SMTP_HEALTH_CHECK_AFTER, session_messages: int = SMTP_SESSION_MESSAGES,
+                 session_max_age: float = SMTP_SESSION_MAX_AGE, retries: int = SMTP_RETRIES):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.pipelining = pipelining
+        self.health_check_after = health_check_after
+        self.session_messages = session_messages
+        self.session_max_age = session_max_age
+        self.retries = retries
+        self.limiter = get_rate_limiter(host, rate, burst)
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._idle = deque()  # most recently used on the right
+        self._lock = threading.Lock()
+        self.connects = 0
+        self.reconnects = 0
+        self.health_check_failures = 0
+        self.retired = 0
+        self.sent = 0
+        self.failed = 0
+        self.pipelined = 0
+
+    def _count(self, field: str, n: int = 1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + n)
+
+    # ---------- sessions ----------
+
+    def _connect(self) -> _Session:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            server.ehlo()
+            if self.starttls:
+                server.starttls(context=ssl.create_default_context())
+                server.ehlo()
+            if self.username:
+                server.login(self.username, self.password)
+        except Exception:
+            self._close(server)
+            raise
+        self._count("connects")
+        return _Session(server, self.pipelining and server.has_extn("pipelining"))
+
+    @staticmethod
+    def _close(server: smtplib.SMTP):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _usable(self, session: _Session) -> bool:
+        now = time.monotonic()
+        if session.sent >= self.session_messages or now - session.created > self.session_max_age:
+            self._count("retired")
+            self._close(session.server)
+            return False
+        if now - session.last_used > self.health_check_after:
+            try:
+                healthy = session.server.noop()[0] == 250
+            except Exception:
+                healthy = False
+            if not healthy:
+                self._count("health_check_failures")
+                session.server.close()
+                return False
+        return True
+
+    def _checkout(self) -> _Session:
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No SMTP session to {self.host} free within {self.timeout:.0f}s")
+        try:
+            while True:
+                with self._lock:
+                    session = self._idle.pop() if self._idle else None
+                if session is None:
+                    return self._connect()
+                if self._usable(session):
+                    return session
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _checkin(self, session: _Session, broken: bool = False):
+        if broken:
+            session.server.close()
+        else:
+            session.last_used = time.monotonic()
+            with self._lock:
+                self._idle.append(session)
+        self._slots.release()
+
+    # ---------- sending ----------
+
+    def _deliver(self, session: _Session, msg):
+        if session.pipelining:
+            refused = _send_pipelined(session.server, msg)
+            self._count("pipelined")
+        else:
+            refused = session.server.send_message(msg)
+        session.sent += 1
+        if refused:
+            print(f"[SMTP] Some recipients refused: {refused}")
+
+    def send_many(self, messages: list) -> list:
+        """
+        Sends email.message.Message objects over one pooled session.
+        Returns one entry per message: None if sent, else the exception.
+        """
+        results = [None] * len(messages)
+        session = None
+        i, attempts = 0, 0
+        try:
+            while i < len(messages):
+                if session is None:
+                    try:
+                        session = self._checkout()
+                    except Exception as e:
+                        # Can't reach the server at all: the rest fail the same way
+                        results[i:] = [e] * (len(messages) - i)
+                        self._count("failed", len(messages) - i)
+                        break
+                self.limiter.acquire()
+                try:
+                    self._deliver(session, messages[i])
+                except Exception as e:
+                    if _is_connection_error(e):
+                        self._checkin(session, broken=True)
+                        session = None
+                        if attempts < self.retries:
+                            attempts += 1
+                            self._count("reconnects")
+                            continue
+                    else:
+                        try:
+                            session.server.rset()
+                        except Exception:
+                            self._checkin(session, broken=True)
+                            session = None
+                    results[i] = e
+                    self._count("failed")
+                else:
+                    self._count("sent")
+                i, attempts = i + 1, 0
+                if session is not None and session.sent >= self.session_messages:
+                    # Retire it now rather than at the next checkout
+                    self._checkin(session)
+                    session = None
+        finally:
+            if session is not None:
+                self._checkin(session)
+        return results
+
+    def send(self, msg):
+        """Sends one message; raises the SMTP error if it could not be sent."""
+        error = self.send_many([msg])[0]
+        if error is not None:
+            raise error
+
+    def close(self):
+        with self._lock:
+            sessions, self._idle = list(self._idle), deque()
+        for session in sessions:
+            self._close(session.server)
+
+    def stats(self) -> dict:
+        return {
+            "host": self.host,
+            "idle_sessions": len(self._idle),
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "health_check_failures": self.health_check_failures,
+            "retired": self.retired,
+            "sent": self.sent,
+            "failed": self.failed,
+            "pipelined": self.pipelined,
+            "rate_limited_s": round(self.limiter.waited, 2),
+        }
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_smtp_transport() -> SMTPTransport:
+    """Shared transport logged in as EMAIL_USER / EMAIL_PASS."""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = SMTPTransport(username=os.getenv("EMAIL_USER"), password=os.getenv("EMAIL_PASS"))
+    return _transport
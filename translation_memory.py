@@ -0,0 +1,218 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from cache_backends import MemoryBackend, SQLiteBackend
+from singleflight import SingleFlight
+
+TRANSLATION_MEMORY_PATH = os.getenv("TRANSLATION_MEMORY_PATH", "translation_memory.db")
+TRANSLATION_MEMORY_MAX_ENTRIES = int(os.getenv("TRANSLATION_MEMORY_MAX_ENTRIES", "1000000"))
+TRANSLATION_FRONT_ENTRIES = int(os.getenv("TRANSLATION_FRONT_ENTRIES", "20000"))
+# Misses are sent to the model this many strings per prompt
+TRANSLATION_GROUP_SIZE = int(os.getenv("TRANSLATION_GROUP_SIZE", "20"))
+TRANSLATION_GROUP_WORKERS = int(os.getenv("TRANSLATION_GROUP_WORKERS", "2"))
+TRANSLATION_MODEL = os.getenv("TRANSLATION_MODEL", "phi3")
+
+_WHITESPACE = re.compile(r"\s+")
+_QUOTES = ' "\'\n`'
+
+
+def normalize_text(text: str) -> str:
+    return _WHITESPACE.sub(" ", text or "").strip()
+
+
+def _key(text: str, target_language: str) -> str:
+    material = f"{target_language.strip().lower()}\x1f{normalize_text(text)}"
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _single_prompt(text: str, target_language: str) -> list:
+    prompt = f"Translate the following UI text into {target_language} accurately and concisely. Return ONLY the translated text, no quotes or conversational filler: '{text}'"
+    return [
+        {"role": "system", "content": f"You are a professional localization expert. Translate directly into {target_language} without any extra explanation."},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def _group_prompt(group: dict, target_language: str) -> list:
+    return [
+        {"role": "system", "content": f"You are a professional localization expert. Translate UI strings into {target_language}. Reply with a JSON object only."},
+        {"role": "user", "content": (
+            f"Translate every value of this JSON object into {target_language}. Keep the keys unchanged, "
+            f"keep placeholders like {{name}} or %s as they are, and return the same keys with translated values:\n"
+            f"{json.dumps(group, ensure_ascii=False)}"
+        )},
+    ]
+
+
+class TranslationMemory:
+    """
+    Translations keyed by (normalized text, target language). An in-memory
+    LRU sits in front of a SQLite table that survives restarts; entries never
+    expire since a translated UI string does not go stale. Concurrent misses
+    for the same string (or the same group of strings) share one generation.
+    """
+
+    def __init__(self, path: str = TRANSLATION_MEMORY_PATH, front_entries: int = TRANSLATION_FRONT_ENTRIES,
+                 max_entries: int = TRANSLATION_MEMORY_MAX_ENTRIES):
+        self.front = MemoryBackend(max_entries=front_entries, ttl=0)
+        self.store = SQLiteBackend(path, max_entries=max_entries, ttl=0, table="translations")
+        self._lock = threading.Lock()
+        self._groups = ThreadPoolExecutor(max_workers=TRANSLATION_GROUP_WORKERS)
+        self._inflight = SingleFlight()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.llm_calls = 0
+
+    def _count(self, field: str, n: int = 1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + n)
+
+    def get(self, text: str, target_language: str):
+        key = _key(text, target_language)
+        value = self.front.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return value
+        value = self.store.get(key)
+        if value is not None:
+            self._count("disk_hits")
+            self.front.set(key, value)
+            return value
+        self._count("misses")
+        return None
+
+    def put(self, text: str, target_language: str, translation: str):
+        key = _key(text, target_language)
+        self.front.set(key, translation)
+        self.store.set(key, translation)
+
+    # ---------- translating ----------
+
+    def translate(self, text: str, target_language: str) -> str:
+        """Single string, served from memory when possible. Raises OllamaError on failure."""
+        cached = self.get(text, target_language)
+        if cached is not None:
+            return cached
+        return self._inflight.do(_key(text, target_language), self._generate, text, target_language)
+
+    def _generate(self, text: str, target_language: str) -> str:
+        from ai_service import chat_completion
+
+        # A flight that finished between our miss and joining may have stored it
+        cached = self.front.get(_key(text, target_language))
+        if cached is not None:
+            return cached
+        self._count("llm_calls")
+        # The translation memory is the cache here, so skip the generic LLM cache
+        translation = chat_completion(_single_prompt(normalize_text(text), target_language),
+                                      model=TRANSLATION_MODEL, use_cache=False).strip(_QUOTES)
+        self.put(text, target_language, translation)
+        return translation
+
+    def _translate_group(self, group: dict, target_language: str) -> dict:
+        # Identical batches (the same page opened by many users at once) share one generation.
+        # Results are keyed by position, so the flight key keeps the order.
+        material = "\x1f".join(_key(text, target_language) for text in group.values())
+        key = "group:" + hashlib.sha256(material.encode("utf-8")).hexdigest()
+        return self._inflight.do(key, self._generate_group, group, target_language)
+
+    def _generate_group(self, group: dict, target_language: str) -> dict:
+        from ai_service import chat_json
+
+        # Entries another flight stored since this batch looked them up
+        done = {}
+        for gid, text in group.items():
+            cached = self.front.get(_key(text, target_language))
+            if cached is not None:
+                done[gid] = cached
+        group = {gid: text for gid, text in group.items() if gid not in done}
+        if not group:
+            return done
+
+        self._count("llm_calls")
+        try:
+            reply = chat_json(_group_prompt(group, target_language), model=TRANSLATION_MODEL, use_cache=False)
+        except ValueError as e:
+            print(f"[TRANSLATE] Group reply was not a JSON object, translating one by one: {e}")
+            reply = {}
+        for gid, text in group.items():
+            value = reply.get(gid)
+            if isinstance(value, str) and value.strip():
+                done[gid] = value.strip(_QUOTES)
+            else:
+                # The model dropped or mangled this entry
+                try:
+                    done[gid] = self.translate(text, target_language)
+                except Exception as e:
+                    print(f"[TRANSLATE] Could not translate one entry, keeping the source text: {e}")
+                    done[gid] = text
+                continue
+            self.put(text, target_language, done[gid])
+        return done
+
+    def translate_batch(self, texts: list, target_language: str) -> dict:
+        """
+        Translations for `texts` in input order. Hits are served straight from
+        memory; distinct misses are packed into JSON prompts of
+        TRANSLATION_GROUP_SIZE strings, a few groups at a time.
+        """
+        unique = {}
+        for text in texts:
+            unique.setdefault(normalize_text(text), None)
+
+        misses = []
+        for text in unique:
+            if not text:
+                unique[text] = ""
+                continue
+            cached = self.get(text, target_language)
+            if cached is None:
+                misses.append(text)
+            else:
+                unique[text] = cached
+
+        groups = [
+            {str(i): text for i, text in enumerate(misses[start:start + TRANSLATION_GROUP_SIZE])}
+            for start in range(0, len(misses), TRANSLATION_GROUP_SIZE)
+        ]
+        for group, done in zip(groups, self._groups.map(lambda g: self._translate_group(g, target_language), groups)):
+            for gid, text in group.items():
+                unique[text] = done[gid]
+
+        return {
+            "translations": [unique[normalize_text(text)] for text in texts],
+            "hits": len(unique) - len(misses),
+            "misses": len(misses),
+            "llm_calls": len(groups),
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self.store),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+                "llm_calls": self.llm_calls,
+                "coalescing": self._inflight.stats(),
+            }
+
+
+_memory = None
+_memory_lock = threading.Lock()
+
+
+def get_translation_memory() -> TranslationMemory:
+    global _memory
+    if _memory is None:
+        with _memory_lock:
+            if _memory is None:
+                _memory = TranslationMemory()
+    return _memory
@@ -0,0 +1,232 @@
+"""
+Read-through cache of hackathon_data user profiles, keyed by email and by phone.
+
+A profile is stored as JSON under both "email:<email>" and "phone:<phone>".
+Lookups for unknown users are cached too (as "null", for
+USER_CACHE_NEGATIVE_TTL), so repeated messages from unregistered WhatsApp
+senders stop reaching Supabase. Concurrent misses for the same key share one
+query.
+
+With USER_CACHE_BACKEND=redis there are two tiers: a small per-process LRU
+in front of a Redis tier shared by all uvicorn workers. Writers call
+invalidate(), which deletes both tiers and publishes the keys on
+USER_CACHE_CHANNEL so every worker drops its local copy. Local copies also
+expire after USER_CACHE_LOCAL_TTL, which bounds staleness should a
+message be lost.
+"""
+import os
+import json
+import threading
+
+from cache_backends import REDIS_URL, MemoryBackend, RedisBackend
+from singleflight import SingleFlight
+
+USER_CACHE_BACKEND = os.getenv("USER_CACHE_BACKEND", "memory")  # memory | redis
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+USER_CACHE_NEGATIVE_TTL = float(os.getenv("USER_CACHE_NEGATIVE_TTL", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "50000"))
+USER_CACHE_LOCAL_TTL = float(os.getenv("USER_CACHE_LOCAL_TTL", "10"))
+USER_CACHE_CHANNEL = os.getenv("USER_CACHE_CHANNEL", "user-cache:invalidate")
+
+_MISSING = "null"
+FIELDS = ("email", "phone")
+
+
+def cache_key(field: str, value) -> str:
+    return f"{field}:{str(value).strip()}"
+
+
+class UserCache:
+    def __init__(self, shared=None, max_entries: int = USER_CACHE_MAX_ENTRIES, ttl: float = USER_CACHE_TTL,
+                 negative_ttl: float = USER_CACHE_NEGATIVE_TTL, local_ttl: float = USER_CACHE_LOCAL_TTL):
+        self.shared = shared
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # In front of a shared tier the local copy is only a short-lived hot set
+        self.local_ttl = min(local_ttl, ttl) if shared is not None else ttl
+        self.local = MemoryBackend(max_entries=max_entries, ttl=self.local_ttl)
+        self._flight = SingleFlight()
+        self._lock = threading.Lock()
+        self._generation = 0  # bumped by every invalidation; loads that straddle one aren't stored
+        self._listener = None
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.load_errors = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def _count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    # ---------- reads ----------
+
+    def _get(self, key: str):
+        """Raw cached value ("null" for a known miss) or None, local tier first."""
+        raw = self.local.get(key)
+        if raw is not None:
+            self._count("local_hits")
+            return raw
+        if self.shared is None:
+            return None
+        try:
+            raw = self.shared.get(key)
+        except Exception as e:
+            print(f"[USER CACHE] Shared read failed: {e}")
+            self._count("errors")
+            return None
+        if raw is not None:
+            self._count("shared_hits")
+            self.local.set(key, raw, ttl=min(self.local_ttl, self.negative_ttl) if raw == _MISSING else None)
+        return raw
+
+    def lookup(self, field: str, value, loader):
+        """
+        The profile whose `field` equals `value`, or None if there is none.
+        `loader()` queries the database on a miss. It returns the row or None
+        and raises on failure; failures are not cached.
+        """
+        key = cache_key(field, value)
+        raw = self._get(key)
+        if raw is not None:
+            if raw == _MISSING:
+                self._count("negative_hits")
+                return None
+            return json.loads(raw)
+        self._count("misses")
+        return self._flight.do(key, self._load, key, loader)
+
+    def _load(self, key: str, loader):
+        generation = self._generation
+        try:
+            row = loader()
+        except Exception:
+            self._count("load_errors")
+            raise
+        self._count("loads")
+        if generation == self._generation:
+            if row is None:
+                self._set(key, _MISSING, self.negative_ttl)
+            else:
+                self.store(row)
+        return row
+
+    # ---------- writes ----------
+
+    def _set(self, key: str, raw: str, ttl: float):
+        self.local.set(key, raw, ttl=min(ttl, self.local_ttl))
+        if self.shared is not None:
+            try:
+                self.shared.set(key, raw, ttl=ttl)
+            except Exception as e:
+                print(f"[USER CACHE] Shared write failed: {e}")
+                self._count("errors")
+
+    def store(self, row: dict):
+        """Caches a profile under each of its keys."""
+        raw = json.dumps(row, default=str)
+        for field in FIELDS:
+            if row.get(field):
+                self._set(cache_key(field, row[field]), raw, self.ttl)
+
+    def invalidate(self, email: str = None, phone: str = None):
+        """
+        Call after writing a user row. Drops the profile (and any cached "no
+        such user") under the given keys and, via the cached copy, under the
+        profile's other key.
+        """
+        keys = {cache_key(f, v) for f, v in (("email", email), ("phone", phone)) if v}
+        for key in list(keys):
+            raw = self.local.get(key)
+            if raw is None and self.shared is not None:
+                try:
+                    raw = self.shared.get(key)
+                except Exception:
+                    raw = None
+            if raw and raw != _MISSING:
+                row = json.loads(raw)
+                keys.update(cache_key(f, row[f]) for f in FIELDS if row.get(f))
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+        self._drop_local(keys)
+        if self.shared is not None:
+            try:
+                for key in keys:
+                    self.shared.delete(key)
+                self.shared._redis.publish(USER_CACHE_CHANNEL, json.dumps(sorted(keys)))
+            except Exception as e:
+                print(f"[USER CACHE] Shared invalidation failed, other workers catch up within {self.local_ttl:.0f}s: {e}")
+                self._count("errors")
+
+    def _drop_local(self, keys):
+        for key in keys:
+            self.local.delete(key)
+
+    # ---------- cross-worker invalidation ----------
+
+    def start_listener(self):
+        """Follows other workers' invalidations (shared tier only)."""
+        if self.shared is None or self._listener is not None:
+            return
+        self._listener = threading.Thread(target=self._listen, name="user-cache-invalidations", daemon=True)
+        self._listener.start()
+
+    def _listen(self):
+        import time
+
+        while True:
+            try:
+                pubsub = self.shared._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(USER_CACHE_CHANNEL)
+                for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        with self._lock:
+                            self._generation += 1
+                        self._drop_local(json.loads(message["data"]))
+            except Exception as e:
+                print(f"[USER CACHE] Invalidation listener error, resubscribing: {e}")
+                time.sleep(1)
+
+    def stats(self) -> dict:
+        hits = self.local_hits + self.shared_hits
+        lookups = hits + self.misses
+        return {
+            "backend": "redis" if self.shared is not None else "memory",
+            "local_entries": len(self.local),
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "load_errors": self.load_errors,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "coalescing": self._flight.stats(),
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_user_cache() -> UserCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                shared = None
+                if USER_CACHE_BACKEND == "redis":
+                    try:
+                        shared = RedisBackend(REDIS_URL, prefix="user:", ttl=USER_CACHE_TTL)
+                        shared._redis.ping()
+                    except Exception as e:
+                        print(f"[USER CACHE] Redis unavailable ({e}), caching per process only")
+                        shared = None
+                _cache = UserCache(shared)
+                _cache.start_listener()
+    return _cache
@@ -0,0 +1,286 @@
+"""
+Per-vendor, per-day sales aggregates and constant-time date range totals.
+
+vendor_daily_sales holds one row per (vendor, UTC day): revenue, units,
+order count and commission at the vendor's commission_rate. Checkout
+adds to it inside its own transaction (record_checkout), so the
+aggregates commit or roll back with the order; cancel_order() takes a
+cancelled order back out the same way. rebuild() recomputes any span of
+days from the orders that are not cancelled in one INSERT ... SELECT.
+
+Reads never touch order_items. For each vendor the closed days (up to
+VENDOR_SALES_OPEN_DAYS ago) are loaded once into prefix-sum arrays, so
+any range over them is two subtractions. The still-open days, which
+checkouts may still write to, are read live from their few rows by
+primary key.
+"""
+import os
+import sys
+import time
+import argparse
+import datetime
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import delete, func, insert, select, text, update
+
+from models import Order, OrderItem, OrderStatus, Product, Vendor, VendorDailySales
+
+VENDOR_SALES_CACHE_VENDORS = int(os.getenv("VENDOR_SALES_CACHE_VENDORS", "10000"))
+# Other workers' rebuilds become visible after this long
+VENDOR_SALES_CACHE_TTL = float(os.getenv("VENDOR_SALES_CACHE_TTL", "600"))
+# Today and yesterday stay live: a checkout that began before midnight can commit after it
+VENDOR_SALES_OPEN_DAYS = 2
+DEFAULT_COMMISSION_RATE = 10.0
+
+METRICS = ("revenue", "units", "orders", "commission")
+
+
+def _today() -> datetime.date:
+    return datetime.datetime.utcnow().date()
+
+
+def _upsert(db, rows: list):
+    """Adds each row's metrics to the stored (vendor_id, day) row, creating it if missing."""
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        stmt = dialect_insert(VendorDailySales)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["vendor_id", "day"],
+            set_={m: getattr(VendorDailySales, m) + getattr(stmt.excluded, m) for m in METRICS},
+        )
+        db.execute(stmt, rows)
+        return
+    for row in rows:
+        updated = db.execute(
+            update(VendorDailySales)
+            .where(VendorDailySales.vendor_id == row["vendor_id"], VendorDailySales.day == row["day"])
+            .values({m: getattr(VendorDailySales, m) + row[m] for m in METRICS})
+        )
+        if updated.rowcount == 0:
+            db.execute(insert(VendorDailySales), [row])
+
+
+def record_checkout(db, day: datetime.date, vendor_totals: dict):
+    """
+    Adds one order to its vendors' rows for `day`, in the caller's transaction.
+    `vendor_totals` maps vendor id -> (revenue, units).
+    """
+    if not vendor_totals:
+        return
+    rates = dict(db.execute(select(Vendor.id, Vendor.commission_rate).where(Vendor.id.in_(vendor_totals))).all())
+    rows = []
+    # Vendor id order, so concurrent checkouts lock shared rows in the same order
+    for vendor_id in sorted(vendor_totals):
+        revenue, units = vendor_totals[vendor_id]
+        rate = rates.get(vendor_id)
+        rows.append({
+            "vendor_id": vendor_id, "day": day, "revenue": revenue, "units": units, "orders": 1,
+            "commission": revenue * (DEFAULT_COMMISSION_RATE if rate is None else rate) / 100,
+        })
+    _upsert(db, rows)
+
+
+def cancel_order(db, order_id: int) -> bool:
+    """
+    Marks an order cancelled and subtracts it from its vendors' rows for the
+    day it was placed, in the caller's transaction. Use this for every
+    cancellation, since rebuild() leaves cancelled orders out. Returns False
+    if the order does not exist or was already cancelled.
+    """
+    cancelled = db.execute(
+        update(Order)
+        .where(Order.id == order_id, Order.status != OrderStatus.cancelled)
+        .values(status=OrderStatus.cancelled)
+    )
+    if cancelled.rowcount == 0:
+        return False
+    created_at = db.execute(select(Order.created_at).where(Order.id == order_id)).scalar_one()
+    totals = db.execute(
+        select(Product.vendor_id, func.sum(OrderItem.quantity * OrderItem.unit_price), func.sum(OrderItem.quantity))
+        .select_from(OrderItem)
+        .join(Product, OrderItem.product_id == Product.id)
+        .where(OrderItem.order_id == order_id)
+        .group_by(Product.vendor_id)
+    ).all()
+    if not totals:
+        return True
+    rates = dict(db.execute(select(Vendor.id, Vendor.commission_rate).where(Vendor.id.in_([t[0] for t in totals]))).all())
+    rows = []
+    for vendor_id, revenue, units in sorted(totals):
+        rate = rates.get(vendor_id)
+        rows.append({
+            "vendor_id": vendor_id, "day": created_at.date(), "revenue": -revenue, "units": -units, "orders": -1,
+            "commission": -revenue * (DEFAULT_COMMISSION_RATE if rate is None else rate) / 100,
+        })
+    _upsert(db, rows)
+    return True
+
+
+def rebuild(db, since: datetime.date = None, until: datetime.date = None) -> int:
+    """
+    Recomputes vendor_daily_sales for days in [since, until] (all history by
+    default) from orders, order_items and products, in one statement. Commission
+    uses each vendor's current rate. Cancelled orders are left out. The caller
+    commits; running processes pick the new rows up within VENDOR_SALES_CACHE_TTL.
+    Returns the number of rows written.
+    """
+    day = func.date(Order.created_at)
+    revenue = func.sum(OrderItem.quantity * OrderItem.unit_price)
+    rate = func.coalesce(Vendor.commission_rate, DEFAULT_COMMISSION_RATE)
+    query = (
+        select(
+            Product.vendor_id, day, revenue, func.sum(OrderItem.quantity),
+            func.count(func.distinct(Order.id)), func.sum(OrderItem.quantity * OrderItem.unit_price * rate / 100),
+        )
+        .select_from(OrderItem)
+        .join(Order, OrderItem.order_id == Order.id)
+        .join(Product, OrderItem.product_id == Product.id)
+        .join(Vendor, Product.vendor_id == Vendor.id, isouter=True)
+        .where(Order.status != OrderStatus.cancelled)
+        .group_by(Product.vendor_id, day)
+    )
+    clear = delete(VendorDailySales)
+    if since is not None:
+        query = query.where(Order.created_at >= datetime.datetime.combine(since, datetime.time.min))
+        clear = clear.where(VendorDailySales.day >= since)
+    if until is not None:
+        query = query.where(Order.created_at < datetime.datetime.combine(until + datetime.timedelta(days=1), datetime.time.min))
+        clear = clear.where(VendorDailySales.day <= until)
+
+    if db.get_bind().dialect.name == "postgresql":
+        # Checkouts wait at their upsert until the rebuilt rows commit, then add on top of them
+        db.execute(text("LOCK TABLE vendor_daily_sales IN EXCLUSIVE MODE"))
+    db.execute(clear)
+    result = db.execute(
+        insert(VendorDailySales).from_select(["vendor_id", "day", *METRICS], query)
+    )
+    return result.rowcount
+
+
+class _Series:
+    """Prefix sums over one vendor's closed days: sums[m][i] = total of days first..first+i-1."""
+
+    __slots__ = ("first", "through", "sums", "loaded_at")
+
+    def __init__(self, first: int, through: int, daily: dict, loaded_at: float):
+        self.first = first
+        self.through = through
+        self.loaded_at = loaded_at
+        self.sums = {}
+        for m in METRICS:
+            running, sums = 0, [0]
+            for ordinal in range(first, through + 1):
+                running += daily.get(ordinal, {}).get(m, 0)
+                sums.append(running)
+            self.sums[m] = sums
+
+    def total(self, start: int, end: int) -> dict:
+        start, end = max(start, self.first), min(end, self.through)
+        if start > end:
+            return {m: 0 for m in METRICS}
+        lo, hi = start - self.first, end - self.first + 1
+        return {m: self.sums[m][hi] - self.sums[m][lo] for m in METRICS}
+
+
+class VendorSales:
+    """Answers vendor date range totals from cached prefix sums plus the open days' rows."""
+
+    def __init__(self, max_vendors: int = VENDOR_SALES_CACHE_VENDORS, ttl: float = VENDOR_SALES_CACHE_TTL):
+        self.max_vendors = max_vendors
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._series = OrderedDict()  # vendor id -> _Series, LRU
+        self.loads = 0
+        self.hits = 0
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def _load(self, db, vendor_id: int, through: datetime.date) -> _Series:
+        rows = db.execute(
+            select(VendorDailySales.day, *(getattr(VendorDailySales, m) for m in METRICS))
+            .where(VendorDailySales.vendor_id == vendor_id, VendorDailySales.day <= through)
+            .order_by(VendorDailySales.day)
+        ).all()
+        daily = {row[0].toordinal(): dict(zip(METRICS, row[1:])) for row in rows}
+        first = min(daily) if daily else through.toordinal() + 1
+        self.loads += 1
+        return _Series(first, through.toordinal(), daily, time.time())
+
+    def _closed(self, db, vendor_id: int, through: datetime.date) -> _Series:
+        with self._lock:
+            series = self._series.get(vendor_id)
+            if series is not None and series.through == through.toordinal() and time.time() - series.loaded_at < self.ttl:
+                self._series.move_to_end(vendor_id)
+                self.hits += 1
+                return series
+        series = self._load(db, vendor_id, through)
+        with self._lock:
+            self._series[vendor_id] = series
+            self._series.move_to_end(vendor_id)
+            while len(self._series) > self.max_vendors:
+                self._series.popitem(last=False)
+        return series
+
+    def totals(self, db, vendor_id: int, start: datetime.date, end: datetime.date) -> dict:
+        """Revenue, units, orders, commission and net for [start, end] (UTC days, inclusive)."""
+        open_from = _today() - datetime.timedelta(days=VENDOR_SALES_OPEN_DAYS - 1)
+        result = self._closed(db, vendor_id, open_from - datetime.timedelta(days=1)).total(start.toordinal(), end.toordinal())
+        if end >= open_from:
+            live = db.execute(
+                select(*(func.coalesce(func.sum(getattr(VendorDailySales, m)), 0) for m in METRICS))
+                .where(VendorDailySales.vendor_id == vendor_id,
+                       VendorDailySales.day >= max(start, open_from), VendorDailySales.day <= end)
+            ).one()
+            for m, value in zip(METRICS, live):
+                result[m] += value
+        result["revenue"] = round(result["revenue"], 2)
+        result["commission"] = round(result["commission"], 2)
+        result["net_revenue"] = round(result["revenue"] - result["commission"], 2)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"cached_vendors": len(self._series), "loads": self.loads, "hits": self.hits}
+
+
+_sales = None
+_sales_lock = threading.Lock()
+
+
+def get_vendor_sales() -> VendorSales:
+    global _sales
+    if _sales is None:
+        with _sales_lock:
+            if _sales is None:
+                _sales = VendorSales()
+    return _sales
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vendor sales aggregates")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--since", type=datetime.date.fromisoformat, help="first day to rebuild (default: all history)")
+    parser.add_argument("--until", type=datetime.date.fromisoformat, help="last day to rebuild (default: today)")
+    args = parser.parse_args()
+    if args.since and args.until and args.since > args.until:
+        sys.exit("--since is after --until")
+
+    from config_db import SessionLocal, init_db
+
+    init_db()
+    started = time.perf_counter()
+    with SessionLocal() as db:
+        rows = rebuild(db, args.since, args.until)
+        db.commit()
+    print(f"[VENDOR_SALES] Rebuilt {rows} vendor-day rows in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()